@@ -0,0 +1,130 @@
+"""
+Throughput benchmark of Discovery.py and ApplyDefaults.py against simulated devices
+Starts a SimFleet of --nodes simulated devices on loopback addresses, writes a matching
+DeviceList.csv to a scratch directory and runs the real main() of the chosen script there.
+Devices per minute and the done/failed counts are read back from the run's journal.
+
+Usage: python run_benchmark.py discovery|onboarding [--nodes 200] [--latency 0.02] [--jitter 0.01]
+                               [--config-kb 16] [--failure-rate 0] [--telnet-only 0.1] [--workers 20]
+                               [--cluster-size 3] [--pipeline] [--keep]
+
+Needs Linux (every 127.x.y.z address is local) and the packages the scripts themselves need.
+"""
+
+import os, sys, csv, glob, time, random, shutil, argparse, tempfile, contextlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+sys.path.insert(0, ROOT)
+from sim_devices import SimSettings, SimFleet, NetworkNode, UCCluster, UCNode, loopback_addresses
+from Common.journal import load_journal
+
+SSH_PORT = 2222
+TELNET_PORT = 2323
+UC_DEVICE_TYPES = ('CUCM', 'CUC', 'IMP', 'CER')
+
+
+def build_fleet(args):
+    # Return (fleet, DeviceList.csv rows) for the benchmark
+    settings = SimSettings(args.latency, args.jitter, args.config_kb, args.failure_rate)
+    fleet = SimFleet(settings, ssh_port=SSH_PORT, telnet_port=TELNET_PORT)
+    rows = []
+    cluster = None
+    for index, ip in enumerate(loopback_addresses(args.nodes), 1):
+        if args.script == 'discovery' or args.uc_fraction <= random.random():
+            node = NetworkNode(ip, index, settings)
+            telnet_only = random.random() < args.telnet_only
+            fleet.add(node, ssh=not telnet_only, telnet=True)
+            rows.append([ip, node.username, node.password, node.secret, 'NETWORK', '', ''])
+        else:
+            if cluster is None or len(cluster.nodes) >= args.cluster_size:
+                devicetype = UC_DEVICE_TYPES[index % len(UC_DEVICE_TYPES)]
+                cluster = UCCluster(f'cluster{index}', version=random.choice(('12.5.1.12900-115', '14.0.1.10000-20')))
+            node = UCNode(ip, index, cluster, devicetype)
+            fleet.add(node)
+            rows.append([ip, node.username, node.password, '', devicetype, cluster.name,
+                         'publisher' if node.publisher else 'subscriber'])
+    return fleet, rows
+
+
+def run_script(args, workdir):
+    # Import the script under test from workdir and run its main(). Returns the run time in seconds.
+    if args.script == 'discovery':
+        sys.path.insert(0, os.path.join(ROOT, 'Discovery'))
+        import Discovery as script
+        script.PORTS = {'cisco_ios': SSH_PORT, 'cisco_ios_telnet': TELNET_PORT}
+        argv = ['--non-interactive', '--initials', 'SIM', '--workers', str(args.workers), '--no-state']
+        if args.pipeline:
+            argv.append('--pipeline')
+    else:
+        sys.path.insert(0, os.path.join(ROOT, 'Onboarding'))
+        import ApplyDefaults as script
+        script.NETWORK_PORTS = {'cisco_ios': SSH_PORT, 'cisco_ios_telnet': TELNET_PORT}
+        script.UC_SSH_PORT = SSH_PORT
+        argv = ['--non-interactive', '--logging-server', '192.0.2.10', '--snmp-string', 'simRO',
+                '--paws-account', 'simpaws', '--paws-password', 'simpaws', '--axl-username', 'simaxl',
+                '--acg-name', 'simacg', '--workers', str(args.workers)]
+    start = time.perf_counter()
+    with open(os.path.join(workdir, 'script_output.txt'), 'w') as output, contextlib.redirect_stdout(output):
+        try:
+            script.main(argv)
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure Discovery or ApplyDefaults throughput against simulated devices.')
+    parser.add_argument('script', choices=('discovery', 'onboarding'))
+    parser.add_argument('--nodes', type=int, default=200, help='number of simulated devices (default 200)')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every response (default 0.02)')
+    parser.add_argument('--jitter', type=float, default=0.01, help='+/- seconds of random latency (default 0.01)')
+    parser.add_argument('--config-kb', type=int, default=16, help='size of each running-config in KB (default 16)')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='fraction of connections dropped right after accept (default 0)')
+    parser.add_argument('--telnet-only', type=float, default=0.1,
+                        help='fraction of network devices without SSH (default 0.1)')
+    parser.add_argument('--uc-fraction', type=float, default=0.5,
+                        help='fraction of UC nodes in an onboarding run (default 0.5)')
+    parser.add_argument('--cluster-size', type=int, default=3, help='nodes per simulated UC cluster (default 3)')
+    parser.add_argument('--workers', type=int, default=20, help='--workers of the script (default 20)')
+    parser.add_argument('--pipeline', action='store_true', help='run Discovery with --pipeline')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the fleet layout (default 1)')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory with the run output')
+    args = parser.parse_args()
+    if not sys.platform.startswith('linux'):
+        parser.error('the simulated fleet binds 127.x.y.z addresses, which needs Linux')
+
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix=f'bench_{args.script}_')
+    fleet, rows = build_fleet(args)
+    with open(os.path.join(workdir, 'DeviceList.csv'), 'w', newline='') as device_list:
+        writer = csv.writer(device_list)
+        writer.writerow(['ip', 'username', 'password', 'enablesecret', 'devicetype', 'cluster', 'role'])
+        writer.writerows(rows)
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with fleet:
+            elapsed = run_script(args, workdir)
+    finally:
+        os.chdir(cwd)
+
+    prefix = 'Discovery_Journal' if args.script == 'discovery' else 'ApplyDefaults_Journal'
+    _, devices = load_journal(max(glob.glob(os.path.join(workdir, f'{prefix}_*.jsonl')), key=os.path.getmtime))
+    done = sum(1 for entry in devices.values() if entry['state'] == 'done')
+    failed = len(devices) - done
+    print(f'{args.script}: {len(rows)} simulated devices, latency {args.latency}s +/- {args.jitter}s, '
+          f'{args.config_kb} KB configs, failure rate {args.failure_rate}')
+    print(f'Done {done}, failed {failed} in {elapsed:.1f}s - {len(rows) / elapsed * 60:.1f} devices/minute')
+    if args.keep:
+        print(f'Run output kept in {workdir}')
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,562 @@
+"""
+Simulated devices for benchmarking Discovery.py and ApplyDefaults.py without production gear
+Each simulated node listens on its own loopback address (127.x.y.z, Linux) with an SSH server
+(paramiko) and/or a telnet server. Two CLIs are emulated:
+  IOSSession - Cisco IOS: enable, show version, show running-config (with | include and | section),
+               show inventory, configure terminal and write memory
+  UCSession  - Cisco UC 'admin:' CLI: show network cluster, show status, run sql against an
+               in-memory SQLite database shared by the cluster, utils snmp config 1/2c community-string
+               add/list, set account name, set password change-at-login and show account
+Every response is delayed by latency +/- jitter seconds, the running-config is padded to
+config_kb kilobytes and failure_rate of the connections are dropped right after accept.
+An SSH connection serves any number of shell and exec channels, like a real node.
+"""
+
+import os, re, queue, random, socket, selectors, sqlite3, threading, time
+from collections import namedtuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SHOW_VERSION = os.path.join(os.path.dirname(HERE), 'Discovery', 'benchmarks', 'corpus', 'show_version',
+                            'ios_c2960.txt')
+
+# latency and jitter in seconds per response, config_kb of running-config, failure_rate of dropped connections
+SimSettings = namedtuple('SimSettings', ['latency', 'jitter', 'config_kb', 'failure_rate'])
+
+# tables of the UC database used by ApplyDefaults.py. systables has the single row Informix keeps at tabid 1.
+CLUSTER_SCHEMA = '''
+    CREATE TABLE systables (tabid INTEGER);
+    INSERT INTO systables VALUES (1);
+    CREATE TABLE applicationuser (pkid TEXT DEFAULT (lower(hex(randomblob(16)))), name TEXT UNIQUE);
+    CREATE TABLE dirgroup (pkid TEXT DEFAULT (lower(hex(randomblob(16)))), name TEXT UNIQUE);
+    CREATE TABLE functionrole (pkid TEXT DEFAULT (lower(hex(randomblob(16)))), name TEXT UNIQUE);
+    CREATE TABLE functionroledirgroupmap (pkid TEXT DEFAULT (lower(hex(randomblob(16)))), fkfunctionrole TEXT,
+                                          fkdirgroup TEXT);
+    CREATE TABLE applicationuserdirgroupmap (pkid TEXT DEFAULT (lower(hex(randomblob(16)))), fkapplicationuser TEXT,
+                                             fkdirgroup TEXT);
+    CREATE TABLE processconfig (pkid TEXT DEFAULT (lower(hex(randomblob(16)))), paramname TEXT, paramvalue TEXT);
+'''
+
+INVALID_INPUT = "% Invalid input detected at '^' marker.\r\n"
+
+
+def _crlf(text):
+    return text.replace('\r\n', '\n').replace('\n', '\r\n')
+
+
+class NetworkNode:
+    # State of one simulated IOS device
+    def __init__(self, ip, index, settings, username='admin', password='simpass', secret='secret',
+                 enable_required=True):
+        self.ip = ip
+        self.hostname = f'SIM-SW-{index:05d}'
+        self.serial = f'SIM{index:08d}'
+        self.username = username
+        self.password = password
+        self.secret = secret
+        self.enable_required = enable_required
+        self.lock = threading.RLock()
+        self.config = [
+            'Building configuration...', '', 'Current configuration : 0 bytes', '!',
+            '! Last configuration change at 10:15:12 UTC Mon Mar 1 2021 by admin', '!',
+            'version 15.0', f'hostname {self.hostname}', '!', 'logging buffered 16384', '!',
+        ]
+        port = 0
+        while sum(len(line) + 1 for line in self.config) < settings.config_kb * 1024:
+            port += 1
+            self.config += [f'interface FastEthernet0/{port}', f' description simulated access port {port}',
+                            ' switchport mode access', ' switchport access vlan 10', ' spanning-tree portfast', '!']
+        self.config += ['line vty 0 4', ' login local', '!', 'end']
+
+    def show_version(self):
+        with open(SHOW_VERSION) as template:
+            text = template.read()
+        return text.replace('ACCESS-SW-01', self.hostname).replace('FOC1234X0AB', self.serial)
+
+
+class UCCluster:
+    # Database and membership shared by the nodes of one simulated UC cluster
+    def __init__(self, name, version='12.5.1.12900-115'):
+        self.name = name
+        self.version = version
+        self.nodes = []
+        self.lock = threading.Lock()
+        # the cluster database, shared by every session of the cluster under lock
+        self.database = sqlite3.connect(':memory:', check_same_thread=False)
+        self.database.executescript(CLUSTER_SCHEMA)
+        self.database.executemany('INSERT INTO functionrole (name) VALUES (?)',
+                                  [(name,) for name in ('Standard SERVICEABILITY Read Only', 'Standard AXL API Access',
+                                                        'Standard CCM Admin Users', 'Standard CCM Read Only')])
+        self.database.execute("INSERT INTO processconfig (paramname, paramvalue) VALUES ('RemoteSyslogServerName5', '')")
+        self.database.commit()
+
+
+class UCNode:
+    # State of one simulated UC node (CUCM, CUC, IMP or CER)
+    def __init__(self, ip, index, cluster, devicetype, username='administrator', password='simpass'):
+        self.ip = ip
+        self.hostname = f'sim-{devicetype.lower()}-{index:05d}'
+        self.devicetype = devicetype
+        self.cluster = cluster
+        self.username = username
+        self.password = password
+        self.publisher = not cluster.nodes
+        self.accounts = ['administrator']
+        self.communities = {}
+        cluster.nodes.append(self)
+
+
+class IOSSession:
+    # Cisco IOS CLI for one connection
+    def __init__(self, node):
+        self.node = node
+        self.enabled = not node.enable_required
+        self.mode = ''
+        self.waiting_for = None
+        self.echo = True
+
+    def prompt(self):
+        return f'{self.node.hostname}{self.mode}' + ('#' if self.enabled else '>')
+
+    def greeting(self):
+        return '\r\n' + self.prompt()
+
+    def handle(self, line):
+        # Return the response to line including the next prompt, or None to close the connection
+        if self.waiting_for == 'enable':
+            self.waiting_for = None
+            self.echo = True
+            if line == self.node.secret:
+                self.enabled = True
+                return self.prompt()
+            return '% Access denied\r\n\r\n' + self.prompt()
+        command = line.strip()
+        if self.mode:
+            return self._config_line(command)
+        if command == '':
+            return '\r\n' + self.prompt()
+        if command in ('exit', 'logout', 'quit'):
+            return None
+        if command == 'enable':
+            if self.enabled:
+                return self.prompt()
+            self.waiting_for = 'enable'
+            self.echo = False
+            return 'Password: '
+        if command.startswith('terminal '):
+            return self.prompt()
+        if not self.enabled and (command.startswith('conf') or 'run' in command or command.startswith('write')):
+            return INVALID_INPUT + self.prompt()
+        if command in ('configure terminal', 'conf t'):
+            self.mode = '(config)'
+            return 'Enter configuration commands, one per line.  End with CNTL/Z.\r\n' + self.prompt()
+        if command in ('write memory', 'write mem', 'copy running-config startup-config'):
+            return 'Building configuration...\r\n[OK]\r\n' + self.prompt()
+        if command == 'show version':
+            return _crlf(self.node.show_version()) + self.prompt()
+        if command == 'show inventory':
+            return (f'NAME: "1", DESCR: "WS-C2960-24TT-L"\r\n'
+                    f'PID: WS-C2960-24TT-L  , VID: V02  , SN: {self.node.serial}\r\n\r\n' + self.prompt())
+        match = re.match(r'^show run(?:ning-config)?(?:\s*\|\s*(include|section)\s+(.+))?$', command)
+        if match:
+            return self._show_run(match[1], match[2]) + self.prompt()
+        return INVALID_INPUT + self.prompt()
+
+    def _show_run(self, filter_type, pattern):
+        with self.node.lock:
+            config = list(self.node.config)
+        if filter_type is None:
+            lines = config
+        elif filter_type == 'include':
+            expression = re.compile(pattern)
+            lines = [line for line in config if expression.search(line)]
+        else:
+            expression = re.compile(pattern)
+            lines = []
+            in_section = False
+            for line in config:
+                if not line.startswith(' '):
+                    in_section = bool(expression.search(line))
+                if in_section:
+                    lines.append(line)
+        return '\r\n'.join(lines) + ('\r\n' if lines else '')
+
+    def _config_line(self, command):
+        if command in ('end', '\x1a'):
+            self.mode = ''
+            return self.prompt()
+        if command == 'exit':
+            self.mode = '(config)' if self.mode != '(config)' else ''
+            return self.prompt()
+        if command == '':
+            return self.prompt()
+        with self.node.lock:
+            config = self.node.config
+            if command.startswith('ip access-list standard '):
+                self.mode = '(config-std-nacl)'
+                self._acl = command
+                if command not in config:
+                    config.insert(len(config) - 1, command)
+            elif self.mode == '(config-std-nacl)':
+                if command.startswith(('permit', 'deny', 'remark')):
+                    entry = ' ' + command
+                    position = config.index(self._acl) + 1
+                    if entry not in config[position:position + 50]:
+                        config.insert(position, entry)
+                else:
+                    # any other global command leaves the ACL sub-mode
+                    self.mode = '(config)'
+                    return self._config_line(command)
+            elif command.startswith('no '):
+                if command[3:] in config:
+                    config.remove(command[3:])
+            elif command not in config:
+                config.insert(len(config) - 1, command)
+        return self.prompt()
+
+
+class UCSession:
+    # Cisco UC 'admin:' CLI for one connection
+    def __init__(self, node):
+        self.node = node
+        self.dialog = None
+        self.answers = []
+        self.echo = True
+
+    def prompt(self):
+        return 'admin:'
+
+    def greeting(self):
+        return ('Command Line Interface is starting up, please wait ...\r\n\r\n'
+                '   Welcome to the Platform Command Line Interface\r\n\r\n' + 'admin:')
+
+    def handle(self, line):
+        # Return the response to line including the next prompt, or None to close the connection
+        if self.dialog is not None:
+            return self._dialog_step(line.strip())
+        command = line.strip()
+        if command == '':
+            return 'admin:'
+        if command in ('exit', 'quit'):
+            return None
+        if command == 'show network cluster':
+            return self._show_network_cluster() + 'admin:'
+        if command == 'show status':
+            return (f'\r\nHost Name        : {self.node.hostname}\r\n'
+                    f'Product Ver      : {self.node.cluster.version}\r\n'
+                    f'Unified OS Version : 7.0.0.0-4\r\n\r\nadmin:')
+        if command.startswith('run sql '):
+            return _crlf(self._run_sql(command[len('run sql '):])) + 'admin:'
+        if command == 'utils snmp config 1/2c community-string add':
+            return self._start_dialog('snmp', [
+                'Enter the community string:: ',
+                'Enter the access privileges :: ',
+                'Please enter the IP address to be allowed access :: ',
+                'The SNMP Master Agent will be restarted. Do you want to continue (yes/no)? ',
+            ])
+        if command == 'utils snmp config 1/2c community-string list':
+            lines = [f'Community Name: {name}\r\nAccess Privileges: {access}\r\nHost IP: {host}\r\n'
+                     for name, (access, host) in self.node.communities.items()]
+            return '\r\n'.join(lines) + '\r\nadmin:'
+        match = re.match(r'^set account name (\S+)$', command)
+        if match:
+            prompts = ['Please enter the privilege level :']
+            if self.node.cluster.version.startswith('12.5'):
+                prompts += ['Allow this User to login to SftpServer? (Yes / No) :',
+                            'Please enter the user role/description :']
+            prompts += ['Please enter the password :', 're-enter to confirm :']
+            self._account = match[1]
+            return self._start_dialog('account', prompts)
+        match = re.match(r'^set password change-at-login disable (\S+)$', command)
+        if match:
+            return 'Successfully updated\r\nadmin:'
+        if command == 'show account':
+            return ''.join(f'Name = {name}, Privilege = {4 if name == "administrator" else 0}\r\n'
+                           for name in self.node.accounts) + 'admin:'
+        return 'Executed command unsuccessfully\r\nNo valid command entered\r\nadmin:'
+
+    def _start_dialog(self, name, prompts):
+        self.dialog = (name, prompts)
+        self.answers = []
+        self.echo = 'password' not in prompts[0]
+        return prompts[0]
+
+    def _dialog_step(self, answer):
+        name, prompts = self.dialog
+        self.answers.append(answer)
+        if len(self.answers) < len(prompts):
+            next_prompt = prompts[len(self.answers)]
+            self.echo = 'password' not in next_prompt and 'confirm' not in next_prompt
+            return '\r\n' + next_prompt
+        self.dialog = None
+        self.echo = True
+        if name == 'snmp':
+            community, access, host, confirm = self.answers
+            if confirm.lower().startswith('y'):
+                self.node.communities[community] = (access, host)
+                return '\r\nSuccessfully added community string\r\nadmin:'
+            return '\r\nCommand aborted\r\nadmin:'
+        if self.answers[-1] != self.answers[-2]:
+            return '\r\nPasswords do not match\r\nadmin:'
+        if self._account not in self.node.accounts:
+            self.node.accounts.append(self._account)
+        return '\r\nAccount successfully created\r\nadmin:'
+
+    def _show_network_cluster(self):
+        lines = []
+        for node in self.node.cluster.nodes:
+            role = 'Publisher' if node.publisher else 'Subscriber'
+            database = 'DBPub' if node.publisher else 'DBSub'
+            lines.append(f'{node.ip} {node.hostname}.sim.local {node.hostname} {role} callmanager {database} '
+                         f'authenticated')
+        lines += ['', 'Server Table (processnode) Entries', '----------------------------------']
+        lines += [f'{node.hostname}.sim.local' for node in self.node.cluster.nodes]
+        lines += ['', 'Successful', '']
+        return '\r\n'.join(lines)
+
+    def _run_sql(self, statement):
+        cluster = self.node.cluster
+        with cluster.lock:
+            try:
+                return run_sql(cluster.database, statement)
+            except sqlite3.Error as e:
+                return f'Executed command unsuccessfully\nSQL command failed: {e}\n'
+
+
+def _format_rows(columns, rows):
+    widths = [max([len(column)] + [len(str(row[index])) for row in rows]) for index, column in enumerate(columns)]
+    lines = [' '.join(column.ljust(width) for column, width in zip(columns, widths)).rstrip(),
+             ' '.join('=' * width for width in widths)]
+    for row in rows:
+        lines.append(' '.join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip())
+    return '\n'.join(lines) + '\n'
+
+
+def run_sql(database, statement):
+    # Execute statement against the cluster database and format the result like the UC CLI
+    cursor = database.execute(statement.strip().rstrip(';'))
+    if cursor.description is None:
+        database.commit()
+        return f'Rows: {cursor.rowcount}\n'
+    return _format_rows([column[0] for column in cursor.description], cursor.fetchall())
+
+
+class _LineChannel:
+    # Line-oriented reading and writing over a socket or a paramiko channel
+    def __init__(self, connection, settings):
+        self.connection = connection
+        self.settings = settings
+        self.buffer = b''
+        self.after_cr = False
+
+    def send(self, text):
+        self.connection.sendall(text.encode())
+
+    def delay(self):
+        if self.settings.latency or self.settings.jitter:
+            time.sleep(max(0.0, self.settings.latency + random.uniform(-self.settings.jitter, self.settings.jitter)))
+
+    def readline(self):
+        # Return the next line without its terminator, or None at end of stream.
+        # Lines end at CR LF, CR NUL, LF or CR; the LF or NUL after a CR may come in a later read.
+        while True:
+            if self.after_cr and self.buffer:
+                if self.buffer[:1] in (b'\n', b'\x00'):
+                    self.buffer = self.buffer[1:]
+                self.after_cr = False
+            match = re.search(rb'\r\n|\r\x00|\n|\r', self.buffer)
+            if match:
+                line = self.buffer[:match.start()]
+                self.buffer = self.buffer[match.end():]
+                self.after_cr = match.group() == b'\r'
+                # telnet option negotiation is ignored
+                line = re.sub(rb'\xff[\xfb-\xfe].|\xff\xfa.*?\xff\xf0', b'', line, flags=re.DOTALL)
+                return line.decode(errors='replace')
+            data = self.connection.recv(4096)
+            if not data:
+                return None
+            self.buffer += data
+
+
+def run_command(session, command):
+    # Output of a single command as an exec channel returns it: the response without the next prompt
+    response = _crlf(session.handle(command) or '')
+    prompt = session.prompt()
+    return response[:-len(prompt)] if response.endswith(prompt) else response
+
+
+def run_session(channel, session, login=None):
+    # Drive one CLI session. login=(username, password) adds a telnet style login first.
+    if login is not None:
+        channel.send('\r\nUser Access Verification\r\n\r\n')
+        while True:
+            channel.send('Username: ')
+            username = channel.readline()
+            channel.send((username or '') + '\r\nPassword: ')
+            password = channel.readline()
+            if username is None or password is None:
+                return
+            channel.send('\r\n')
+            if (username, password) == login:
+                break
+            channel.send('% Authentication failed\r\n\r\n')
+    channel.send(session.greeting())
+    while True:
+        line = channel.readline()
+        if line is None:
+            return
+        channel.delay()
+        echo = line + '\r\n' if session.echo else '\r\n'
+        response = session.handle(line)
+        if response is None:
+            channel.send(echo)
+            return
+        channel.send(echo + response)
+
+
+class SimFleet:
+    # Listeners for a set of simulated nodes. Use start() and stop(), or as a context manager.
+    def __init__(self, settings, ssh_port=2222, telnet_port=2323):
+        self.settings = settings
+        self.ssh_port = ssh_port
+        self.telnet_port = telnet_port
+        self.nodes = []
+        self._listeners = {}
+        self._selector = selectors.DefaultSelector()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        # SSH logins served, so a benchmark can tell how many handshakes a run needed
+        self.handshakes = 0
+        self._thread = None
+        self._host_key = None
+
+    def add(self, node, ssh=True, telnet=False):
+        # Listen for node on its loopback address over SSH and/or telnet
+        self.nodes.append(node)
+        for enabled, port, kind in ((ssh, self.ssh_port, 'ssh'), (telnet, self.telnet_port, 'telnet')):
+            if not enabled:
+                continue
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((node.ip, port))
+            listener.listen(64)
+            listener.setblocking(False)
+            self._listeners[listener] = (node, kind)
+            self._selector.register(listener, selectors.EVENT_READ)
+
+    def start(self):
+        if any(kind == 'ssh' for _, kind in self._listeners.values()):
+            import paramiko
+            self._host_key = paramiko.RSAKey.generate(2048)
+        self._thread = threading.Thread(target=self._accept_loop, name='sim-accept', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        for listener in self._listeners:
+            listener.close()
+        self._selector.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _accept_loop(self):
+        while not self._stopping.is_set():
+            for key, _ in self._selector.select(0.2):
+                try:
+                    connection, _ = key.fileobj.accept()
+                except OSError:
+                    continue
+                node, kind = self._listeners[key.fileobj]
+                if random.random() < self.settings.failure_rate:
+                    connection.close()
+                    continue
+                connection.setblocking(True)
+                target = self._serve_ssh if kind == 'ssh' else self._serve_telnet
+                threading.Thread(target=target, args=(connection, node), daemon=True).start()
+
+    def _session(self, node):
+        return UCSession(node) if isinstance(node, UCNode) else IOSSession(node)
+
+    def _serve_telnet(self, connection, node):
+        try:
+            run_session(_LineChannel(connection, self.settings), self._session(node), (node.username, node.password))
+        except OSError:
+            pass
+        finally:
+            connection.close()
+
+    def _serve_ssh(self, connection, node):
+        import paramiko
+
+        class Server(paramiko.ServerInterface):
+            def __init__(self):
+                # (channel, None) for a shell, (channel, command) for an exec request
+                self.requests = queue.Queue()
+
+            def check_auth_password(self, username, password):
+                if (username, password) == (node.username, node.password):
+                    return paramiko.AUTH_SUCCESSFUL
+                return paramiko.AUTH_FAILED
+
+            def get_allowed_auths(self, username):
+                return 'password'
+
+            def check_channel_request(self, kind, chanid):
+                return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+            def check_channel_pty_request(self, *args):
+                return True
+
+            def check_channel_shell_request(self, channel):
+                self.requests.put((channel, None))
+                return True
+
+            def check_channel_exec_request(self, channel, command):
+                self.requests.put((channel, command.decode(errors='replace')))
+                return True
+
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(self._host_key)
+        server = Server()
+        try:
+            transport.start_server(server=server)
+            with self._lock:
+                self.handshakes += 1
+            # one transport carries any number of shell and exec channels until the client closes it
+            while transport.is_active() and not self._stopping.is_set():
+                try:
+                    channel, command = server.requests.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                threading.Thread(target=self._serve_channel, args=(channel, node, command), daemon=True).start()
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            transport.close()
+
+    def _serve_channel(self, channel, node, command):
+        # Run a shell, or a single command for an exec channel, on one SSH channel
+        try:
+            line_channel = _LineChannel(channel, self.settings)
+            if command is None:
+                run_session(line_channel, self._session(node))
+            else:
+                line_channel.delay()
+                line_channel.send(run_command(self._session(node), command))
+                channel.send_exit_status(0)
+        except (OSError, EOFError):
+            pass
+        finally:
+            channel.close()
+
+
+def loopback_addresses(count, first=(127, 1, 0, 1)):
+    # Return count loopback addresses starting at first (all of 127.0.0.0/8 is local on Linux)
+    base = int.from_bytes(bytes(first), 'big')
+    return [socket.inet_ntoa((base + offset).to_bytes(4, 'big')) for offset in range(count)]
@@ -0,0 +1,4 @@
+"""
+Helpers shared by the Discovery and Onboarding scripts.
+Each script puts the repository root on sys.path and imports from Common directly.
+"""
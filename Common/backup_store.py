@@ -0,0 +1,181 @@
+"""
+Compressed, content-addressed store for device backups (running-configs and inventories)
+Each backup is hashed with SHA-256 and stored once as a gzip blob under <root>/blobs, so a
+device whose config did not change since yesterday costs one index row instead of a new file.
+<root>/index.db maps (kind, hostname, date, initials) to the blob holding the text.
+
+Usage:
+    python backup_store.py import DeviceConfigs DeviceInventories [--root DeviceBackups] [--remove]
+    python backup_store.py show config HOSTNAME [--date MM_DD_YYYY] [--initials ABC]
+    python backup_store.py list [--kind config] [--hostname HOSTNAME]
+"""
+
+import os, re, gzip, sqlite3, hashlib, threading, time, argparse
+from datetime import datetime
+
+DEFAULT_ROOT = 'DeviceBackups'
+
+# {hostname}_{kind}_{MM_DD_YYYY}_{initials}.txt as written by Discovery.py
+BACKUP_FILE_NAME = re.compile(r'^(?P<hostname>.+)_(?P<kind>config|inventory)_(?P<date>\d{2}_\d{2}_\d{4})'
+                              r'_(?P<initials>[A-Za-z]{0,3})\.txt$')
+
+
+def _iso_date(date):
+    # Accept the MM_DD_YYYY form used in file names or an ISO date and return YYYY-MM-DD
+    if re.match(r'^\d{4}-\d{2}-\d{2}$', date):
+        return date
+    return datetime.strptime(date, '%m_%d_%Y').strftime('%Y-%m-%d')
+
+
+class BackupStore:
+    # Thread-safe backup store rooted at root
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, 'index.db'), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS backups (
+                                kind TEXT NOT NULL,
+                                hostname TEXT NOT NULL,
+                                date TEXT NOT NULL,
+                                initials TEXT NOT NULL,
+                                digest TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                created REAL NOT NULL,
+                                PRIMARY KEY (kind, hostname, date, initials))''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS backups_digest ON backups (digest)')
+        self._db.commit()
+
+    def blob_path(self, digest):
+        # Path of the gzip file holding digest, which other processes can read without the index
+        return os.path.join(self.root, 'blobs', digest[:2], digest + '.gz')
+
+    def put(self, kind, hostname, date, initials, text):
+        # Store text as the kind ('config' or 'inventory') backup of hostname on date. Returns the digest.
+        data = text.encode()
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self.blob_path(digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            temp_path = f'{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with gzip.open(temp_path, 'wb', compresslevel=6) as blob:
+                blob.write(data)
+            os.replace(temp_path, blob_path)
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO backups VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (kind, hostname, _iso_date(date), initials, digest, len(data), time.time()))
+            self._db.commit()
+        return digest
+
+    def read_blob(self, digest):
+        # Return the text stored under digest
+        with gzip.open(self.blob_path(digest), 'rb') as blob:
+            return blob.read().decode()
+
+    def find(self, kind, hostname, date=None, initials=None):
+        # Return (date, initials, digest) of the matching backup, the latest one if date is None
+        query = 'SELECT date, initials, digest FROM backups WHERE kind = ? AND hostname = ?'
+        params = [kind, hostname]
+        if date is not None:
+            query += ' AND date = ?'
+            params.append(_iso_date(date))
+        if initials is not None:
+            query += ' AND initials = ?'
+            params.append(initials)
+        query += ' ORDER BY date DESC, created DESC LIMIT 1'
+        with self._lock:
+            return self._db.execute(query, params).fetchone()
+
+    def get(self, kind, hostname, date=None, initials=None):
+        # Return the text of the matching backup, the latest one if date is None. Raises KeyError if missing.
+        found = self.find(kind, hostname, date, initials)
+        if found is None:
+            raise KeyError(f'No {kind} backup for {hostname}' + (f' on {date}' if date else ''))
+        return self.read_blob(found[2])
+
+    def list(self, kind=None, hostname=None):
+        # Return (kind, hostname, date, initials, digest, size) for every backup, oldest first
+        query = 'SELECT kind, hostname, date, initials, digest, size FROM backups WHERE 1 = 1'
+        params = []
+        if kind is not None:
+            query += ' AND kind = ?'
+            params.append(kind)
+        if hostname is not None:
+            query += ' AND hostname = ?'
+            params.append(hostname)
+        query += ' ORDER BY hostname, kind, date, created'
+        with self._lock:
+            return self._db.execute(query, params).fetchall()
+
+    def import_file(self, path):
+        # Import one {hostname}_{kind}_{date}_{initials}.txt backup. Returns the digest or None if not a backup.
+        match = BACKUP_FILE_NAME.match(os.path.basename(path))
+        if match is None:
+            return None
+        with open(path) as backup:
+            text = backup.read()
+        return self.put(match['kind'], match['hostname'], match['date'], match['initials'], text)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def read_backup(kind, hostname, date=None, initials=None, root=DEFAULT_ROOT):
+    # Read one backup back in a single call, the latest one if date is None
+    store = BackupStore(root)
+    try:
+        return store.get(kind, hostname, date, initials)
+    finally:
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compressed, content-addressed store for device backups.')
+    parser.add_argument('--root', default=DEFAULT_ROOT, help=f'store directory (default {DEFAULT_ROOT})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='import existing .txt backups')
+    import_parser.add_argument('directories', nargs='+', help='directories such as DeviceConfigs DeviceInventories')
+    import_parser.add_argument('--remove', action='store_true', help='delete each .txt file once it is stored')
+    show_parser = commands.add_parser('show', help='print a backup')
+    show_parser.add_argument('kind', choices=['config', 'inventory'])
+    show_parser.add_argument('hostname')
+    show_parser.add_argument('--date', help='MM_DD_YYYY or YYYY-MM-DD (default latest)')
+    show_parser.add_argument('--initials')
+    list_parser = commands.add_parser('list', help='list stored backups')
+    list_parser.add_argument('--kind', choices=['config', 'inventory'])
+    list_parser.add_argument('--hostname')
+    args = parser.parse_args()
+
+    store = BackupStore(args.root)
+    try:
+        if args.command == 'import':
+            imported = skipped = 0
+            blobs = set()
+            for directory in args.directories:
+                for file_name in sorted(os.listdir(directory)):
+                    path = os.path.join(directory, file_name)
+                    digest = store.import_file(path)
+                    if digest is None:
+                        skipped += 1
+                        continue
+                    imported += 1
+                    blobs.add(digest)
+                    if args.remove:
+                        os.remove(path)
+            print(f'Imported {imported} backups into {len(blobs)} unique blobs. Skipped {skipped} other files.')
+        elif args.command == 'show':
+            try:
+                print(store.get(args.kind, args.hostname, args.date, args.initials), end='')
+            except KeyError as e:
+                parser.exit(1, str(e.args[0]) + '\n')
+        else:
+            for kind, hostname, date, initials, digest, size in store.list(args.kind, args.hostname):
+                print(f'{hostname},{kind},{date},{initials},{digest[:12]},{size}')
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Streaming DeviceList.csv loader shared by Discovery and Onboarding
+Yields one validated device record (a dict keyed by the lower-case CSV headers) per row as the
+file is read, so work can start on the first row and memory stays flat for very large lists.
+Rows with a missing or invalid IP, missing required fields or a devicetype the caller does not
+support are skipped and reported, and duplicate IPs are dropped after their first appearance.
+
+Expected headers: ip,username,password,enablesecret,devicetype
+A file whose first row is not a header with an 'ip' column is read positionally in that order.
+"""
+
+import csv, logging, ipaddress, zlib
+
+FIELDS = ('ip', 'username', 'password', 'enablesecret', 'devicetype')
+
+
+def in_shard(ip, shard):
+    # True if ip belongs to shard (i, N). The split is by a stable hash of the IP,
+    # so every host running a different shard of the same list agrees on it.
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(ip.encode()) % count == index - 1
+
+
+def _log_skipped(line_number, row, reason):
+    logging.warning(f'Skipping DeviceList line {line_number}: {reason}')
+
+
+def iter_devices(path, required=('ip', 'username', 'password'), on_skip=_log_skipped, shard=None, devicetypes=None):
+    # Yield a dict per valid row of the CSV at path. Missing optional columns are ''.
+    # With devicetypes, rows whose devicetype is not one of them are skipped.
+    # on_skip(line_number, row, reason) is called for every row that is skipped.
+    # With shard=(i, N) only the rows in that shard of the list are yielded.
+    seen = set()
+    with open(path, newline='') as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=',')
+        header = next(csv_reader, None)
+        if header is None:
+            return
+        names = [name.strip().lower() for name in header]
+        if 'ip' not in names:
+            # no usable header; the first row was still a header in the original layout
+            names = list(FIELDS)
+        for line_number, row in enumerate(csv_reader, start=2):
+            if not any(value.strip() for value in row):
+                continue
+            device = dict.fromkeys(FIELDS, '')
+            device.update(zip(names, row))
+            device['ip'] = device['ip'].strip()
+            device['devicetype'] = device['devicetype'].strip()
+            missing = [field for field in required if not device.get(field)]
+            if missing:
+                on_skip(line_number, row, 'missing ' + ', '.join(missing))
+                continue
+            try:
+                address = ipaddress.ip_address(device['ip'])
+            except ValueError:
+                on_skip(line_number, row, f"invalid IP address '{device['ip']}'")
+                continue
+            if devicetypes is not None and device['devicetype'] not in devicetypes:
+                on_skip(line_number, row, f"unknown devicetype '{device['devicetype']}'")
+                continue
+            if address.packed in seen:
+                on_skip(line_number, row, f"duplicate IP address {device['ip']}")
+                continue
+            seen.add(address.packed)
+            device['ip'] = str(address)
+            if in_shard(device['ip'], shard):
+                yield device
@@ -0,0 +1,82 @@
+"""
+Append-only run journal used to resume Discovery and ApplyDefaults after a crash or Ctrl-C
+Every line is a JSON object. The first line is the run header (settings needed to resume),
+the rest record the state of one device, 'done' or 'failed', with its result row.
+Devices with no entry are still pending.
+Writes go to the OS immediately but fsync is batched (every sync_every records or
+sync_interval seconds) so the journal never becomes the bottleneck of a run.
+"""
+
+import os, glob, json, time
+
+
+class RunJournal:
+    # Append-only JSONL journal for one run. Not thread-safe; the report writer thread owns it.
+    def __init__(self, path, header=None, sync_every=50, sync_interval=2.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a')
+        if new_file:
+            self._write({'type': 'run', 'started': time.time(), **(header or {})})
+            self.sync()
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, default=str) + '\n')
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def record(self, key, state, row=None):
+        # Record the state of device key ('done' or 'failed') and its report row
+        entry = {'type': 'device', 'key': key, 'state': state, 'time': time.time()}
+        if row is not None:
+            entry['row'] = row
+        self._write(entry)
+
+    def sync(self):
+        # Force everything written so far to disk
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+
+def load_journal(path):
+    # Return (header, {key: last device entry}) for the journal at path.
+    # A torn last line from a crash is ignored.
+    header = {}
+    devices = {}
+    with open(path) as journal_file:
+        for line in journal_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('type') == 'run':
+                header = entry
+            elif entry.get('type') == 'device':
+                devices[entry['key']] = entry
+    return header, devices
+
+
+def completed(devices):
+    # Return {key: row} of the devices whose last state is 'done'
+    return {key: entry.get('row') for key, entry in devices.items() if entry['state'] == 'done'}
+
+
+def latest_journal(prefix, suffix=''):
+    # Return the newest journal file named {prefix}_*{suffix}.jsonl in the working directory, or None
+    journals = glob.glob(f'{prefix}_*{suffix}.jsonl')
+    if not journals:
+        return None
+    return max(journals, key=os.path.getmtime)
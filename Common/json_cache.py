@@ -0,0 +1,47 @@
+"""
+Base of the small JSON caches Discovery and Onboarding keep in the working directory
+(transport_cache.json, topology_cache.json, timeouts.json). Each is one JSON object of entries
+stamped with the time they were last 'updated'; an entry older than the cache's TTL counts as
+missing and is dropped when the file is next written. The file is read on first use and
+written back atomically, and only when something changed.
+"""
+
+import json, os, threading, time
+
+
+class JsonCache:
+    # Thread-safe base: subclasses hold self._lock around _load() and set self._dirty after a change
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Read the cache file on first use. A missing or unreadable file is an empty cache.
+        if self._entries is None:
+            try:
+                with open(self.path) as cache_file:
+                    self._entries = json.load(cache_file)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _expired(self, entry, now=None):
+        # True if entry is older than the TTL
+        return (now or time.time()) - entry.get('updated', 0) > self.ttl
+
+    def save(self):
+        # Write the cache back to disk atomically, dropping expired entries
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            entries = {key: entry for key, entry in self._load().items() if not self._expired(entry, now)}
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as cache_file:
+                json.dump(entries, cache_file, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+            self._entries = entries
+            self._dirty = False
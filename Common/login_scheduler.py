@@ -0,0 +1,214 @@
+"""
+Login scheduler shared by Discovery and Onboarding
+Every SSH or telnet login goes through one LoginScheduler, which keeps the AAA (TACACS/RADIUS)
+servers from being hammered by a large run:
+  - at most limit logins run at once overall and per_site per site (the /24 of the host unless
+    the caller names one)
+  - the limit adapts: it is halved when the auth and timeout errors among the recent logins
+    rise above aaa_error_rate, and grows back by one per limit successful logins (AIMD)
+  - timeouts are retried after an exponential backoff with full jitter; a rejected password is
+    not, since trying it again only adds to the AAA load and the lockout count
+  - after breaker_failures failed attempts in a row a host's circuit opens and its logins fail
+    at once for breaker_seconds, so a dead host stops holding worker slots. Logins that name a
+    transport have a circuit per host and transport, so SSH timing out never blocks telnet.
+Failures are raised as LoginError with a cause from classify(), which goes into the report.
+A probing login, one of several credential profiles tried in turn, expects to be rejected: its auth
+failures count neither toward the breaker nor the AAA error rate.
+"""
+
+import errno, random, threading, time, ipaddress
+from collections import Counter, deque
+
+DEFAULT_MAX_LOGINS = 16
+DEFAULT_PER_SITE = 8
+
+# causes of a failed login or session, as reported
+AUTH, TIMEOUT, REFUSED, UNREACHABLE, PROTOCOL, CIRCUIT_OPEN, OTHER = (
+    'auth', 'timeout', 'refused', 'unreachable', 'protocol', 'circuit open', 'other')
+
+# causes counted as AAA trouble by the adaptive limit, and the ones of them retried after a backoff
+AAA_TROUBLE = (AUTH, TIMEOUT)
+RETRIED = (TIMEOUT,)
+
+# exception class names by cause, so paramiko and netmiko need not be imported here
+_AUTH_NAMES = {'AuthenticationException', 'NetmikoAuthenticationException', 'BadAuthenticationType',
+               'PasswordRequiredException'}
+_TIMEOUT_NAMES = {'timeout', 'TimeoutError', 'NetmikoTimeoutException', 'ReadTimeout'}
+_REFUSED_NAMES = {'ConnectionRefusedError', 'NoValidConnectionsError'}
+_PROTOCOL_NAMES = {'SSHException', 'EOFError', 'ConnectionResetError', 'ConnectionAbortedError'}
+
+
+class LoginError(Exception):
+    # A login that failed for good. cause is one of the causes above.
+    def __init__(self, host, cause, detail):
+        super().__init__(host, cause, detail)
+        self.host = host
+        self.cause = cause
+        self.detail = detail
+
+    def __str__(self):
+        return f'{self.cause}: {self.detail}'
+
+
+def classify(error):
+    # Return the cause of an exception raised by a login or a session. netmiko reports e.g. a refused
+    # port as a timeout, so for its timeouts the exception they were raised from decides when that
+    # one says more. Any other exception is judged by its own class.
+    if isinstance(error, LoginError):
+        return error.cause
+    names = {cls.__name__ for cls in type(error).__mro__}
+    inner = error.__cause__ or error.__context__
+    if 'NetmikoTimeoutException' in names and inner is not None:
+        cause = classify(inner)
+        if cause != OTHER:
+            return cause
+    if names & _AUTH_NAMES:
+        return AUTH
+    if names & _TIMEOUT_NAMES:
+        return TIMEOUT
+    if names & _REFUSED_NAMES:
+        return REFUSED
+    if isinstance(error, OSError) and error.errno in (errno.EHOSTUNREACH, errno.ENETUNREACH):
+        return UNREACHABLE
+    if names & _PROTOCOL_NAMES:
+        return PROTOCOL
+    return OTHER
+
+
+def describe_failure(error):
+    # Return 'cause: message' for the report
+    if isinstance(error, LoginError):
+        return str(error)
+    return f'{classify(error)}: {error}'
+
+
+def most_telling(errors):
+    # Return the LoginError that says most about why no transport worked, e.g. a rejected password on
+    # SSH over the refused telnet port
+    order = (AUTH, PROTOCOL, TIMEOUT, OTHER, UNREACHABLE, REFUSED, CIRCUIT_OPEN)
+    return min(errors, key=lambda error: order.index(error.cause))
+
+
+def default_site(host):
+    # The /24 of an IPv4 host (or /64 of IPv6), the host itself if it is not an address
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return host
+    prefix = 24 if address.version == 4 else 64
+    return str(ipaddress.ip_network(f'{address}/{prefix}', strict=False))
+
+
+class LoginScheduler:
+    # Thread-safe. One per run, shared by every worker.
+    def __init__(self, max_logins=DEFAULT_MAX_LOGINS, per_site=DEFAULT_PER_SITE, min_logins=2, retries=2,
+                 backoff=1.0, max_backoff=30.0, breaker_failures=3, breaker_seconds=300.0,
+                 aaa_window=20, aaa_error_rate=0.2):
+        self.max_logins = max_logins
+        self.per_site = per_site
+        self.min_logins = min(min_logins, max_logins)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker_failures = breaker_failures
+        self.breaker_seconds = breaker_seconds
+        self.aaa_window = aaa_window
+        self.aaa_error_rate = aaa_error_rate
+        self.limit = max_logins
+        self._active = 0
+        self._sites = Counter()
+        self._recent = deque(maxlen=aaa_window)
+        self._successes = 0
+        self._failed_in_a_row = Counter()
+        self._open_until = {}
+        self.failures = Counter()
+        self.lowest_limit = max_logins
+        self._condition = threading.Condition()
+
+    def _acquire(self, site):
+        with self._condition:
+            while self._active >= self.limit or self._sites[site] >= self.per_site:
+                self._condition.wait()
+            self._active += 1
+            self._sites[site] += 1
+
+    def _release(self, site):
+        with self._condition:
+            self._active -= 1
+            self._sites[site] -= 1
+            if not self._sites[site]:
+                del self._sites[site]
+            self._condition.notify_all()
+
+    def _record(self, key, cause):
+        # Feed one attempt (cause None for a success) to the breaker of key and the adaptive limit
+        with self._condition:
+            self._recent.append(cause in AAA_TROUBLE)
+            if cause is None:
+                self._failed_in_a_row.pop(key, None)
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_logins:
+                    self._successes = 0
+                    self.limit += 1
+                    self._condition.notify_all()
+                return
+            self._failed_in_a_row[key] += 1
+            if self._failed_in_a_row[key] >= self.breaker_failures:
+                self._open_until[key] = time.monotonic() + self.breaker_seconds
+            if len(self._recent) >= self.aaa_window // 2 and \
+                    sum(self._recent) / len(self._recent) > self.aaa_error_rate and self.limit > self.min_logins:
+                self.limit = max(self.min_logins, self.limit // 2)
+                self.lowest_limit = min(self.lowest_limit, self.limit)
+                self._successes = 0
+                # judge the new limit on fresh logins only
+                self._recent.clear()
+
+    def circuit_open(self, host, transport=None):
+        # True while the circuit of host (over transport, if given) is open
+        key = host if transport is None else (host, transport)
+        with self._condition:
+            return self._open_until.get(key, 0) > time.monotonic()
+
+    def login(self, host, connect, site=None, probing=False, transport=None, retries=None):
+        # Call connect() for host within the caps and return what it returns. Timeouts are retried
+        # after a backoff, retries times (default self.retries).
+        # transport names the transport connect() uses, which gets its own circuit on host.
+        # Raises LoginError with the cause of the last failure.
+        site = site or default_site(host)
+        key = host if transport is None else (host, transport)
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            if self.circuit_open(host, transport):
+                with self._condition:
+                    self.failures[CIRCUIT_OPEN] += 1
+                over = '' if transport is None else f' over {transport}'
+                raise LoginError(host, CIRCUIT_OPEN, f'{host} failed {self.breaker_failures} logins{over} in a row')
+            self._acquire(site)
+            try:
+                result = connect()
+            except Exception as e:
+                cause = classify(e)
+                if probing and cause == AUTH:
+                    raise LoginError(host, cause, str(e) or type(e).__name__) from e
+                self._record(key, cause)
+                if cause not in RETRIED or attempt >= retries:
+                    with self._condition:
+                        self.failures[cause] += 1
+                    raise LoginError(host, cause, str(e) or type(e).__name__) from e
+            else:
+                self._record(key, None)
+                return result
+            finally:
+                self._release(site)
+            attempt += 1
+            time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def summary(self):
+        # Return text lines describing the logins of the run
+        with self._condition:
+            lines = [f'Login concurrency: limit {self.limit} of {self.max_logins} at the end, lowest {self.lowest_limit}']
+            if self.failures:
+                causes = ', '.join(f'{cause} {count}' for cause, count in self.failures.most_common())
+                lines.append(f'Failed logins by cause: {causes}')
+            return lines
@@ -0,0 +1,279 @@
+"""
+Reachability sweep shared by Discovery and Onboarding.
+Probes a whole device list at once before any login happens. Every host gets non-blocking
+TCP connects to the management ports (SSH and telnet) in parallel, all driven from one
+selector loop, so a sweep costs roughly one timeout instead of one ping per device.
+Hosts that do not answer on TCP get an unprivileged ICMP echo where the OS allows it
+(Linux with net.ipv4.ping_group_range). A refused connection counts as reachable.
+The number of sockets open at once stays under the descriptor limit of the process, and a host
+that finds no descriptor free waits for one instead of failing the sweep.
+"""
+
+import errno, os, selectors, socket, struct, sys, time, ipaddress
+from collections import deque, namedtuple
+
+DEFAULT_PORTS = (22, 23)
+DEFAULT_TIMEOUT = 2.0
+# sockets open at once; each host probed holds one per port
+DEFAULT_IN_FLIGHT = 512
+
+# descriptors left for the sessions, databases and log files the rest of the process holds
+FD_HEADROOM = 128
+# select() on Windows handles at most 512 sockets (FD_SETSIZE)
+WIN32_MAX_SOCKETS = 512
+# seconds between attempts when every descriptor is taken and nothing of the sweep is in flight
+FD_RETRY = 0.1
+
+_OUT_OF_DESCRIPTORS = (errno.EMFILE, errno.ENFILE)
+
+# ip - the host as given, reachable - True/False, method - 'tcp/22', 'tcp/23', 'icmp' or None,
+# rtt - seconds to the first answer, open_ports - ports that accepted a connection, error - reason when unreachable
+ProbeResult = namedtuple('ProbeResult', ['ip', 'reachable', 'method', 'rtt', 'open_ports', 'error'])
+
+_ICMP_ECHO_REQUEST = 8
+_ICMP_ECHO_REPLY = 0
+_icmp_supported = None
+
+
+def icmp_supported():
+    # Check once whether this process may open unprivileged ICMP sockets
+    global _icmp_supported
+    if _icmp_supported is None:
+        try:
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP).close()
+            _icmp_supported = True
+        except (OSError, AttributeError):
+            _icmp_supported = False
+    return _icmp_supported
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def _echo_request(sequence):
+    # The kernel rewrites the identifier on unprivileged sockets, so it is left at zero
+    payload = b'tools-reachability'
+    header = struct.pack('!BBHHH', _ICMP_ECHO_REQUEST, 0, 0, 0, sequence)
+    return struct.pack('!BBHHH', _ICMP_ECHO_REQUEST, 0, _checksum(header + payload), 0, sequence) + payload
+
+
+def socket_limit():
+    # Most sockets a sweep may hold open at once in this process
+    if sys.platform == 'win32':
+        return WIN32_MAX_SOCKETS
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, OSError, ValueError):
+        return DEFAULT_IN_FLIGHT
+    if soft == resource.RLIM_INFINITY:
+        return sys.maxsize
+    return max(soft - FD_HEADROOM, soft // 2)
+
+
+class _Probe:
+    # State for one host while its probes are in flight
+    def __init__(self, ip):
+        self.ip = ip
+        self.start = time.perf_counter()
+        self.deadline = None
+        self.sockets = {}
+        self.open_ports = []
+        self.refused = False
+        self.rtt = None
+        self.method = None
+        self.icmp_sent = False
+        self.error = None
+
+
+def _resolve(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+        return socket.AF_INET6 if address.version == 6 else socket.AF_INET, str(address)
+    except ValueError:
+        info = socket.getaddrinfo(ip, None, type=socket.SOCK_STREAM)[0]
+        return info[0], info[4][0]
+
+
+def iter_sweep(hosts, ports=DEFAULT_PORTS, timeout=DEFAULT_TIMEOUT, max_in_flight=DEFAULT_IN_FLIGHT, icmp=True):
+    # Probe every host in hosts and yield a ProbeResult for each one as soon as it is known.
+    # hosts may be any iterable (including a generator); at most max_in_flight sockets (capped by
+    # socket_limit()) are open at once, so max_in_flight // len(ports) hosts are probed at once.
+    hosts = iter(hosts)
+    selector = selectors.DefaultSelector()
+    active = []
+    # resolved hosts that found no free descriptor, probed again before any new host
+    waiting = deque()
+    exhausted = False
+    # when the sweep last found no descriptor free, None while it has found them
+    starved_since = None
+    max_hosts = max(1, min(max_in_flight, socket_limit()) // max(1, len(ports)))
+    use_icmp = icmp and icmp_supported()
+    sequence = os.getpid() & 0xffff
+
+    def close_sockets(probe):
+        for sock in probe.sockets:
+            selector.unregister(sock)
+            sock.close()
+        probe.sockets = {}
+
+    def finish(probe):
+        close_sockets(probe)
+        active.remove(probe)
+        reachable = probe.rtt is not None
+        error = None if reachable else (probe.error or 'No reply')
+        return ProbeResult(probe.ip, reachable, probe.method, probe.rtt, tuple(sorted(probe.open_ports)), error)
+
+    def answered(probe, method):
+        now = time.perf_counter()
+        if probe.rtt is None:
+            probe.rtt = now - probe.start
+            probe.method = method
+            # give the remaining ports a short grace period instead of the full timeout
+            probe.deadline = min(probe.deadline, now + max(probe.rtt * 4, 0.2))
+
+    def start_icmp(probe, family, address):
+        nonlocal sequence
+        if family != socket.AF_INET:
+            return False
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            sock.setblocking(False)
+            sock.connect((address, 0))
+            sequence = (sequence + 1) & 0xffff
+            sock.send(_echo_request(sequence))
+        except OSError as e:
+            probe.error = str(e)
+            return False
+        probe.icmp_sent = True
+        probe.start = time.perf_counter()
+        probe.deadline = probe.start + timeout
+        probe.sockets[sock] = None
+        selector.register(sock, selectors.EVENT_READ, probe)
+        return True
+
+    def start_tcp(probe):
+        # Open a connect to every port of probe. Returns False, with nothing left open, when the
+        # process is out of descriptors.
+        probe.start = time.perf_counter()
+        probe.deadline = probe.start + timeout
+        for port in ports:
+            try:
+                sock = socket.socket(probe.family, socket.SOCK_STREAM)
+            except OSError as e:
+                if e.errno in _OUT_OF_DESCRIPTORS:
+                    close_sockets(probe)
+                    probe.refused = False
+                    probe.rtt = probe.method = probe.error = None
+                    return False
+                probe.error = str(e)
+                continue
+            sock.setblocking(False)
+            code = sock.connect_ex((probe.address, port))
+            if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                sock.close()
+                if code == errno.ECONNREFUSED:
+                    probe.refused = True
+                    answered(probe, f'tcp/{port}')
+                else:
+                    probe.error = os.strerror(code)
+                continue
+            probe.sockets[sock] = port
+            selector.register(sock, selectors.EVENT_WRITE, probe)
+        return True
+
+    while True:
+        while (waiting or not exhausted) and len(active) < max_hosts:
+            if waiting:
+                probe = waiting.popleft()
+            else:
+                try:
+                    ip = next(hosts)
+                except StopIteration:
+                    exhausted = True
+                    break
+                probe = _Probe(ip)
+                try:
+                    probe.family, probe.address = _resolve(ip)
+                except (OSError, UnicodeError) as e:
+                    probe.error = f'Could not resolve {ip}: {e}'
+                    active.append(probe)
+                    yield finish(probe)
+                    continue
+            active.append(probe)
+            if not start_tcp(probe):
+                # wait for a probe in flight to give its descriptors back
+                active.remove(probe)
+                waiting.appendleft(probe)
+                if starved_since is None:
+                    starved_since = time.perf_counter()
+                break
+            starved_since = None
+            if not probe.sockets and probe.rtt is None and not (use_icmp and start_icmp(probe, probe.family, probe.address)):
+                yield finish(probe)
+
+        if not active:
+            if waiting:
+                # the descriptors are held elsewhere in the process: wait up to timeout for some to close
+                if time.perf_counter() - starved_since > timeout:
+                    probe = waiting.popleft()
+                    probe.error = os.strerror(errno.EMFILE)
+                    active.append(probe)
+                    yield finish(probe)
+                else:
+                    time.sleep(FD_RETRY)
+                continue
+            if exhausted:
+                break
+            continue
+
+        now = time.perf_counter()
+        wait = max(0.0, min(probe.deadline for probe in active) - now)
+        for key, _ in selector.select(wait):
+            sock, probe = key.fileobj, key.data
+            port = probe.sockets.get(sock)
+            if port is None:
+                # ICMP echo reply
+                try:
+                    reply = sock.recv(1024)
+                except OSError:
+                    continue
+                if reply and reply[0] == _ICMP_ECHO_REPLY:
+                    answered(probe, 'icmp')
+                    probe.deadline = time.perf_counter()
+            else:
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code == 0:
+                    probe.open_ports.append(port)
+                    answered(probe, f'tcp/{port}')
+                elif code == errno.ECONNREFUSED:
+                    probe.refused = True
+                    answered(probe, f'tcp/{port}')
+                else:
+                    probe.error = os.strerror(code)
+            selector.unregister(sock)
+            sock.close()
+            del probe.sockets[sock]
+
+        now = time.perf_counter()
+        for probe in list(active):
+            if probe.sockets and now < probe.deadline:
+                continue
+            if probe.rtt is None and not probe.icmp_sent and use_icmp:
+                close_sockets(probe)
+                if start_icmp(probe, probe.family, probe.address):
+                    continue
+            yield finish(probe)
+
+    selector.close()
+
+
+def sweep(hosts, ports=DEFAULT_PORTS, timeout=DEFAULT_TIMEOUT, max_in_flight=DEFAULT_IN_FLIGHT, icmp=True):
+    # Probe every host and return a dict of ip -> ProbeResult
+    return {result.ip: result for result in iter_sweep(hosts, ports, timeout, max_in_flight, icmp)}
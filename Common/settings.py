@@ -0,0 +1,67 @@
+"""
+Command line and config file settings shared by Discovery and Onboarding
+Any long option of a script can also be given in an INI config file passed with --config,
+in the section named after the script, e.g.
+
+    [discovery]
+    initials = ABC
+    workers = 50
+    shard = 1/4
+
+Values on the command line win over the config file. A script reading another script's section
+(compliance_scan.py reads [onboarding]) passes ignore_unknown and skips the settings it lacks.
+"""
+
+import argparse, configparser
+
+
+def parse_args_with_config(parser, section, argv=None, ignore_unknown=False):
+    # Parse argv with parser after loading defaults from the [section] of the --config file, if any.
+    # Settings parser does not define are an error unless ignore_unknown is set.
+    pre_parser = argparse.ArgumentParser(add_help=False)
+    pre_parser.add_argument('--config')
+    known, _ = pre_parser.parse_known_args(argv)
+    if known.config:
+        config = configparser.ConfigParser()
+        if not config.read(known.config):
+            parser.error(f'could not read config file {known.config}')
+        if not config.has_section(section):
+            parser.error(f'config file {known.config} has no [{section}] section')
+        actions = {action.dest: action for action in parser._actions}
+        defaults = {}
+        for key, value in config.items(section):
+            dest = key.replace('-', '_')
+            action = actions.get(dest)
+            if action is None and ignore_unknown:
+                continue
+            if action is None or dest in ('help', 'config'):
+                parser.error(f'unknown setting {key} in {known.config}')
+            try:
+                if isinstance(action, (argparse._StoreTrueAction, argparse._StoreFalseAction)):
+                    defaults[dest] = config.getboolean(section, key)
+                elif action.type is not None:
+                    defaults[dest] = action.type(value)
+                else:
+                    defaults[dest] = value
+            except (ValueError, argparse.ArgumentTypeError) as e:
+                parser.error(f'invalid value for {key} in {known.config}: {e}')
+        parser.set_defaults(**defaults)
+    return parser.parse_args(argv)
+
+
+def parse_shard(value):
+    # argparse type for --shard i/N with 1 <= i <= N. Returns (i, N).
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like i/N, not '{value}'")
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard {value} is out of range; use 1/N to N/N")
+    return index, count
+
+
+def shard_suffix(shard):
+    # File name suffix identifying a shard, '' when not sharded
+    if shard is None:
+        return ''
+    return f'_shard{shard[0]}of{shard[1]}'
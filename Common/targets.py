@@ -0,0 +1,155 @@
+"""
+Sweep targets and credential profiles for Discovery
+Targets are given as CIDR blocks (10.20.0.0/16), ranges (10.20.1.10-10.20.1.50, or 10.20.1.10-50
+for the last octet) and single addresses, each list either comma separated or read from a file
+named with @FILE (one per line, # starts a comment). Every spec becomes an interval of addresses;
+overlapping ones are merged and the exclusions cut out before anything is generated, so
+iter_targets() yields the addresses one at a time in order and memory stays flat for a /16 or
+larger. CIDR blocks skip their network and broadcast addresses, as ipaddress' hosts() does.
+
+Credential profiles come from an INI file with one section per profile, tried in file order:
+
+    [tacacs]
+    username = netops
+    password = ...
+    enablesecret = ...
+
+SerialClaims keeps a device with several management addresses from being collected once per address.
+"""
+
+import argparse, configparser, ipaddress, threading
+from collections import namedtuple
+from Common.device_list import in_shard
+
+# most addresses a single spec may cover, so a mistyped prefix cannot start a sweep of years
+MAX_SPEC_ADDRESSES = 2 ** 24
+
+# name: section of the profile, or where the credentials came from
+Credential = namedtuple('Credential', ['name', 'username', 'password', 'enablesecret'])
+Credential.__new__.__defaults__ = ('',)
+
+_ADDRESS_CLASSES = {4: ipaddress.IPv4Address, 6: ipaddress.IPv6Address}
+
+
+def parse_spec(spec, hosts_only=True):
+    # Return (version, first, last) with the first and last address of spec as integers.
+    # hosts_only drops the network and broadcast addresses of a CIDR block. Raises ValueError.
+    spec = spec.strip()
+    if '/' in spec:
+        network = ipaddress.ip_network(spec, strict=False)
+        first, last = int(network.network_address), int(network.broadcast_address)
+        if hosts_only and network.num_addresses > 2:
+            first += 1
+            if network.version == 4:
+                last -= 1
+        version = network.version
+    elif '-' in spec:
+        start, end = (part.strip() for part in spec.split('-', 1))
+        start = ipaddress.ip_address(start)
+        if start.version == 4 and end.isdigit():
+            end = str(start).rsplit('.', 1)[0] + '.' + end
+        end = ipaddress.ip_address(end)
+        if start.version != end.version or end < start:
+            raise ValueError(f"'{spec}' is not a range from a lower to a higher address of the same kind")
+        first, last, version = int(start), int(end), start.version
+    else:
+        address = ipaddress.ip_address(spec)
+        first = last = int(address)
+        version = address.version
+    if last - first + 1 > MAX_SPEC_ADDRESSES:
+        raise ValueError(f"'{spec}' covers more than {MAX_SPEC_ADDRESSES} addresses")
+    return version, first, last
+
+
+def read_specs(value):
+    # Return the specs of a comma separated list, or of the lines of the file named by @FILE
+    if value.startswith('@'):
+        with open(value[1:]) as spec_file:
+            lines = [line.split('#', 1)[0] for line in spec_file]
+        return [line.strip() for line in lines if line.strip()]
+    return [spec.strip() for spec in value.split(',') if spec.strip()]
+
+
+def parse_target_list(value):
+    # argparse type for --targets: the specs as a list of intervals
+    try:
+        return [parse_spec(spec) for spec in read_specs(value)]
+    except (OSError, ValueError) as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_exclude_list(value):
+    # argparse type for --exclude: like --targets, but CIDR blocks exclude their whole block
+    try:
+        return [parse_spec(spec, hosts_only=False) for spec in read_specs(value)]
+    except (OSError, ValueError) as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def merge_intervals(intervals, exclude=()):
+    # Return intervals merged, sorted and with exclude cut out
+    merged = []
+    for version, first, last in sorted(intervals):
+        if merged and merged[-1][0] == version and first <= merged[-1][2] + 1:
+            merged[-1][2] = max(merged[-1][2], last)
+        else:
+            merged.append([version, first, last])
+    for cut_version, cut_first, cut_last in exclude:
+        remaining = []
+        for version, first, last in merged:
+            if version != cut_version or cut_last < first or cut_first > last:
+                remaining.append([version, first, last])
+                continue
+            if first < cut_first:
+                remaining.append([version, first, cut_first - 1])
+            if cut_last < last:
+                remaining.append([version, cut_last + 1, last])
+        merged = remaining
+    return [tuple(interval) for interval in merged]
+
+
+def target_count(intervals, exclude=()):
+    # Number of addresses iter_targets() yields without sharding
+    return sum(last - first + 1 for _, first, last in merge_intervals(intervals, exclude))
+
+
+def iter_targets(intervals, exclude=(), shard=None):
+    # Yield every address of intervals not in exclude once, as a string, generated as it is needed.
+    # With shard=(i, N) only the addresses in that shard are yielded.
+    for version, first, last in merge_intervals(intervals, exclude):
+        address_class = _ADDRESS_CLASSES[version]
+        for number in range(first, last + 1):
+            ip = str(address_class(number))
+            if in_shard(ip, shard):
+                yield ip
+
+
+def load_credentials(path):
+    # Return the Credentials of the profiles in the INI file at path, in file order. Raises ValueError.
+    config = configparser.ConfigParser(interpolation=None)
+    if not config.read(path):
+        raise ValueError(f'could not read credential profiles from {path}')
+    profiles = []
+    for name in config.sections():
+        section = config[name]
+        if not section.get('username') or not section.get('password'):
+            raise ValueError(f'credential profile [{name}] in {path} needs a username and a password')
+        profiles.append(Credential(name, section['username'], section['password'], section.get('enablesecret', '')))
+    if not profiles:
+        raise ValueError(f'{path} has no credential profiles')
+    return profiles
+
+
+class SerialClaims:
+    # Thread-safe record of the address each serial number was collected over
+    def __init__(self, claimed=None):
+        self._owners = dict(claimed or {})
+        self._lock = threading.Lock()
+
+    def claim(self, serial, ip):
+        # Return the address that claimed serial first, which is ip itself unless another address already did.
+        # Devices without a serial number are never duplicates.
+        if not serial or serial == '-':
+            return ip
+        with self._lock:
+            return self._owners.setdefault(serial, ip)
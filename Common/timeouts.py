@@ -0,0 +1,156 @@
+"""
+Per-host session timeouts shared by Discovery and Onboarding, learned from measured round trips.
+Each host keeps a smoothed round trip time and its variation (the RFC 6298 estimator), fed by the
+reachability probe and by commands with short output, the seconds per KB its long outputs took on
+top of that, and per command how long it took and how much it printed. Connect, login and command
+timeouts are derived from those, so a hung session on the LAN is cut after seconds while a slow
+link still gets the time its show running-config needs. Hosts and commands without history get
+timeouts close to netmiko's defaults, stretched by the round trip time when it is known. A command
+that times out gets twice that timeout next time, doubling on every timeout in a row, as TCP backs
+off its retransmission timer, until it completes again.
+Kept in timeouts.json (see json_cache.py).
+"""
+
+import time
+from Common.json_cache import JsonCache
+
+DEFAULT_PATH = 'timeouts.json'
+DEFAULT_TTL = 30 * 24 * 60 * 60
+
+# name under which the time from opening a session to its first prompt is learned
+LOGIN = 'login'
+
+# timeouts when nothing is known about the host
+DEFAULT_CONNECT = 10.0
+DEFAULT_COMMAND = 60.0
+
+# bounds of the derived timeouts. Commands and logins never seen before get at least MIN_UNKNOWN;
+# logins at least MIN_LOGIN, since the AAA server may take its time whatever the link.
+MIN_CONNECT, MAX_CONNECT = 3.0, 30.0
+MIN_COMMAND, MIN_LOGIN, MIN_UNKNOWN, MAX_COMMAND = 5.0, 10.0, 15.0, 900.0
+
+# round trips a TCP connect may take, enough for the SYN to be sent again
+CONNECT_ROUND_TRIPS = 6
+
+# output assumed for a command never seen on the host, and seconds per KB assumed for a host whose
+# long outputs have not been timed yet (a slow link)
+DEFAULT_OUTPUT_KB = 64
+DEFAULT_SECONDS_PER_KB = 0.1
+
+# outputs up to SHORT_OUTPUT bytes are timed as one prompt round trip; those of at least LONG_OUTPUT
+# bytes measure the transfer rate
+SHORT_OUTPUT = 512
+LONG_OUTPUT = 8192
+
+# the timeout is MARGIN times the expected duration, so a config that doubled still fits
+MARGIN = 2
+
+# factor the timeout of a command grows by each time it is hit
+BACKOFF = 2
+
+
+def _update(estimate, sample):
+    # Return [smoothed, variation] after one sample, as TCP does for its retransmission timeout
+    if not estimate:
+        return [sample, sample / 2]
+    smoothed, variation = estimate
+    variation = 0.75 * variation + 0.25 * abs(smoothed - sample)
+    smoothed = 0.875 * smoothed + 0.125 * sample
+    return [smoothed, variation]
+
+
+def _bound(value, low, high):
+    return min(max(value, low), high)
+
+
+class TimeoutCache(JsonCache):
+    # Thread-safe cache of ip -> {'rtt': [smoothed, variation], 'per_kb', 'commands': {command: [smoothed,
+    # variation, size]}, 'backoff': {command: last timeout hit}, 'updated'}
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL):
+        super().__init__(path, ttl)
+
+    def _entry(self, ip):
+        # The live entry of ip, or None. Call with the lock held.
+        entry = self._load().get(ip)
+        if entry is None or self._expired(entry):
+            return None
+        return entry
+
+    def _touch(self, ip):
+        # The entry of ip to update, created or renewed. Call with the lock held.
+        entry = self._entry(ip)
+        if entry is None:
+            entry = self._load()[ip] = {'rtt': None, 'per_kb': None, 'commands': {}, 'backoff': {}}
+        entry['updated'] = time.time()
+        self._dirty = True
+        return entry
+
+    def observe_rtt(self, ip, seconds):
+        # Feed one round trip of ip, e.g. its reachability probe
+        if seconds is None:
+            return
+        with self._lock:
+            entry = self._touch(ip)
+            entry['rtt'] = _update(entry['rtt'], seconds)
+
+    def observe_command(self, ip, command, seconds, size):
+        # Feed how long command (or LOGIN) took on ip and how many characters it printed.
+        # seconds None records only the size, e.g. for pipelined commands.
+        with self._lock:
+            entry = self._touch(ip)
+            # it completed, so it is back to the timeout its measurements give
+            entry.setdefault('backoff', {}).pop(command, None)
+            previous = entry['commands'].get(command)
+            if seconds is None:
+                if previous is not None:
+                    previous[2] = size
+                return
+            entry['commands'][command] = _update(previous and previous[:2], seconds) + [size]
+            if command == LOGIN:
+                return
+            if size <= SHORT_OUTPUT:
+                entry['rtt'] = _update(entry['rtt'], seconds)
+            elif size >= LONG_OUTPUT and entry['rtt']:
+                sample = max(0.0, seconds - entry['rtt'][0]) / (size / 1024)
+                entry['per_kb'] = sample if entry['per_kb'] is None else 0.75 * entry['per_kb'] + 0.25 * sample
+
+    def observe_timeout(self, ip, command, seconds):
+        # Feed a command (or LOGIN) on ip that had not finished when its timeout of seconds ran out
+        with self._lock:
+            backoff = self._touch(ip).setdefault('backoff', {})
+            backoff[command] = max(backoff.get(command, 0.0), seconds)
+
+    def connect_timeout(self, ip):
+        # Seconds to wait for the TCP connection to ip
+        with self._lock:
+            entry = self._entry(ip)
+            if entry is None or not entry['rtt']:
+                return DEFAULT_CONNECT
+            smoothed, variation = entry['rtt']
+        return _bound(CONNECT_ROUND_TRIPS * (smoothed + 4 * variation), MIN_CONNECT, MAX_CONNECT)
+
+    def command_timeout(self, ip, command):
+        # Seconds to wait for the prompt after command (or for the first prompt after LOGIN) on ip:
+        # MARGIN times the longer of its usual duration and a round trip plus its expected output,
+        # and at least BACKOFF times the timeout it last ran out of
+        with self._lock:
+            entry = self._entry(ip)
+            hit = entry and entry.get('backoff', {}).get(command)
+            timeout = self._derived_timeout(entry, command)
+        if hit:
+            timeout = max(timeout, min(BACKOFF * hit, MAX_COMMAND))
+        return timeout
+
+    def _derived_timeout(self, entry, command):
+        # The timeout of command from the measurements in entry. Call with the lock held.
+        if entry is None or not entry['rtt']:
+            return DEFAULT_COMMAND
+        smoothed, variation = entry['rtt']
+        per_kb = entry['per_kb'] if entry['per_kb'] is not None else DEFAULT_SECONDS_PER_KB
+        known = entry['commands'].get(command)
+        if known is None:
+            expected = smoothed + 4 * variation + DEFAULT_OUTPUT_KB * per_kb
+            return _bound(MARGIN * expected, MIN_UNKNOWN, MAX_COMMAND)
+        duration, duration_variation, size = known
+        expected = max(duration + 4 * duration_variation, smoothed + 4 * variation + size / 1024 * per_kb)
+        return _bound(MARGIN * expected, MIN_LOGIN if command == LOGIN else MIN_COMMAND, MAX_COMMAND)
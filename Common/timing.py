@@ -0,0 +1,117 @@
+"""
+Per-device, per-phase timers for Discovery and Onboarding runs
+Each device gets a DeviceTimer; code wraps its phases in 'with timer.phase(name):' blocks.
+A phase costs two perf_counter() calls and a dict update. Finished devices are written as one
+JSON line each to the timings file, and summary() reports p50/p95/max per phase and the
+slowest devices of the run.
+"""
+
+import json, math, threading, time
+
+
+class _Phase:
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class DeviceTimer:
+    # Phase timings of one device. Repeated phases are added together.
+    def __init__(self, key):
+        self.key = key
+        self.phases = {}
+
+    def phase(self, name):
+        # Context manager timing one phase
+        return _Phase(self, name)
+
+    def add(self, name, seconds):
+        # Record seconds measured elsewhere (e.g. the reachability probe RTT) under name
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def total(self):
+        # Time spent in phases; time queued behind other devices is not counted
+        return sum(self.phases.values())
+
+
+class _NullTimer:
+    # Stand-in used when timing is off
+    class _NullPhase:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+    _phase = _NullPhase()
+
+    def phase(self, name):
+        return self._phase
+
+    def add(self, name, seconds):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class TimingRecorder:
+    # Writes finished DeviceTimers to a JSONL file and keeps what summary() needs. Thread-safe.
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+        self._phases = {}
+        self._totals = []
+
+    def device(self, key):
+        return DeviceTimer(key)
+
+    def finish(self, timer, status='done'):
+        # Record a device whose work is over
+        total = timer.total()
+        entry = {'device': timer.key, 'status': status, 'total': round(total, 6),
+                 'phases': {name: round(seconds, 6) for name, seconds in timer.phases.items()}}
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            self._file.write(line)
+            for name, seconds in timer.phases.items():
+                self._phases.setdefault(name, []).append(seconds)
+            self._totals.append((total, timer.key, status))
+
+    def summary(self, slowest=10):
+        # Return the run summary as a list of text lines
+        with self._lock:
+            phases = {name: sorted(values) for name, values in self._phases.items()}
+            totals = sorted(self._totals, reverse=True)
+        lines = [f'{"phase":<22}{"count":>7}{"p50":>10}{"p95":>10}{"max":>10}']
+        for name, values in phases.items():
+            lines.append(f'{name:<22}{len(values):>7}{percentile(values, 0.5):>10.3f}'
+                         f'{percentile(values, 0.95):>10.3f}{values[-1]:>10.3f}')
+        if totals:
+            lines.append('Slowest devices (total seconds):')
+            for total, key, status in totals[:slowest]:
+                lines.append(f'  {key:<20}{total:>10.3f}  {status}')
+        return lines
+
+    def close(self):
+        with self._lock:
+            self._file.close()
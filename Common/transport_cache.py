@@ -0,0 +1,69 @@
+"""
+Per-host transport cache shared by Discovery and Onboarding.
+Remembers, per IP, which netmiko device_type last logged in successfully and whether enable
+mode had to be entered, so the next run tries the known-good transport first instead of
+waiting out an SSH timeout on every telnet-only device. With credential profiles the profile
+that logged in is remembered too and tried first. Kept in transport_cache.json (see json_cache.py).
+"""
+
+import time
+from Common.json_cache import JsonCache
+
+DEFAULT_PATH = 'transport_cache.json'
+DEFAULT_TTL = 30 * 24 * 60 * 60
+
+
+class TransportCache(JsonCache):
+    # Thread-safe cache of ip -> {'device_type', 'enable_required', 'profile', 'updated'}
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL):
+        super().__init__(path, ttl)
+
+    def get(self, ip):
+        # Return the cached entry for ip, or None if there is none or it has expired
+        with self._lock:
+            entry = self._load().get(ip)
+            if entry is None or self._expired(entry):
+                return None
+            return dict(entry)
+
+    def order(self, ip, device_types):
+        # Return device_types with the cached known-good transport for ip moved to the front
+        entry = self.get(ip)
+        if entry is None or entry['device_type'] not in device_types:
+            return list(device_types)
+        return [entry['device_type']] + [device_type for device_type in device_types
+                                         if device_type != entry['device_type']]
+
+    def order_profiles(self, ip, profiles):
+        # Return the Credential profiles with the one that last logged in to ip moved to the front
+        entry = self.get(ip)
+        name = None if entry is None else entry.get('profile')
+        return sorted(profiles, key=lambda profile: profile.name != name)
+
+    def enable_required(self, ip):
+        # Return True/False if it is known whether ip needs enable(), otherwise None
+        entry = self.get(ip)
+        if entry is None:
+            return None
+        return entry.get('enable_required')
+
+    def record(self, ip, device_type, enable_required=None, profile=None):
+        # Remember a successful login. profile=None keeps the previously known profile, and enable_required=None
+        # the previously known answer as long as the same transport and profile logged in; another profile
+        # may land in another privilege level, so it is checked again.
+        with self._lock:
+            entries = self._load()
+            previous = entries.get(ip, {})
+            profile = profile or previous.get('profile')
+            if enable_required is None and previous.get('device_type') == device_type \
+                    and previous.get('profile') == profile:
+                enable_required = previous.get('enable_required')
+            entries[ip] = {'device_type': device_type, 'enable_required': enable_required,
+                           'profile': profile, 'updated': time.time()}
+            self._dirty = True
+
+    def forget(self, ip):
+        # Drop ip so the next run probes every transport again
+        with self._lock:
+            if self._load().pop(ip, None) is not None:
+                self._dirty = True
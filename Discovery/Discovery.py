@@ -7,194 +7,579 @@ v0.2.2 - Added prompt for initials for file naming. Changed log file name to inc
 v0.2.3 - Added prompt for debug logging
 v0.2.4 - Added telnet support
 v0.2.5 - Added folders for inventory and config backups
+v0.2.6 - Collect devices in parallel with a bounded worker pool. Added --workers option.
+v0.2.7 - Replaced per-device OS ping with a TCP/ICMP reachability sweep of the whole list before login
+v0.2.8 - Cache the working transport and enable requirement per IP in transport_cache.json
+v0.2.9 - Moved show version parsing to version_parser.py with per-platform templates (IOS, IOS-XE, NX-OS)
+v0.3.0 - Incremental discovery. Skip running-config and inventory for devices unchanged since the last run.
+         Added --full and --no-state options.
+v0.3.1 - Added --backup-store to keep backups in a compressed, content-addressed store (see Common/backup_store.py)
+v0.3.2 - Stream DeviceList.csv through the reachability sweep into the worker pool. Invalid and duplicate rows are skipped.
+v0.3.3 - Journal each device's result to Discovery_Journal_*.jsonl. Added --resume to finish an interrupted run.
+v0.3.4 - Headless runs: --initials, --debug, --non-interactive and --config. Added --shard i/N and merge_reports.py.
+v0.3.5 - Per-device phase timings in Discovery_Timings_*.jsonl with a p50/p95/max summary at the end of the run
+v0.3.6 - Add every run to the indexed inventory database Discovery_Inventory.db (see inventory_db.py). Added --no-inventory.
+v0.3.7 - Added --pipeline to send each device's show commands back to back over one session (see pipeline.py)
+         and --commands to set the list of show commands collected.
+v0.3.8 - Logins go through a scheduler capping them overall and per site, with backoff, a per-host circuit breaker
+         and fewer logins at once when AAA errors rise (see Common/login_scheduler.py). Added --max-logins and
+         --logins-per-site. The error column starts with the failure cause (auth, timeout, refused, ...).
+v0.3.9 - Connect, login and command timeouts per device, learned from its measured round trips, command times and
+         output sizes and kept in timeouts.json (see Common/timeouts.py), instead of netmiko's fixed defaults.
+v0.4.0 - Added --targets and --exclude to sweep CIDR blocks, ranges and addresses generated as they are probed
+         instead of a DeviceList.csv, and --credentials for credential profiles tried in order (also used for
+         DeviceList.csv rows without credentials). A device reached over several addresses is collected once,
+         by serial number (see Common/targets.py).
+v0.4.1 - Index the saved running-configs in Discovery_ConfigIndex.db at the end of a run, for fleet-wide change,
+         line search and diff reports (see config_index.py). Added --no-config-index.
 """
 
-import os, csv, re, time, logging
-from datetime import datetime, timedelta
+import os, sys, csv, time, logging, argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from netmiko import ConnectHandler
+from netmiko.exceptions import ReadTimeout
 
-# set starting time
-start = time.time()
-
-# define variables
-ip_list = []
-user_list = []
-pass_list = []
-secret_list = []
-count = 0
-
-
-def connect(ip, user, password, secret):
-    # try ssh
-    logging.info(f'Trying to connect to {ip} over SSH')
-    cisco = {
-        'device_type': 'cisco_ios',
-        'ip': ip,
-        'username': user,
-        'password': password,
-        'secret': secret
-    }
-    try:
-        return ConnectHandler(**cisco)
-    except Exception:
-        try:
-            # try telnet
-            logging.info(f'Trying to connect to {ip} over telnet')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Common.reachability import iter_sweep, DEFAULT_TIMEOUT
+from Common.transport_cache import TransportCache
+from Common.timeouts import TimeoutCache, LOGIN
+from Common.backup_store import BackupStore
+from Common.device_list import iter_devices
+from Common.journal import RunJournal, load_journal, completed, latest_journal
+from Common.settings import parse_args_with_config, parse_shard, shard_suffix
+from Common.timing import TimingRecorder, NULL_TIMER
+from Common.login_scheduler import LoginScheduler, LoginError, describe_failure, most_telling, DEFAULT_MAX_LOGINS, \
+    DEFAULT_PER_SITE, AUTH
+from Common.targets import Credential, SerialClaims, parse_target_list, parse_exclude_list, iter_targets, \
+    target_count, load_credentials
+from version_parser import parse_show_version
+from state_store import StateStore, LAST_CHANGE_COMMAND, parse_last_change, config_hash
+from inventory_db import InventoryDB
+from config_index import ConfigIndex
+from pipeline import send_pipelined, PipelineError
+
+# default number of devices collected at the same time
+DEFAULT_WORKERS = 20
+
+# netmiko device types tried in order when the transport cache has nothing for a device
+TRANSPORTS = {'cisco_ios': 'SSH', 'cisco_ios_telnet': 'telnet'}
+
+# TCP port of each transport, also probed by the reachability sweep
+PORTS = {'cisco_ios': 22, 'cisco_ios_telnet': 23}
+
+# show commands collected from every device. show version is parsed, show running-config is the config
+# backup and the output of every other command goes to the inventory backup.
+DEFAULT_COMMANDS = ('show version', 'show running-config', 'show inventory')
+
+# timing phase of commands not named after themselves
+PHASE_NAMES = {LAST_CHANGE_COMMAND: 'change check'}
+
+# folders for text file backups
+BACKUP_FOLDERS = {'config': 'DeviceConfigs', 'inventory': 'DeviceInventories'}
+
+# transport (and enable requirement) that last worked per IP, kept between runs
+transport_cache = TransportCache()
+
+# caps, backoff and circuit breaker for every login of the run, set up by main()
+login_scheduler = LoginScheduler()
+
+# round trips, command times and output sizes per IP, kept between runs to derive the session timeouts
+session_timeouts = TimeoutCache()
+
+
+def connect(ip, credentials, open_ports=None):
+    # Connect over the transport that worked last time first, then fall back to the others.
+    # credentials is a list of Credentials tried in turn on each transport until one is accepted,
+    # the one that worked last time first.
+    # open_ports are the ports that answered the reachability sweep, if known; a transport whose port
+    # did not answer is still tried, but a timeout on it is not retried.
+    # Raises the LoginError that best explains the failure if no transport works.
+    errors = []
+    credentials = transport_cache.order_profiles(ip, credentials)
+    for device_type in transport_cache.order(ip, TRANSPORTS):
+        retries = 0 if open_ports is not None and PORTS[device_type] not in open_ports else None
+        for number, credential in enumerate(credentials, 1):
+            logging.info(f'Trying to connect to {ip} over {TRANSPORTS[device_type]} as {credential.name}')
             cisco = {
-                'device_type': 'cisco_ios_telnet',
+                'device_type': device_type,
                 'ip': ip,
-                'username': user,
-                'password': password,
-                'secret': secret
+                'port': PORTS[device_type],
+                'username': str(credential.username),
+                'password': str(credential.password),
+                'secret': str(credential.enablesecret),
+                'conn_timeout': session_timeouts.connect_timeout(ip),
+                'banner_timeout': session_timeouts.command_timeout(ip, LOGIN),
+                'auth_timeout': session_timeouts.command_timeout(ip, LOGIN)
             }
-            return ConnectHandler(**cisco)
-        except Exception:
-            pass
+            try:
+                net_connect = login_scheduler.login(ip, lambda: timed_login(ip, cisco), probing=number < len(credentials),
+                                                    transport=device_type, retries=retries)
+            except LoginError as e:
+                logging.info(f'{TRANSPORTS[device_type]} login to {ip} as {credential.name} failed: {e}')
+                errors.append(e)
+                # a rejected profile moves on to the next one; anything else to the next transport
+                if e.cause == AUTH:
+                    continue
+                break
+            transport_cache.record(ip, device_type, profile=credential.name)
+            return net_connect
+    transport_cache.forget(ip)
+    raise most_telling(errors)
 
 
-while True:
-    initials = input('Enter your initials (max 3): ')
-    if not initials.isalpha() or len(initials) > 3:
-        print('Try again.')
-    else:
-        break
+def timed_login(ip, cisco):
+    # ConnectHandler(**cisco), learning how long the login took
+    started = time.monotonic()
+    net_connect = ConnectHandler(**cisco)
+    session_timeouts.observe_command(ip, LOGIN, time.monotonic() - started, 0)
+    return net_connect
 
-while True:
-    debug_level = input('Enable debugging? (y/n): ')
-    if not debug_level == 'y' and not debug_level == 'n':
-        print('Try again.')
-    elif debug_level == 'y':
-        print('logging level set to debug')
-        logging.basicConfig(filename=f'Discovery_Log_{time.strftime("%m_%d_%Y_%H%M%S")}.txt', level=logging.DEBUG,
-                            format='%(asctime)s:%(levelname)s:%(message)s')
-        break
-    else:
-        logging.basicConfig(filename=f'Discovery_Log_{time.strftime("%m_%d_%Y_%H%M%S")}.txt', level=logging.INFO,
-                            format='%(asctime)s:%(levelname)s:%(message)s')
-        break
-
-try:
-    logging.info('Creating subdirectories in working directory')
-    os.mkdir('DeviceConfigs')
-    os.mkdir('DeviceInventories')
-except Exception:
-    pass
-
-with open('DeviceList.csv') as csv_file:
-    print('Found DeviceList.csv Thank you.')
-    logging.info('Found DeviceList.csv. Thank you.')
-    csv_reader = csv.reader(csv_file, delimiter=',')
-    line_count = 0
-    for row in csv_reader:
-        if line_count == 0:
-            line_count += 1
-        else:
-            ip_list.append(row[0])
-            user_list.append(row[1])
-            pass_list.append(row[2])
-            secret_list.append(row[3])
-
-            line_count += 1
-    print('Found ' + str(len(ip_list)) + ' IP addresses.')
-    logging.info('Found ' + str(len(ip_list)) + ' IP addresses.')
-
-with open(f'Discovery_Report_{time.strftime("%m_%d_%Y_%H%M%S")}.csv', mode='a', newline='') as device_report:
-    device_report_writer = csv.writer(device_report, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-
-    for ip in ip_list:
-        print('PROGRESS: ' + str(count + 1) + '/' + str(len(ip_list)))
-        logging.info('PROGRESS: ' + str(count + 1) + '/' + str(len(ip_list)))
-
-        # ping with OS and look for Received = 4
-        ping_response = os.popen(f"ping {ip}").read()
-        if f"Received = 4" in ping_response:
-            logging.info(f'{ip} is reachable.')
+
+def save_backup(kind, hostname, initials, output, backup_store=None):
+    # Save a 'config' or 'inventory' backup either to the backup store or as a text file
+    # in DeviceConfigs/DeviceInventories (falling back to the working directory)
+    date = time.strftime("%m_%d_%Y")
+    if backup_store is not None:
+        backup_store.put(kind, hostname, date, initials, output + '\n')
+        return
+    folder = BACKUP_FOLDERS[kind]
+    try:
+        backup_file = open(f'{folder}/{hostname}_{kind}_{date}_{initials}.txt', "w")
+    except Exception:
+        backup_file = open(f'{hostname}_{kind}_{date}_{initials}.txt', "w")
+    print(output, file=backup_file)
+    backup_file.close()
+
+
+def update_config_index(backup_store=None):
+    # Add the config backups not indexed yet, from the backup store or the DeviceConfigs folder, to the
+    # config index. Returns the number of backups added.
+    index = ConfigIndex()
+    try:
+        if backup_store is not None:
+            return index.update_store(backup_store)
+        if not os.path.isdir(BACKUP_FOLDERS['config']):
+            return 0
+        return index.update_folder(BACKUP_FOLDERS['config'])
+    finally:
+        index.close()
+
+
+def run_commands(net_connect, commands, pipeline=False, setup=True, timer=NULL_TIMER):
+    # Return {command: output} for commands, sent one at a time or pipelined over the session.
+    # setup sets terminal length and width ahead of the first pipeline of a session.
+    # Each command may take as long as session_timeouts allows it on the device; its time and size are learned,
+    # and so is a timeout running out, which the next run waits longer than.
+    ip = net_connect.host
+    if pipeline:
+        timeouts = {command: session_timeouts.command_timeout(ip, command) for command in commands}
+        with timer.phase('pipeline'):
+            try:
+                outputs = send_pipelined(net_connect, commands, setup=setup, read_timeout=sum(timeouts.values()))
+            except PipelineError:
+                for command, timeout in timeouts.items():
+                    session_timeouts.observe_timeout(ip, command, timeout)
+                raise
+        for command, output in outputs.items():
+            session_timeouts.observe_command(ip, command, None, len(output))
+        return outputs
+    outputs = {}
+    for command in commands:
+        with timer.phase(PHASE_NAMES.get(command, command)):
+            timeout = session_timeouts.command_timeout(ip, command)
+            started = time.monotonic()
             try:
-                logging.info(f'Trying to connect to {ip}...')
+                outputs[command] = net_connect.send_command(command, read_timeout=timeout)
+            except ReadTimeout:
+                session_timeouts.observe_timeout(ip, command, timeout)
+                raise
+            session_timeouts.observe_command(ip, command, time.monotonic() - started, len(outputs[command]))
+    return outputs
 
-                # connect to device
-                try:
-                    net_connect = connect(ip, str(user_list[count]), str(pass_list[count]), str(secret_list[count]))
-                except:
-                    net_connect = connect(ip, str(user_list[count]), str(pass_list[count]), '')
-
-                if net_connect.check_enable_mode is False:
-                    logging.info(f'Not in enable mode on {ip}. Enabling.')
-                    net_connect.enable()
-
-                # execute show version on router and save output to output object
-                output = net_connect.send_command('show version')
-
-                # finding hostname in output using regular expressions
-                regex_hostname = re.compile(r'(\S+)\suptime')
-                hostname = regex_hostname.findall(output)
-                logging.debug(f'hostname is {hostname}')
-
-                # finding uptime in output using regular expressions
-                regex_uptime = re.compile(r'\S+\suptime\sis\s(.+)')
-                uptime = regex_uptime.findall(output)
-                logging.debug(f'uptime is {uptime}')
-                regex_uptime_years = re.compile(r'(\S)\syear')
-                regex_uptime_weeks = re.compile(r'(\d+)\sweek')
-                regex_uptime_days = re.compile(r'(\S)\sday')
-                uptime_years = regex_uptime_years.findall(str(uptime))
-                uptime_weeks = regex_uptime_weeks.findall(str(uptime))
-                uptime_days = regex_uptime_days.findall(str(uptime))
-                days_ago = 0
-                if len(uptime_years) > 0:
-                    days_ago = days_ago + (int(str(uptime_years[0])) * 365)
-                if len(uptime_weeks) > 0:
-                    days_ago = days_ago + (int(str(uptime_weeks[0])) * 7)
-                if len(uptime_days) > 0:
-                    days_ago = days_ago + int(str(uptime_days[0]))
-                boot_date = (datetime.today() - timedelta(days=days_ago)).strftime('%m-%d-%Y')
-                logging.debug(f'boot_date is {boot_date}')
-
-                # finding version in output using regular expressions
-                regex_version = re.compile(r'Cisco\sIOS\sSoftware.+Version\s([^,]+)')
-                version = regex_version.findall(output)
-                logging.debug(f'version is {version}')
-
-                # finding serial in output using regular expressions
-                regex_serial = re.compile(r'Processor\sboard\sID\s(\S+)')
-                serial = regex_serial.findall(output)
-                logging.debug(f'serial is {serial}')
-
-                # finding model in output using regular expressions
-                regex_model = re.compile(r'[Cc]isco\s(\S+).*memory.')
-                model = regex_model.findall(output)
-                logging.debug(f'model is {model}')
-
-                # save running-config
-                logging.info(f'Saving running-config for {ip}.')
+
+def collect_device(ip, credentials, initials, state_store=None, full_refresh=False, backup_store=None,
+                   timer=NULL_TIMER, commands=DEFAULT_COMMANDS, pipeline=False, serials=None, open_ports=None):
+    # Collect commands (show version, running-config and inventory by default) from a single device.
+    # Returns the Discovery_Report row for the device. Runs in a worker thread.
+    # Only called for devices that answered the reachability sweep.
+    # With a state_store, running-config and inventory are skipped when the device is unchanged
+    # since its last full collection, unless full_refresh is set.
+    # With a backup_store, backups go to the store instead of text files.
+    # Each phase of the collection is timed with timer.
+    # With pipeline, commands are written back to back in at most two batches: show version (and the
+    # change check), then the rest when the device has to be collected.
+    # With serials (a SerialClaims), a device whose serial number was already collected over another
+    # address only gets its show version row.
+    # open_ports are the ports that answered the reachability sweep (see connect()).
+    net_connect = None
+    try:
+        logging.info(f'Trying to connect to {ip}...')
+
+        # connect to device
+        with timer.phase('connect'):
+            net_connect = connect(ip, credentials, open_ports)
+
+        # skip the enable mode check when the cache already knows the answer
+        with timer.phase('enable'):
+            enable_required = transport_cache.enable_required(ip)
+            if enable_required is None:
+                enable_required = not net_connect.check_enable_mode()
+            if enable_required:
+                logging.info(f'Not in enable mode on {ip}. Enabling.')
+                net_connect.enable()
+        transport_cache.record(ip, net_connect.device_type, enable_required)
+
+        # show version first, with the one cheap command that tells whether the config changed since the
+        # last full collection. Without a state store everything is collected in one go.
+        first = ['show version'] + ([LAST_CHANGE_COMMAND] if state_store is not None else [])
+        rest = [command for command in commands if command != 'show version']
+        if state_store is None:
+            first += rest
+            rest = []
+        outputs = run_commands(net_connect, first, pipeline, timer=timer)
+
+        # parse hostname, uptime, version, serial and model with the platform template
+        with timer.phase('parse'):
+            info = parse_show_version(outputs['show version'])
+        logging.debug(f'show version for {ip} parsed as {info}')
+        if info.hostname is None:
+            raise ValueError('Could not find hostname in show version')
+        hostname = info.hostname
+        row = [hostname, ip, info.boot_date or '-', info.version or '-', info.serial or '-', info.model or '-']
+
+        if serials is not None:
+            owner = serials.claim(info.serial, ip)
+            if owner != ip:
+                logging.info(f'{ip} is serial {info.serial}, already collected over {owner}. Skipping the rest.')
+                return row
+
+        last_change = None
+        if state_store is not None:
+            last_change = parse_last_change(outputs[LAST_CHANGE_COMMAND])
+            logging.debug(f'last configuration change on {ip} is {last_change}')
+            if not full_refresh and state_store.unchanged(ip, info, last_change):
+                logging.info(f'{ip} is unchanged since the last run. Skipping running-config and inventory.')
+                return row
+
+        if rest:
+            outputs.update(run_commands(net_connect, rest, pipeline, setup=False, timer=timer))
+
+        # save running-config
+        config_digest = None
+        if 'show running-config' in outputs:
+            logging.info(f'Saving running-config for {ip}.')
+            with timer.phase('write backups'):
+                save_backup('config', hostname, initials, outputs['show running-config'], backup_store)
+                config_digest = config_hash(outputs['show running-config'])
+
+        # save inventory, followed by any other commands under a '! command' line each
+        others = [command for command in commands if command not in ('show version', 'show running-config')]
+        if others:
+            logging.info(f'Saving inventory for {ip}.')
+            sections = [outputs['show inventory']] if 'show inventory' in others else []
+            sections += [f'! {command}\n{outputs[command]}' for command in others if command != 'show inventory']
+            with timer.phase('write backups'):
+                save_backup('inventory', hostname, initials, '\n'.join(sections), backup_store)
+        if state_store is not None:
+            state_store.update(ip, info, last_change, config_digest)
+        return row
+    except Exception as e:
+        return ['-', ip, '-', '-', '-', '-', describe_failure(e)]
+    finally:
+        if net_connect is not None:
+            with timer.phase('disconnect'):
                 try:
-                    show_run = open(f'DeviceConfigs/{hostname[0]}_config_{time.strftime("%m_%d_%Y")}_{initials}.txt',
-                                    "w")
+                    net_connect.disconnect()
                 except Exception:
-                    show_run = open(f'{hostname[0]}_config_{time.strftime("%m_%d_%Y")}_{initials}.txt', "w")
-                output = net_connect.send_command('show running-config')
-                print(output, file=show_run)
-                show_run.close()
+                    pass
 
-                # save inventory
-                logging.info(f'Saving inventory for {ip}.')
-                try:
-                    show_inventory = open(f'DeviceInventories/{hostname[0]}_inventory_{time.strftime("%m_%d_%Y")}'
-                                          f'_{initials}.txt', "w")
-                except:
-                    show_inventory = open(f'{hostname[0]}_inventory_{time.strftime("%m_%d_%Y")}_{initials}.txt', "w")
-                output = net_connect.send_command('show inventory')
-                print(output, file=show_inventory)
-                show_inventory.close()
-
-                device_report_writer.writerow([hostname[0], ip, boot_date, version[0], serial[0], model[0]])
-            except Exception as e:
-                device_report_writer.writerow(['-', ip, '-', '-', '-', '-', e])
-            count += 1
+
+def parse_commands(value):
+    # argparse type for --commands: a comma separated list that must include show version
+    commands = tuple(dict.fromkeys(command.strip() for command in value.split(',') if command.strip()))
+    if 'show version' not in commands:
+        raise argparse.ArgumentTypeError('the command list must include show version')
+    return commands
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report device information for each IP listed in DeviceList.csv '
+                                                 'or covered by --targets.')
+    parser.add_argument('--config', metavar='FILE',
+                        help='INI file with a [discovery] section holding any of these options')
+    parser.add_argument('--initials', help='initials used in backup file names (max 3 letters)')
+    parser.add_argument('--debug', action='store_true', default=None, help='log at debug level')
+    parser.add_argument('--non-interactive', action='store_true',
+                        help='never prompt; fail if a required setting is missing')
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help='only collect shard i of N of DeviceList.csv or --targets, split by IP hash')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'number of devices to collect at the same time (default {DEFAULT_WORKERS})')
+    parser.add_argument('--probe-timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'seconds to wait for each device in the reachability sweep (default {DEFAULT_TIMEOUT})')
+    parser.add_argument('--full', action='store_true',
+                        help='download running-config and inventory from every device, even if unchanged')
+    parser.add_argument('--no-state', action='store_true',
+                        help='do not use or update the device state store (Discovery_State.db)')
+    parser.add_argument('--no-inventory', action='store_true',
+                        help='do not add this run to the inventory database (Discovery_Inventory.db)')
+    parser.add_argument('--no-config-index', action='store_true',
+                        help='do not index the saved running-configs in Discovery_ConfigIndex.db')
+    parser.add_argument('--backup-store', action='store_true',
+                        help='save backups to the compressed store in DeviceBackups instead of text files')
+    parser.add_argument('--resume', nargs='?', const='latest', metavar='JOURNAL',
+                        help='resume an interrupted run from its journal (default: the newest Discovery_Journal_*.jsonl)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='send each device\'s show commands back to back over one session instead of one at a time')
+    parser.add_argument('--commands', type=parse_commands, default=DEFAULT_COMMANDS, metavar='LIST',
+                        help=f'comma separated show commands to collect (default {",".join(DEFAULT_COMMANDS)})')
+    parser.add_argument('--max-logins', type=int, default=DEFAULT_MAX_LOGINS,
+                        help=f'most logins at the same time; lowered automatically while AAA errors are high '
+                             f'(default {DEFAULT_MAX_LOGINS})')
+    parser.add_argument('--logins-per-site', type=int, default=DEFAULT_PER_SITE,
+                        help=f'most logins at the same time per /24 (default {DEFAULT_PER_SITE})')
+    parser.add_argument('--targets', type=parse_target_list, metavar='LIST',
+                        help='sweep these comma separated CIDR blocks, ranges (a.b.c.d-e) and addresses, or those '
+                             'listed in @FILE, instead of DeviceList.csv. Needs --credentials.')
+    parser.add_argument('--exclude', type=parse_exclude_list, metavar='LIST',
+                        help='CIDR blocks, ranges and addresses (or @FILE) left out of --targets')
+    parser.add_argument('--credentials', metavar='FILE',
+                        help='INI file of credential profiles tried in order on --targets and on DeviceList.csv '
+                             'rows without a username and password')
+    args = parse_args_with_config(parser, 'discovery', argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.max_logins < 1 or args.logins_per_site < 1:
+        parser.error('--max-logins and --logins-per-site must be at least 1')
+    profiles = []
+    if args.credentials:
+        try:
+            profiles = load_credentials(args.credentials)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.targets and not profiles:
+        parser.error('--targets needs --credentials')
+    if args.exclude and not args.targets:
+        parser.error('--exclude only applies to --targets')
+    global login_scheduler
+    login_scheduler = LoginScheduler(args.max_logins, args.logins_per_site)
+    if args.initials is not None and (not args.initials.isalpha() or len(args.initials) > 3):
+        parser.error('--initials must be 1 to 3 letters')
+
+    # set starting time
+    start = time.time()
+    run_stamp = time.strftime("%m_%d_%Y_%H%M%S") + shard_suffix(args.shard)
+
+    # rows of devices finished by the run being resumed, by IP
+    finished = {}
+    if args.resume:
+        if args.resume == 'latest':
+            journal_path = latest_journal('Discovery_Journal', shard_suffix(args.shard))
+        else:
+            journal_path = args.resume
+        if journal_path is None or not os.path.isfile(journal_path):
+            parser.error('no journal found to resume')
+        header, journal_devices = load_journal(journal_path)
+        if header.get('shard') != (list(args.shard) if args.shard else None):
+            parser.error(f'{journal_path} is from a different --shard')
+        finished = completed(journal_devices)
+        initials = header['initials']
+        # keep adding to the inventory run of the interrupted run
+        inventory_stamp = header.get('run', run_stamp)
+        print(f'Resuming {journal_path}: {len(finished)} devices already done.')
+    else:
+        journal_path = f'Discovery_Journal_{run_stamp}.jsonl'
+        inventory_stamp = run_stamp
+        initials = args.initials
+        while initials is None:
+            if args.non_interactive:
+                parser.error('--initials is required with --non-interactive')
+            initials = input('Enter your initials (max 3): ')
+            if not initials.isalpha() or len(initials) > 3:
+                print('Try again.')
+                initials = None
+
+    debug = args.debug
+    while debug is None:
+        if args.non_interactive:
+            debug = False
+            break
+        debug_level = input('Enable debugging? (y/n): ')
+        if not debug_level == 'y' and not debug_level == 'n':
+            print('Try again.')
         else:
-            print(f'No reply from {ip}.')
-            device_report_writer.writerow(['-', ip, '-', '-', '-', '-', 'No ping reply'])
+            debug = debug_level == 'y'
+    if debug:
+        print('logging level set to debug')
+    logging.basicConfig(filename=f'Discovery_Log_{run_stamp}.txt', level=logging.DEBUG if debug else logging.INFO,
+                        format='%(asctime)s:%(levelname)s:%(threadName)s:%(message)s')
+    if args.shard is not None:
+        logging.info(f'Running shard {args.shard[0]} of {args.shard[1]}')
+
+    try:
+        logging.info('Creating subdirectories in working directory')
+        os.mkdir('DeviceConfigs')
+        os.mkdir('DeviceInventories')
+    except Exception:
+        pass
+
+    state_store = None if args.no_state else StateStore()
+    backup_store = BackupStore() if args.backup_store else None
+    inventory = None if args.no_inventory else InventoryDB()
+    inventory_run = None if inventory is None else inventory.start_run(inventory_stamp)
+
+    if args.targets:
+        print(f'Sweeping {target_count(args.targets, args.exclude or ())} addresses with {len(profiles)} '
+              f'credential profiles.')
+        logging.info(f'Sweeping {target_count(args.targets, args.exclude or ())} addresses with profiles '
+                     f'{", ".join(profile.name for profile in profiles)}')
+    elif not os.path.isfile('DeviceList.csv'):
+        print('DeviceList.csv not found in the working directory.')
+        logging.error('DeviceList.csv not found in the working directory.')
+        sys.exit(1)
+    else:
+        print('Found DeviceList.csv Thank you.')
+        logging.info('Found DeviceList.csv. Thank you.')
+
+    # devices read from the CSV or generated from the targets that are waiting on their reachability probe, by IP
+    pending = {}
+
+    def targets():
+        if args.targets:
+            for ip in iter_targets(args.targets, args.exclude or (), args.shard):
+                if ip not in finished:
+                    pending[ip] = {'ip': ip, 'credentials': profiles}
+                    yield ip
+            return
+        # with profiles, rows may leave the credentials to them
+        required = ('ip',) if profiles else ('ip', 'username', 'password')
+        for device in iter_devices('DeviceList.csv', required=required, shard=args.shard):
+            if device['ip'] in finished:
+                continue
+            if device['username'] and device['password']:
+                device['credentials'] = [Credential('DeviceList.csv', device['username'], device['password'],
+                                                    device['enablesecret'])]
+            else:
+                device['credentials'] = profiles
+            pending[device['ip']] = device
+            yield device['ip']
+
+    # serial numbers already collected, so a device reached over several addresses is collected once
+    serials = SerialClaims({row[4]: row[1] for row in finished.values() if row[4] != '-'})
+
+    # every device's result goes to the journal before the report so an interrupted run can be resumed
+    journal = RunJournal(journal_path, header={'initials': initials, 'shard': args.shard, 'run': inventory_stamp})
+    timings = TimingRecorder(f'Discovery_Timings_{run_stamp}.jsonl')
+    logging.info(f'Journal is {journal_path}')
+
+    with open(f'Discovery_Report_{run_stamp}.csv', mode='a', newline='') as device_report:
+        device_report_writer = csv.writer(device_report, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        count = 0
+        reachable = 0
+        # swept target addresses that did not answer; they are left out of the report
+        silent = 0
+
+        # carry the rows of a resumed run over into this report
+        for row in finished.values():
+            device_report_writer.writerow(row)
+            if inventory is not None:
+                inventory.add(inventory_run, row)
             count += 1
-    print('PROGRESS: COMPLETE')
-    logging.info('PROGRESS: COMPLETE')
-    logging.info('Runtime - ' + str(time.time() - start))
+
+        def write_row(ip, row):
+            nonlocal count
+            # rows with an error column are failures and are redone on --resume
+            journal.record(ip, 'failed' if len(row) > 6 else 'done', row)
+            device_report_writer.writerow(row)
+            if inventory is not None:
+                inventory.add(inventory_run, row)
+            count += 1
+            print('PROGRESS: ' + str(count) + ' (' + ip + ')')
+            logging.info('PROGRESS: ' + str(count) + ' (' + ip + ')')
+
+        def write_result(future):
+            timer = futures.pop(future)
+            ip = timer.key
+            try:
+                row = future.result()
+            except Exception as e:
+                row = ['-', ip, '-', '-', '-', '-', describe_failure(e)]
+            timings.finish(timer, 'failed' if len(row) > 6 else 'done')
+            write_row(ip, row)
+
+        # rows stream from the CSV through the reachability sweep straight into the worker pool.
+        # workers only collect; this thread is the single writer of the report.
+        # each future is keyed by IP so rows stay correct when devices finish out of order,
+        # and at most two futures per worker are queued so memory stays flat for large lists.
+        logging.info(f'Collecting devices with {args.workers} workers')
+        executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='collect')
+        futures = {}
+        try:
+            for result in iter_sweep(targets(), ports=tuple(PORTS.values()), timeout=args.probe_timeout):
+                device = pending.pop(result.ip)
+                ip = device['ip']
+                if not result.reachable and args.targets:
+                    silent += 1
+                    logging.debug(f'No reply from {ip}: {result.error}')
+                    continue
+                if not result.reachable:
+                    print(f'No reply from {ip}.')
+                    logging.info(f'No reply from {ip}: {result.error}')
+                    write_row(ip, ['-', ip, '-', '-', '-', '-', 'No ping reply'])
+                    continue
+                reachable += 1
+                logging.info(f'{ip} is reachable via {result.method} in {result.rtt * 1000:.1f}ms.')
+                while len(futures) >= args.workers * 2:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        write_result(future)
+                timer = timings.device(ip)
+                timer.add('probe', result.rtt)
+                session_timeouts.observe_rtt(ip, result.rtt)
+                futures[executor.submit(collect_device, ip, device['credentials'], initials, state_store, args.full,
+                                        backup_store, timer, args.commands, args.pipeline, serials,
+                                        result.open_ports)] = timer
+            for future in as_completed(list(futures)):
+                write_result(future)
+        except KeyboardInterrupt:
+            # drop queued devices; they are still pending in the journal
+            executor.shutdown(wait=False, cancel_futures=True)
+            journal.close()
+            timings.close()
+            if inventory is not None:
+                inventory.close()
+            transport_cache.save()
+            session_timeouts.save()
+            print(f'Interrupted. Run again with --resume {journal_path} to finish the remaining devices.')
+            logging.info(f'Interrupted. Resume with --resume {journal_path}')
+            sys.exit(130)
+        executor.shutdown()
+        journal.close()
+        timings.close()
+        print(f'Found {count + silent} IP addresses. {reachable} were reachable.')
+        logging.info(f'Found {count + silent} IP addresses. {reachable} were reachable.')
+        for line in login_scheduler.summary():
+            print(line)
+            logging.info(line)
+        transport_cache.save()
+        session_timeouts.save()
+        if not args.no_config_index and 'show running-config' in args.commands:
+            indexed = update_config_index(backup_store)
+            print(f'Indexed {indexed} new or changed config backups in the config index.')
+            logging.info(f'Indexed {indexed} new or changed config backups in the config index.')
+        if state_store is not None:
+            state_store.close()
+        if backup_store is not None:
+            backup_store.close()
+        if inventory is not None:
+            inventory.close()
+        print('PROGRESS: COMPLETE')
+        logging.info('PROGRESS: COMPLETE')
+        logging.info('Runtime - ' + str(time.time() - start))
+        for line in timings.summary():
+            print(line)
+            logging.info(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark for version_parser.parse_show_version
+Runs the parser over the captured 'show version' outputs in corpus/show_version, checks the
+results against corpus/show_version/expected.json and reports parses per second overall and
+per platform. Use --min-rate to fail (exit code 1) when throughput drops below a threshold.
+
+Usage: python bench_version_parser.py [--iterations N] [--min-rate PARSES_PER_SECOND]
+"""
+
+import os, sys, json, glob, time, argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+from version_parser import parse_show_version
+
+CORPUS = os.path.join(HERE, 'corpus', 'show_version')
+
+
+def load_corpus(path=CORPUS):
+    # Return a list of (name, output) for every captured output in the corpus
+    corpus = []
+    for file_name in sorted(glob.glob(os.path.join(path, '*.txt'))):
+        with open(file_name) as capture:
+            corpus.append((os.path.basename(file_name), capture.read()))
+    return corpus
+
+
+def check_corpus(corpus, path=CORPUS):
+    # Compare parsed fields with expected.json and return a list of mismatch messages
+    with open(os.path.join(path, 'expected.json')) as expected_file:
+        expected = json.load(expected_file)
+    failures = []
+    for name, output in corpus:
+        result = parse_show_version(output)._asdict()
+        for field, value in expected.get(name, {}).items():
+            if result[field] != value:
+                failures.append(f'{name}: {field} is {result[field]!r}, expected {value!r}')
+    return failures
+
+
+def bench(corpus, iterations):
+    # Return (total parses per second, {platform: microseconds per parse})
+    per_platform = {}
+    total_time = 0.0
+    for name, output in corpus:
+        platform = parse_show_version(output).platform
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parse_show_version(output)
+        elapsed = time.perf_counter() - start
+        total_time += elapsed
+        per_platform.setdefault(platform, []).append(elapsed / iterations * 1e6)
+    rate = len(corpus) * iterations / total_time
+    return rate, {platform: sum(times) / len(times) for platform, times in per_platform.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the show version parser over the captured corpus.')
+    parser.add_argument('--iterations', type=int, default=2000, help='parses per corpus file (default 2000)')
+    parser.add_argument('--min-rate', type=float, default=0, help='fail if parses per second fall below this')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    failures = check_corpus(corpus)
+    for failure in failures:
+        print('MISMATCH: ' + failure)
+
+    rate, per_platform = bench(corpus, args.iterations)
+    print(f'{len(corpus)} outputs x {args.iterations} iterations: {rate:,.0f} parses/s')
+    for platform, micros in sorted(per_platform.items()):
+        print(f'  {platform:<8} {micros:8.1f} us/parse')
+
+    if failures or rate < args.min_rate:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""
+Fleet-wide change index of running-config backups
+Indexes the config backups written by Discovery.py, from the DeviceConfigs folder or the
+--backup-store, into Discovery_ConfigIndex.db. Every distinct line gets a 64-bit hash and an id,
+every distinct config is stored once as its list of line ids, and each line is indexed to the
+configs holding it. "What changed since date X" and "which devices contain line Y" are then
+answered from the index without reading any backup again, and a unified diff of any two backups
+of a device is rebuilt from it. Updates are incremental: only backups that are new or changed
+since the last update are read.
+
+Usage:
+    python config_index.py update [--configs DeviceConfigs | --backup-store DeviceBackups]
+    python config_index.py changes --since YYYY-MM-DD [--until YYYY-MM-DD] [--hostname H] [--lines]
+    python config_index.py contains LINE [--substring] [--all-backups]
+    python config_index.py diff HOSTNAME [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--context 3]
+"""
+
+import os, sys, sqlite3, difflib, hashlib, argparse
+from array import array
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Common.backup_store import BackupStore, BACKUP_FILE_NAME, DEFAULT_ROOT
+from state_store import VOLATILE
+
+DEFAULT_PATH = 'Discovery_ConfigIndex.db'
+
+# host parameters per SQLite statement when looking up many line hashes at once
+_BATCH = 500
+
+
+def line_hash(line):
+    # 64-bit hash of a config line as a signed integer, the way SQLite stores it
+    return int.from_bytes(hashlib.blake2b(line.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+def split_config(text):
+    # Lines of a config as indexed: trailing whitespace removed, trailing blank lines dropped
+    lines = [line.rstrip() for line in text.splitlines()]
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+class ConfigIndex:
+    # SQLite index of config backups. Not thread-safe; one process updates it at a time.
+    def __init__(self, path=DEFAULT_PATH):
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS lines (
+                id INTEGER PRIMARY KEY,
+                hash INTEGER NOT NULL UNIQUE,
+                text TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS contents (
+                id INTEGER PRIMARY KEY,
+                digest TEXT NOT NULL UNIQUE,
+                line_ids BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS content_lines (
+                line_id INTEGER NOT NULL,
+                content_id INTEGER NOT NULL,
+                PRIMARY KEY (line_id, content_id)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS backups (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL UNIQUE,
+                hostname TEXT NOT NULL,
+                date TEXT NOT NULL,
+                stamp TEXT NOT NULL,
+                content_id INTEGER NOT NULL REFERENCES contents (id));
+            CREATE INDEX IF NOT EXISTS backups_hostname ON backups (hostname, date);
+            CREATE INDEX IF NOT EXISTS backups_date ON backups (date);
+            CREATE INDEX IF NOT EXISTS backups_content ON backups (content_id);''')
+        self._db.commit()
+        # line ids by text looked up or added during this session
+        self._known_lines = {}
+
+    def _ids_of(self, lines):
+        # Return the line ids of lines, adding the lines the index does not know yet.
+        # Only lines new to this session are hashed and looked up.
+        hashes = {line_hash(line): line for line in set(lines) if line not in self._known_lines}
+        unknown = list(hashes)
+        for start in range(0, len(unknown), _BATCH):
+            batch = unknown[start:start + _BATCH]
+            for value, line_id in self._db.execute(
+                    f'SELECT hash, id FROM lines WHERE hash IN ({",".join("?" * len(batch))})', batch):
+                self._known_lines[hashes.pop(value)] = line_id
+        if hashes:
+            self._db.executemany('INSERT INTO lines (hash, text) VALUES (?, ?)', hashes.items())
+            new = list(hashes)
+            for start in range(0, len(new), _BATCH):
+                batch = new[start:start + _BATCH]
+                for value, line_id in self._db.execute(
+                        f'SELECT hash, id FROM lines WHERE hash IN ({",".join("?" * len(batch))})', batch):
+                    self._known_lines[hashes[value]] = line_id
+        return [self._known_lines[line] for line in lines]
+
+    def _content_id(self, digest, read_text):
+        # Return the id of the config with digest, reading it with read_text() only when it is new
+        found = self._db.execute('SELECT id FROM contents WHERE digest = ?', (digest,)).fetchone()
+        if found is not None:
+            return found[0]
+        line_ids = self._ids_of(split_config(read_text()))
+        cursor = self._db.execute('INSERT INTO contents (digest, line_ids) VALUES (?, ?)',
+                                  (digest, array('q', line_ids).tobytes()))
+        self._db.executemany('INSERT OR IGNORE INTO content_lines VALUES (?, ?)',
+                             ((line_id, cursor.lastrowid) for line_id in set(line_ids)))
+        return cursor.lastrowid
+
+    def _add(self, source, hostname, date, stamp, content_id):
+        self._db.execute('INSERT INTO backups (source, hostname, date, stamp, content_id) VALUES (?, ?, ?, ?, ?) '
+                         'ON CONFLICT (source) DO UPDATE SET hostname = excluded.hostname, date = excluded.date, '
+                         'stamp = excluded.stamp, content_id = excluded.content_id',
+                         (source, hostname, date, stamp, content_id))
+
+    def update_folder(self, folder):
+        # Index the config backups in folder that are new or changed since the last update.
+        # Returns the number of backups indexed.
+        known = dict(self._db.execute('SELECT source, stamp FROM backups'))
+        count = 0
+        for file_name in sorted(os.listdir(folder)):
+            match = BACKUP_FILE_NAME.match(file_name)
+            if match is None or match['kind'] != 'config':
+                continue
+            path = os.path.join(folder, file_name)
+            status = os.stat(path)
+            stamp = f'{status.st_mtime_ns}:{status.st_size}'
+            if known.get(path) == stamp:
+                continue
+            with open(path, errors='replace') as backup:
+                text = backup.read()
+            content_id = self._content_id(hashlib.sha256(text.encode()).hexdigest(), lambda: text)
+            date = datetime.strptime(match['date'], '%m_%d_%Y').strftime('%Y-%m-%d')
+            self._add(path, match['hostname'], date, stamp, content_id)
+            count += 1
+        self._db.commit()
+        return count
+
+    def update_store(self, store):
+        # Index the config backups of a BackupStore that are new or changed since the last update.
+        # Blobs already indexed under their digest are not read again. Returns the number of backups indexed.
+        known = dict(self._db.execute('SELECT source, stamp FROM backups'))
+        count = 0
+        for _, hostname, date, initials, digest, _ in store.list(kind='config'):
+            source = f'{store.root}:{hostname}:{date}:{initials}'
+            if known.get(source) == digest:
+                continue
+            self._add(source, hostname, date, digest, self._content_id(digest, lambda: store.read_blob(digest)))
+            count += 1
+        self._db.commit()
+        return count
+
+    def _texts(self, line_ids):
+        # Return {line id: text} for line_ids
+        line_ids = list(set(line_ids))
+        texts = {}
+        for start in range(0, len(line_ids), _BATCH):
+            batch = line_ids[start:start + _BATCH]
+            texts.update(self._db.execute(f'SELECT id, text FROM lines WHERE id IN ({",".join("?" * len(batch))})',
+                                          batch))
+        return texts
+
+    def _content_lines(self, content_id):
+        # Return the line ids of a config in order
+        line_ids = array('q')
+        line_ids.frombytes(self._db.execute('SELECT line_ids FROM contents WHERE id = ?', (content_id,)).fetchone()[0])
+        return line_ids
+
+    def changes(self, since, until=None, hostname=None):
+        # Return (hostname, base date, new date, added lines, removed lines) for every device whose latest
+        # backup up to until (YYYY-MM-DD, inclusive) differs from its latest backup before since.
+        # base date is None for a device first backed up since then. Volatile lines are ignored.
+        query = 'SELECT hostname, date, content_id FROM backups WHERE 1 = 1'
+        parameters = []
+        if until is not None:
+            query += ' AND date <= ?'
+            parameters.append(until)
+        if hostname is not None:
+            query += ' AND hostname = ?'
+            parameters.append(hostname)
+        # the last row of a hostname on each side of since wins
+        base = {}
+        newest = {}
+        for name, date, content_id in self._db.execute(query + ' ORDER BY hostname, date, id', parameters):
+            (base if date < since else newest)[name] = (date, content_id)
+        results = []
+        for name, (date, content_id) in sorted(newest.items()):
+            base_date, base_content = base.get(name, (None, None))
+            if content_id == base_content:
+                continue
+            new_ids = set(self._content_lines(content_id))
+            old_ids = set() if base_content is None else set(self._content_lines(base_content))
+            texts = self._texts(new_ids ^ old_ids)
+            added = [texts[line_id] for line_id in new_ids - old_ids if not VOLATILE.match(texts[line_id])]
+            removed = [texts[line_id] for line_id in old_ids - new_ids if not VOLATILE.match(texts[line_id])]
+            if added or removed:
+                results.append((name, base_date, date, sorted(added), sorted(removed)))
+        return results
+
+    def contains(self, line, substring=False, all_backups=False):
+        # Return (hostname, date) of the backups holding line (compared without trailing whitespace,
+        # or anywhere in a line with substring), only the latest backup of each device unless all_backups
+        if substring:
+            escaped = line.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            line_ids = [row[0] for row in self._db.execute("SELECT id FROM lines WHERE text LIKE ? ESCAPE '\\'",
+                                                             (f'%{escaped}%',))]
+        else:
+            found = self._db.execute('SELECT id, text FROM lines WHERE hash = ?', (line_hash(line.rstrip()),)).fetchone()
+            line_ids = [found[0]] if found is not None and found[1] == line.rstrip() else []
+        if not line_ids:
+            return []
+        backups = 'backups'
+        if not all_backups:
+            backups = ('(SELECT * FROM backups AS b WHERE id = (SELECT id FROM backups WHERE hostname = b.hostname '
+                       'ORDER BY date DESC, id DESC LIMIT 1))')
+        results = set()
+        for start in range(0, len(line_ids), _BATCH):
+            batch = line_ids[start:start + _BATCH]
+            results.update(self._db.execute(
+                f'SELECT hostname, date FROM {backups} AS backups JOIN content_lines '
+                f'ON content_lines.content_id = backups.content_id '
+                f'WHERE content_lines.line_id IN ({",".join("?" * len(batch))})', batch))
+        return sorted(results)
+
+    def _backup(self, hostname, date=None, before=None):
+        # (date, content id) of the latest backup of hostname on or before date, or strictly before
+        # before with a content other than the content id before[1]
+        query = 'SELECT date, content_id FROM backups WHERE hostname = ?'
+        parameters = [hostname]
+        if date is not None:
+            query += ' AND date <= ?'
+            parameters.append(date)
+        if before is not None:
+            query += ' AND date < ? AND content_id != ?'
+            parameters += list(before)
+        return self._db.execute(query + ' ORDER BY date DESC, id DESC LIMIT 1', parameters).fetchone()
+
+    def diff(self, hostname, from_date=None, to_date=None, context=3):
+        # Return the unified diff of hostname's config from its backup on or before from_date (default: the
+        # last one before the to backup that differs) to its backup on or before to_date (default: latest).
+        # Raises KeyError when a backup is missing.
+        new = self._backup(hostname, to_date)
+        if new is None:
+            raise KeyError(f'No config backup for {hostname}' + (f' on or before {to_date}' if to_date else ''))
+        old = self._backup(hostname, from_date) if from_date is not None else self._backup(hostname, before=new)
+        if old is None:
+            raise KeyError(f'No earlier config backup for {hostname}' + (f' on or before {from_date}' if from_date else ''))
+        old_ids, new_ids = self._content_lines(old[1]), self._content_lines(new[1])
+        texts = self._texts(list(old_ids) + list(new_ids))
+        return ''.join(difflib.unified_diff([texts[line_id] + '\n' for line_id in old_ids],
+                                            [texts[line_id] + '\n' for line_id in new_ids],
+                                            f'{hostname} {old[0]}', f'{hostname} {new[0]}', n=context))
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index config backups and report changes across the fleet.')
+    parser.add_argument('--db', default=DEFAULT_PATH, help=f'index file (default {DEFAULT_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    update_parser = commands.add_parser('update', help='index new and changed config backups')
+    source = update_parser.add_mutually_exclusive_group()
+    source.add_argument('--configs', default='DeviceConfigs', help='folder of text backups (default DeviceConfigs)')
+    source.add_argument('--backup-store', nargs='?', const=DEFAULT_ROOT, metavar='ROOT',
+                        help=f'index the backup store instead (default {DEFAULT_ROOT})')
+    changes_parser = commands.add_parser('changes', help='devices whose config changed since a date')
+    changes_parser.add_argument('--since', required=True, help='compare with the last backup before YYYY-MM-DD')
+    changes_parser.add_argument('--until', help='compare the last backup on or before YYYY-MM-DD (default latest)')
+    changes_parser.add_argument('--hostname')
+    changes_parser.add_argument('--lines', action='store_true', help='print the added and removed lines')
+    contains_parser = commands.add_parser('contains', help='devices whose config has a line')
+    contains_parser.add_argument('line')
+    contains_parser.add_argument('--substring', action='store_true', help='match the text anywhere in a line')
+    contains_parser.add_argument('--all-backups', action='store_true', help='search every backup, not just the latest')
+    diff_parser = commands.add_parser('diff', help='unified diff of two config backups of a device')
+    diff_parser.add_argument('hostname')
+    diff_parser.add_argument('--from', dest='from_date',
+                             help='backup on or before YYYY-MM-DD (default the last different one before --to)')
+    diff_parser.add_argument('--to', dest='to_date', help='backup on or before YYYY-MM-DD (default latest)')
+    diff_parser.add_argument('--context', type=int, default=3, help='lines of context (default 3)')
+    args = parser.parse_args()
+
+    index = ConfigIndex(args.db)
+    try:
+        if args.command == 'update':
+            if args.backup_store:
+                store = BackupStore(args.backup_store)
+                try:
+                    print(f'Indexed {index.update_store(store)} new or changed backups from {args.backup_store}')
+                finally:
+                    store.close()
+            else:
+                print(f'Indexed {index.update_folder(args.configs)} new or changed backups from {args.configs}')
+        elif args.command == 'changes':
+            results = index.changes(args.since, args.until, args.hostname)
+            for hostname, base_date, date, added, removed in results:
+                print(f'{hostname},{base_date or "new"},{date},+{len(added)},-{len(removed)}')
+                if args.lines:
+                    for line in removed:
+                        print(f'  - {line}')
+                    for line in added:
+                        print(f'  + {line}')
+            print(f'{len(results)} devices changed')
+        elif args.command == 'contains':
+            results = index.contains(args.line, args.substring, args.all_backups)
+            for hostname, date in results:
+                print(f'{hostname},{date}')
+            print(f'{len(results)} backups' if args.all_backups else f'{len(results)} devices')
+        else:
+            try:
+                print(index.diff(args.hostname, args.from_date, args.to_date, args.context), end='')
+            except KeyError as e:
+                parser.exit(1, str(e.args[0]) + '\n')
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
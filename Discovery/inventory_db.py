@@ -0,0 +1,269 @@
+"""
+Indexed inventory database of Discovery results
+Every run of Discovery.py adds one row per device (hostname, IP, boot date, version, serial,
+model, error) to Discovery_Inventory.db next to the Discovery_Report CSV, so questions like
+"which serials run version X" or "which devices rebooted this week" are one indexed query
+instead of a grep through a year of CSVs. Runs can be exported back to the report CSV layout
+and old reports can be imported.
+
+Usage:
+    python inventory_db.py query [--serial S] [--model M] [--version V] [--hostname H] [--ip IP]
+                                 [--since YYYY-MM-DD] [--until YYYY-MM-DD] [--rebooted-since YYYY-MM-DD]
+                                 [--errors] [--all-runs] [--csv OUT.csv]
+    python inventory_db.py runs
+    python inventory_db.py export RUN OUT.csv
+    python inventory_db.py import Discovery_Report_*.csv
+"""
+
+import os, re, csv, sys, sqlite3, time, argparse
+from datetime import datetime
+
+DEFAULT_PATH = 'Discovery_Inventory.db'
+
+# Discovery_Report_{MM_DD_YYYY_HHMMSS}[_shardIofN].csv
+_REPORT_STAMP = re.compile(r'(\d{2}_\d{2}_\d{4}_\d{6})(_shard\d+of\d+)?')
+
+COLUMNS = ('hostname', 'ip', 'boot_date', 'version', 'serial', 'model', 'error')
+
+
+def _iso_day(boot_date):
+    # Report boot dates are MM-DD-YYYY; YYYY-MM-DD sorts and compares as text
+    try:
+        return datetime.strptime(boot_date, '%m-%d-%Y').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def _run_started(stamp):
+    # Start time of a run from its MM_DD_YYYY_HHMMSS stamp as 'YYYY-MM-DD HH:MM:SS'
+    return datetime.strptime(stamp[:17], '%m_%d_%Y_%H%M%S').strftime('%Y-%m-%d %H:%M:%S')
+
+
+class InventoryDB:
+    # SQLite inventory of Discovery runs. Rows are written by the report writer thread only.
+    def __init__(self, path=DEFAULT_PATH, commit_every=200):
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY,
+                stamp TEXT NOT NULL UNIQUE,
+                started TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS devices (
+                run_id INTEGER NOT NULL REFERENCES runs (id),
+                ip TEXT NOT NULL,
+                hostname TEXT,
+                boot_date TEXT,
+                boot_day TEXT,
+                version TEXT,
+                serial TEXT,
+                model TEXT,
+                error TEXT,
+                PRIMARY KEY (run_id, ip));
+            CREATE TABLE IF NOT EXISTS current (
+                run_id INTEGER NOT NULL REFERENCES runs (id),
+                ip TEXT PRIMARY KEY,
+                hostname TEXT,
+                boot_date TEXT,
+                boot_day TEXT,
+                version TEXT,
+                serial TEXT,
+                model TEXT,
+                error TEXT,
+                started TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS devices_ip ON devices (ip, run_id);
+            CREATE INDEX IF NOT EXISTS devices_serial ON devices (serial);
+            CREATE INDEX IF NOT EXISTS devices_model ON devices (model);
+            CREATE INDEX IF NOT EXISTS devices_version ON devices (version);
+            CREATE INDEX IF NOT EXISTS devices_hostname ON devices (hostname);
+            CREATE INDEX IF NOT EXISTS devices_boot_day ON devices (boot_day);
+            CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+            CREATE INDEX IF NOT EXISTS current_serial ON current (serial);
+            CREATE INDEX IF NOT EXISTS current_model ON current (model);
+            CREATE INDEX IF NOT EXISTS current_version ON current (version);
+            CREATE INDEX IF NOT EXISTS current_hostname ON current (hostname);
+            CREATE INDEX IF NOT EXISTS current_boot_day ON current (boot_day);''')
+        self._db.commit()
+        # run start times by id, for keeping the current table up to date
+        self._started = dict(self._db.execute('SELECT id, started FROM runs'))
+
+    def start_run(self, stamp):
+        # Return the id of the run with stamp (MM_DD_YYYY_HHMMSS plus any shard suffix), creating it if new.
+        # A resumed run passes the stamp of the run it continues and keeps adding to it.
+        self._db.execute('INSERT OR IGNORE INTO runs (stamp, started) VALUES (?, ?)', (stamp, _run_started(stamp)))
+        self._db.commit()
+        run_id, started = self._db.execute('SELECT id, started FROM runs WHERE stamp = ?', (stamp,)).fetchone()
+        self._started[run_id] = started
+        return run_id
+
+    def add(self, run_id, row):
+        # Add a Discovery_Report row ([hostname, ip, boot_date, version, serial, model] plus error) to run_id
+        values = [None if value in ('-', '') else str(value) for value in row[:7]]
+        values += [None] * (7 - len(values))
+        hostname, ip, boot_date, version, serial, model, error = values
+        values = (run_id, row[1], hostname, boot_date, _iso_day(boot_date), version, serial, model, error)
+        self._db.execute('INSERT OR REPLACE INTO devices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', values)
+        # current holds a copy of the newest row of every IP so latest-only queries never touch old runs
+        self._db.execute('INSERT INTO current VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (ip) DO UPDATE '
+                         'SET run_id = excluded.run_id, hostname = excluded.hostname, '
+                         'boot_date = excluded.boot_date, boot_day = excluded.boot_day, version = excluded.version, '
+                         'serial = excluded.serial, model = excluded.model, error = excluded.error, '
+                         'started = excluded.started WHERE excluded.started >= current.started',
+                         values + (self._started[run_id],))
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self._db.commit()
+        self._uncommitted = 0
+
+    def runs(self):
+        # Return (id, stamp, started, devices, errors) for every run, oldest first
+        return self._db.execute('''SELECT runs.id, stamp, started, COUNT(ip), COUNT(error)
+                                   FROM runs LEFT JOIN devices ON devices.run_id = runs.id
+                                   GROUP BY runs.id ORDER BY started, runs.id''').fetchall()
+
+    def query(self, serial=None, model=None, version=None, hostname=None, ip=None, since=None, until=None,
+              rebooted_since=None, errors=None, latest=True):
+        # Return matching rows as (started, hostname, ip, boot_date, version, serial, model, error) tuples.
+        # since/until limit the run date and rebooted_since the boot date (all YYYY-MM-DD).
+        # errors=True/False keeps only failed/successful rows.
+        # latest looks only at the newest row of each IP (up to until), so a device that moved off
+        # version X no longer matches version X.
+        run_conditions = []
+        run_parameters = []
+        if since is not None:
+            run_conditions.append('runs.started >= ?')
+            run_parameters.append(since)
+        if until is not None:
+            # until is inclusive of the whole day
+            run_conditions.append('runs.started < ?')
+            run_parameters.append(until + '~')
+        conditions = list(run_conditions)
+        parameters = list(run_parameters)
+        for column, value in (('serial', serial), ('model', model), ('version', version),
+                              ('hostname', hostname), ('ip', ip)):
+            if value is not None:
+                conditions.append(f'devices.{column} = ?')
+                parameters.append(value)
+        if rebooted_since is not None:
+            conditions.append('devices.boot_day >= ?')
+            parameters.append(rebooted_since)
+        if errors is not None:
+            conditions.append('devices.error IS NOT NULL' if errors else 'devices.error IS NULL')
+        table = 'devices'
+        join = ''
+        if latest and until is None:
+            table = 'current AS devices'
+        elif latest:
+            # newest run of every IP up to until
+            join = (f'JOIN (SELECT devices.ip, devices.run_id, MAX(runs.started) FROM devices '
+                    f'JOIN runs ON runs.id = devices.run_id WHERE {" AND ".join(run_conditions)} '
+                    f'GROUP BY devices.ip) AS newest ON newest.ip = devices.ip AND newest.run_id = devices.run_id ')
+            parameters = run_parameters + parameters
+        sql = (f'SELECT runs.started, hostname, devices.ip, boot_date, version, serial, model, error '
+               f'FROM {table} {join}JOIN runs ON runs.id = devices.run_id '
+               f'WHERE {" AND ".join(conditions) or "1"} ORDER BY runs.started, devices.ip')
+        return self._db.execute(sql, parameters).fetchall()
+
+    def export_csv(self, run, path):
+        # Write run (id or stamp) to path in the Discovery_Report CSV layout. Returns the number of rows.
+        found = self._db.execute('SELECT id FROM runs WHERE id = ? OR stamp = ?', (run, run)).fetchone()
+        if found is None:
+            raise KeyError(f'no run {run}')
+        cursor = self._db.execute('SELECT hostname, ip, boot_date, version, serial, model, error FROM devices '
+                                  'WHERE run_id = ? ORDER BY rowid', (found[0],))
+        count = 0
+        with open(path, mode='w', newline='') as report:
+            writer = csv.writer(report, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            for row in cursor:
+                writer.writerow(report_row(row))
+                count += 1
+        return count
+
+    def import_report(self, path):
+        # Add an existing Discovery_Report CSV as a run. Returns the number of rows imported.
+        match = _REPORT_STAMP.search(os.path.basename(path))
+        if match:
+            stamp = match.group(0)
+        else:
+            stamp = time.strftime('%m_%d_%Y_%H%M%S', time.localtime(os.path.getmtime(path)))
+        run_id = self.start_run(stamp)
+        count = 0
+        with open(path, newline='') as report:
+            for row in csv.reader(report):
+                if len(row) >= 2:
+                    self.add(run_id, row)
+                    count += 1
+        self.commit()
+        return count
+
+    def close(self):
+        self.commit()
+        self._db.close()
+
+
+def report_row(row):
+    # Turn (hostname, ip, boot_date, version, serial, model, error) back into a Discovery_Report row
+    values = ['-' if value is None else value for value in row[:6]]
+    if row[6] is not None:
+        values.append(row[6])
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the Discovery inventory database.')
+    parser.add_argument('--db', default=DEFAULT_PATH, help=f'database file (default {DEFAULT_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    query_parser = commands.add_parser('query', help='find devices (newest row per IP unless --all-runs)')
+    for column in ('serial', 'model', 'version', 'hostname', 'ip'):
+        query_parser.add_argument(f'--{column}')
+    query_parser.add_argument('--since', help='only runs on or after YYYY-MM-DD')
+    query_parser.add_argument('--until', help='only runs on or before YYYY-MM-DD')
+    query_parser.add_argument('--rebooted-since', help='only devices booted on or after YYYY-MM-DD')
+    query_parser.add_argument('--errors', action='store_true', default=None, help='only devices that failed')
+    query_parser.add_argument('--all-runs', action='store_true', help='one row per device per matching run')
+    query_parser.add_argument('--csv', metavar='OUT', help='write the rows in Discovery_Report layout to OUT')
+    commands.add_parser('runs', help='list runs')
+    export_parser = commands.add_parser('export', help='write a run as a Discovery_Report CSV')
+    export_parser.add_argument('run', help='run id or stamp (see runs)')
+    export_parser.add_argument('output')
+    import_parser = commands.add_parser('import', help='import existing Discovery_Report CSVs')
+    import_parser.add_argument('reports', nargs='+')
+    args = parser.parse_args()
+
+    inventory = InventoryDB(args.db)
+    try:
+        if args.command == 'query':
+            rows = inventory.query(args.serial, args.model, args.version, args.hostname, args.ip, args.since,
+                                   args.until, args.rebooted_since, args.errors, latest=not args.all_runs)
+            if args.csv:
+                with open(args.csv, mode='w', newline='') as output:
+                    writer = csv.writer(output, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                    for row in rows:
+                        writer.writerow(report_row(row[1:]))
+                print(f'Wrote {len(rows)} devices to {args.csv}')
+            else:
+                writer = csv.writer(sys.stdout)
+                writer.writerow(('run',) + COLUMNS)
+                writer.writerows(rows)
+        elif args.command == 'runs':
+            for run_id, stamp, started, devices, errors in inventory.runs():
+                print(f'{run_id},{stamp},{started},{devices} devices,{errors} errors')
+        elif args.command == 'export':
+            try:
+                print(f'Wrote {inventory.export_csv(args.run, args.output)} devices to {args.output}')
+            except KeyError as e:
+                parser.exit(1, str(e.args[0]) + '\n')
+        else:
+            for path in args.reports:
+                print(f'Imported {inventory.import_report(path)} devices from {path}')
+    finally:
+        inventory.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Merge the per-shard output of Discovery.py --shard i/N into one report
+Discovery_Report CSVs are combined into one CSV with one row per IP; when an IP shows up in
+more than one report the successful row wins over an error row. Discovery_Log files are
+interleaved by timestamp into one log with each line tagged by the file it came from.
+
+Usage: python merge_reports.py REPORT.csv [REPORT.csv ...] [--logs LOG.txt ...] [--output-prefix Discovery_Merged]
+"""
+
+import os, csv, time, heapq, argparse
+
+
+def merge_reports(report_paths, output_path):
+    # Combine Discovery_Report CSVs into output_path. Returns the number of rows written.
+    rows = {}
+    for path in report_paths:
+        with open(path, newline='') as report:
+            for row in csv.reader(report):
+                if len(row) < 2:
+                    continue
+                ip = row[1]
+                # rows with an error column lose to a successful row for the same IP
+                if ip not in rows or len(rows[ip]) > 6 >= len(row):
+                    rows[ip] = row
+    with open(output_path, mode='w', newline='') as merged:
+        writer = csv.writer(merged, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        for row in rows.values():
+            writer.writerow(row)
+    return len(rows)
+
+
+def _log_entries(path):
+    # Yield (timestamp, line) for each log entry. Continuation lines keep the previous timestamp.
+    tag = os.path.splitext(os.path.basename(path))[0]
+    timestamp = ''
+    with open(path) as log:
+        for line in log:
+            # logging's asctime is 'YYYY-MM-DD HH:MM:SS,mmm', which sorts as text
+            if len(line) > 23 and line[4] == '-' and line[10] == ' ' and line[19] == ',':
+                timestamp = line[:23]
+            yield timestamp, f'{tag}:{line}'
+
+
+def merge_logs(log_paths, output_path):
+    # Interleave Discovery_Log files by timestamp into output_path. Returns the number of lines written.
+    count = 0
+    with open(output_path, 'w') as merged:
+        for _, line in heapq.merge(*(_log_entries(path) for path in log_paths), key=lambda entry: entry[0]):
+            merged.write(line if line.endswith('\n') else line + '\n')
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge per-shard Discovery reports and logs into one.')
+    parser.add_argument('reports', nargs='+', help='Discovery_Report CSVs from each shard')
+    parser.add_argument('--logs', nargs='*', default=[], help='Discovery_Log files from each shard')
+    parser.add_argument('--output-prefix', default='Discovery_Merged',
+                        help='prefix of the merged file names (default Discovery_Merged)')
+    args = parser.parse_args()
+
+    stamp = time.strftime("%m_%d_%Y_%H%M%S")
+    report_path = f'{args.output_prefix}_Report_{stamp}.csv'
+    print(f'Wrote {merge_reports(args.reports, report_path)} devices to {report_path}')
+    if args.logs:
+        log_path = f'{args.output_prefix}_Log_{stamp}.txt'
+        print(f'Wrote {merge_logs(args.logs, log_path)} log lines to {log_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Pipelined command collection over one netmiko session
+send_command() waits for the prompt after every command, so each command costs at least one
+round trip. send_pipelined() writes the whole list of commands to the channel at once, reads
+until the prompt has come back after the last one and splits the combined output by command
+using the echoed 'prompt + command' lines. Terminal length and width are set at the front of
+the first pipeline so paging never stalls it.
+"""
+
+import time
+
+# sent once per session ahead of the first pipeline; their output is discarded
+SESSION_SETUP = ('terminal length 0', 'terminal width 511')
+
+
+class PipelineError(Exception):
+    pass
+
+
+def _normalize(text):
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def split_output(text, prompt, commands):
+    # Split the output read after writing commands back to back into {command: output}.
+    # Returns None until the prompt has come back after the last command.
+    outputs = {}
+    # the first echo follows the prompt already consumed by find_prompt()
+    position = text.find(commands[0])
+    if position < 0:
+        return None
+    for index, command in enumerate(commands):
+        line_end = text.find('\n', position)
+        if line_end < 0:
+            return None
+        if index + 1 < len(commands):
+            end = text.find(prompt + commands[index + 1], line_end)
+            if end < 0:
+                return None
+            outputs[command] = text[line_end + 1:end]
+            position = end + len(prompt)
+        else:
+            rest = text[line_end + 1:]
+            if not rest.rstrip().endswith(prompt):
+                return None
+            outputs[command] = rest.rstrip()[:-len(prompt)]
+    return {command: output.strip('\n') for command, output in outputs.items()}
+
+
+def send_pipelined(net_connect, commands, setup=True, read_timeout=120.0):
+    # Send commands back to back over net_connect and return {command: output} in the same form as
+    # send_command(). With setup the SESSION_SETUP commands go first.
+    # Raises PipelineError when the prompt does not come back after the last command within read_timeout.
+    sent = (list(SESSION_SETUP) if setup else []) + list(commands)
+    prompt = net_connect.find_prompt()
+    net_connect.write_channel(''.join(command + net_connect.RETURN for command in sent))
+    text = held = ''
+    delay = 0.01
+    deadline = time.monotonic() + read_timeout
+    while True:
+        data = net_connect.read_channel()
+        if data:
+            # a \r\n split across two reads must still become one newline
+            data = held + data
+            held = '\r' if data.endswith('\r') else ''
+            text += _normalize(data[:len(data) - len(held)])
+            # only look for the sections once the text ends in a prompt, so long outputs are split once
+            if text[-len(prompt) - 16:].rstrip().endswith(prompt):
+                outputs = split_output(text, prompt, sent)
+                if outputs is not None:
+                    return {command: outputs[command] for command in commands}
+            delay = 0.01
+        elif time.monotonic() > deadline:
+            raise PipelineError(f'prompt {prompt} did not return after {len(sent)} pipelined commands '
+                                f'within {read_timeout:.0f}s')
+        else:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
@@ -0,0 +1,101 @@
+"""
+Local device state store for incremental discovery
+Keeps one SQLite row per IP with the fingerprints seen on the last full collection: hostname,
+serial, boot date derived from uptime, the 'Last configuration change' marker of the running
+config and a hash of the running config. When the cheap fingerprints still match, Discovery.py
+skips downloading the running-config and inventory again.
+"""
+
+import re, sqlite3, threading, time, hashlib
+from datetime import datetime
+
+DEFAULT_PATH = 'Discovery_State.db'
+
+# one-line marker commands that say whether the running config changed
+LAST_CHANGE_COMMAND = 'show running-config | include Last configuration change|No configuration change|last done at'
+_LAST_CHANGE = re.compile(r'(Last configuration change at .+?)(?:\s+by\s+\S+)?\s*$'
+                          r'|(No configuration change since last restart)'
+                          r'|(Running configuration last done at:?.+?)\s*$', re.MULTILINE)
+
+# lines of the running config that change without a configuration change; also skipped by
+# config_index.py when it reports what changed
+VOLATILE = re.compile(r'^(?:Building configuration|Current configuration\s*:|! Last configuration change'
+                       r'|! NVRAM config last updated|!Time:|!Running configuration last done|ntp clock-period)')
+
+
+def parse_last_change(output):
+    # Return the configuration change marker from LAST_CHANGE_COMMAND output, or None if there is none
+    match = _LAST_CHANGE.search(output or '')
+    if match is None:
+        return None
+    for group in match.groups():
+        if group is not None:
+            return group.strip()
+
+
+def config_hash(config):
+    # Hash the running config, ignoring lines that change on their own
+    digest = hashlib.sha256()
+    for line in config.splitlines():
+        if not VOLATILE.match(line):
+            digest.update(line.rstrip().encode())
+            digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _same_boot_date(previous, current):
+    # Boot dates are derived from whole days of uptime and can drift by one day between runs
+    try:
+        previous = datetime.strptime(previous, '%m-%d-%Y')
+        current = datetime.strptime(current, '%m-%d-%Y')
+    except (TypeError, ValueError):
+        return False
+    return abs((previous - current).days) <= 1
+
+
+class StateStore:
+    # Thread-safe SQLite store of per-device fingerprints
+    def __init__(self, path=DEFAULT_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS devices (
+                                ip TEXT PRIMARY KEY,
+                                hostname TEXT,
+                                serial TEXT,
+                                boot_date TEXT,
+                                last_change TEXT,
+                                config_hash TEXT,
+                                updated REAL)''')
+        self._db.commit()
+
+    def get(self, ip):
+        # Return the stored fingerprints for ip as a dict, or None
+        with self._lock:
+            cursor = self._db.execute('SELECT ip, hostname, serial, boot_date, last_change, config_hash, updated '
+                                      'FROM devices WHERE ip = ?', (ip,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip(('ip', 'hostname', 'serial', 'boot_date', 'last_change', 'config_hash', 'updated'), row))
+
+    def unchanged(self, ip, info, last_change):
+        # True when show version and the config change marker match the last full collection of ip
+        previous = self.get(ip)
+        if previous is None or previous['config_hash'] is None or last_change is None:
+            return False
+        return (previous['hostname'] == info.hostname
+                and previous['serial'] == info.serial
+                and previous['last_change'] == last_change
+                and _same_boot_date(previous['boot_date'], info.boot_date))
+
+    def update(self, ip, info, last_change, config_digest):
+        # Record the fingerprints of a full collection of ip
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO devices VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (ip, info.hostname, info.serial, info.boot_date, last_change, config_digest, time.time()))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,101 @@
+"""
+Parser for 'show version' output used by Discovery.py
+Regular expressions are compiled once at import. The platform is picked from the first
+non-blank line of the output and each platform has its own template of expressions, so an
+NX-OS or IOS-XE variant only loses the fields it does not have instead of the whole row.
+Fields that are not found are returned as None.
+"""
+
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+VersionInfo = namedtuple('VersionInfo', ['platform', 'hostname', 'uptime', 'boot_date', 'version', 'serial', 'model'])
+
+_MULTILINE = re.MULTILINE
+
+# uptime components, shared by every platform
+_UPTIME_YEARS = re.compile(r'(\d+)\s+year')
+_UPTIME_WEEKS = re.compile(r'(\d+)\s+week')
+_UPTIME_DAYS = re.compile(r'(\d+)\s+day')
+
+# Each template maps a field to the compiled expression that finds it. The first group is the value.
+TEMPLATES = {
+    'ios': {
+        'hostname': re.compile(r'^(\S+)\s+uptime\s+is\s', _MULTILINE),
+        'uptime': re.compile(r'^\S+\s+uptime\s+is\s+(.+)$', _MULTILINE),
+        'version': re.compile(r'Cisco\s+IOS\s+Software.+?Version\s+([^,\s]+)'),
+        'serial': re.compile(r'Processor\s+board\s+ID\s+(\S+)'),
+        'model': re.compile(r'^[Cc]isco\s+(\S+).*memory', _MULTILINE),
+    },
+    'ios-xe': {
+        'hostname': re.compile(r'^(\S+)\s+uptime\s+is\s', _MULTILINE),
+        'uptime': re.compile(r'^\S+\s+uptime\s+is\s+(.+)$', _MULTILINE),
+        'version': re.compile(r'Cisco\s+IOS[\s-]XE\s+Software,\s+Version\s+([^,\s]+)|Cisco\s+IOS\s+Software\s+\[.+?Version\s+([^,\s]+)'),
+        'serial': re.compile(r'Processor\s+board\s+ID\s+(\S+)'),
+        'model': re.compile(r'^Model\s+[Nn]umber\s*:\s*(\S+)|^[Cc]isco\s+(\S+)\s+\(.+\)\s+processor', _MULTILINE),
+    },
+    'nx-os': {
+        'hostname': re.compile(r'^\s*Device\s+name:\s*(\S+)', _MULTILINE),
+        'uptime': re.compile(r'^Kernel\s+uptime\s+is\s+(.+)$', _MULTILINE),
+        'version': re.compile(r'^\s*(?:NXOS|system):\s+version\s+(\S+)', _MULTILINE),
+        'serial': re.compile(r'Processor\s+[Bb]oard\s+ID\s+(\S+)'),
+        'model': re.compile(r'^\s*cisco\s+(?:Nexus\S*\s+)?(.+?)\s+[Cc]hassis', _MULTILINE),
+    },
+}
+
+
+def fingerprint(output):
+    # Pick a template from the first non-blank line of the output
+    first_line = output.lstrip().partition('\n')[0]
+    if 'NX-OS' in first_line or 'Nexus' in first_line:
+        return 'nx-os'
+    # IOS-XE either says so or, on 16.x and later, names its release train in brackets ([Fuji], [Amsterdam])
+    if 'IOS XE' in first_line or 'IOS-XE' in first_line or 'IOSXE' in first_line or 'Software [' in first_line:
+        return 'ios-xe'
+    return 'ios'
+
+
+def uptime_to_days(uptime):
+    # Convert an uptime string such as '2 years, 3 weeks, 1 day, 4 hours' to whole days
+    days = 0
+    match = _UPTIME_YEARS.search(uptime)
+    if match:
+        days += int(match.group(1)) * 365
+    match = _UPTIME_WEEKS.search(uptime)
+    if match:
+        days += int(match.group(1)) * 7
+    match = _UPTIME_DAYS.search(uptime)
+    if match:
+        days += int(match.group(1))
+    return days
+
+
+def _find(expression, output):
+    match = expression.search(output)
+    if match is None:
+        return None
+    for group in match.groups():
+        if group is not None:
+            return group.strip()
+    return None
+
+
+def parse_show_version(output, today=None):
+    # Parse 'show version' output into a VersionInfo record
+    platform = fingerprint(output)
+    template = TEMPLATES[platform]
+    uptime = _find(template['uptime'], output)
+    boot_date = None
+    if uptime is not None:
+        today = today or datetime.today()
+        boot_date = (today - timedelta(days=uptime_to_days(uptime))).strftime('%m-%d-%Y')
+    return VersionInfo(
+        platform=platform,
+        hostname=_find(template['hostname'], output),
+        uptime=uptime,
+        boot_date=boot_date,
+        version=_find(template['version'], output),
+        serial=_find(template['serial'], output),
+        model=_find(template['model'], output),
+    )
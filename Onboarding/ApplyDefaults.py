@@ -3,401 +3,480 @@
 # Takes a preformatted csv and iterates through the entries to configure end devices with required settings.
 # Settings can be entered manually before compiling in the listed section or will be prompted when ran.
 # 
-# Version 0.1.2
+# Version 0.2.8
+#
+# 0.1.3 - Replaced per-device OS ping with a TCP/ICMP reachability sweep of the whole list before login
+# 0.1.4 - Cache the working transport and enable requirement per IP in transport_cache.json
+# 0.1.5 - Read DeviceList.csv with the shared streaming loader (validates rows and drops duplicate IPs)
+# 0.1.6 - Journal each device's result to ApplyDefaults_Journal_*.jsonl. Added --resume to finish an interrupted run.
+# 0.1.7 - Settings from the command line or --config file, --non-interactive and --shard i/N for multi-host runs
+# 0.1.8 - Per-device phase timings in ApplyDefaults_Timings_*.jsonl with a p50/p95/max summary at the end of the run
+# 0.1.9 - Moved the run into main() and configure_device() so it can be driven by Benchmarks/run_benchmark.py
+# 0.2.0 - UC dialogs wait for each prompt instead of sleeping (see dialog.py). Removed the fixed time.sleep(1) waits.
+# 0.2.1 - Configure devices in parallel with --workers. Nodes of a UC cluster run one at a time, publisher first
+#         (optional cluster and role columns, see scheduler.py). Per-node output goes to ApplyDefaults_Output_*.txt
+#         and a summary is printed at the end.
+# 0.2.2 - CUCM publisher provisioning in six batched 'run sql' statements parsed by cucm_sql.py instead of about fifteen
+# 0.2.3 - Cache UC cluster topology (members, publisher, version) in topology_cache.json. Added --refresh-topology.
+# 0.2.4 - Network devices: read only the relevant config sections, push only the missing lines and skip the save
+#         when nothing changed (see compliance.py). The ACL entry is now 'permit <server>', valid in a standard ACL.
+# 0.2.5 - Sessions are written to per-node transcript files (see transcript.py) instead of echoed to the console
+#         with display=True. A failed node's output ends with the last of its session. Added --quiet and --transcripts.
+# 0.2.6 - One uc_connect() for CUCM, CUC, IMP and CER. Sessions on a UC node share one kept-alive SSH transport
+#         (see ssh_transports.py), closed at the end of the run.
+# 0.2.7 - Logins go through a scheduler capping them overall and per site, with backoff, a per-host circuit breaker
+#         and fewer logins at once when AAA errors rise (see Common/login_scheduler.py). Added --max-logins and
+#         --logins-per-site. A failed login reports its cause (auth, timeout, refused, ...).
+# 0.2.8 - Connect, login and prompt timeouts per device, learned from its measured round trips, command times and
+#         output sizes and kept in timeouts.json (see Common/timeouts.py), instead of 60 seconds for every UC
+#         session and netmiko's defaults. uc_connect() returns once the node shows its first admin: prompt.
 
-import csv, paramiko, os, re, time
-from paramiko_expect import SSHClientInteraction
+import argparse, os, socket, sys, time
 from netmiko import ConnectHandler
+from netmiko.exceptions import ReadTimeout
+from netmiko.session_log import SessionLog
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Common.reachability import sweep
+from Common.transport_cache import TransportCache
+from Common.device_list import iter_devices, in_shard
+from Common.journal import RunJournal, load_journal, completed, latest_journal
+from Common.settings import parse_args_with_config, parse_shard, shard_suffix
+from Common.timing import TimingRecorder, NULL_TIMER
+from Common.timeouts import TimeoutCache, LOGIN
+from Common.login_scheduler import LoginScheduler, LoginError, most_telling, DEFAULT_MAX_LOGINS, DEFAULT_PER_SITE
+from dialog import Step, run_dialog
+from scheduler import run_scheduled, summary, shard_key
+from cucm_sql import run_sql, sql_literal, sql_list
+from topology_cache import TopologyCache, parse_network_cluster, parse_product_version
+from compliance import network_requirements, missing_requirements, filter_commands, delta_commands
+from transcript import TranscriptWriter
+from ssh_transports import TransportPool, exec_command
+
+# transport (and enable requirement) that last worked per IP, kept between runs
+transport_cache = TransportCache()
+
+# UC cluster members, publisher and version, read from the first node contacted in each cluster
+topology_cache = TopologyCache()
+
+# caps, backoff and circuit breaker for every login of the run, set up by main()
+login_scheduler = LoginScheduler()
+
+# round trips, command times and output sizes per IP, kept between runs to derive the session timeouts
+session_timeouts = TimeoutCache()
+
+# authenticated SSH transports of the UC nodes, shared by every session on a node during the run
+uc_transports = TransportPool(scheduler=login_scheduler, timeouts=session_timeouts)
+
+# default number of devices configured at the same time
+DEFAULT_WORKERS = 8
+
+# devicetype values of DeviceList.csv that configure_device() knows
+DEVICE_TYPES = ('NETWORK', 'CUCM', 'CUC', 'IMP', 'CER')
+
+# TCP ports used to reach network devices per netmiko device type, and UC nodes over SSH
+NETWORK_PORTS = {'cisco_ios': 22, 'cisco_ios_telnet': 23}
+UC_SSH_PORT = 22
+
+# roles given to the service account's access control group on CUCM
+ACG_ROLES = ('Standard SERVICEABILITY Read Only', 'Standard AXL API Access', 'Standard CCM Admin Users')
+
+# UC dialogs. Each step sends a line and waits for the prompt that follows it.
+ADMIN_PROMPT = 'admin:'
+
+# community string, access privileges and the address allowed to poll, then the SNMP master agent restart
+SNMP_COMMUNITY_DIALOG = [
+    Step('utils snmp config 1/2c community-string add', r'\s*Enter the community string::\s*'),
+    Step('{snmpstring}', r'.*::\s*'),
+    Step('ReadOnly', r'.*::\s*'),
+    Step('{loggingserver}', r'.*\((?:yes/no|y/n)\)\?\s*'),
+    Step('yes', ADMIN_PROMPT, timeout=300),
+]
+
+# account with privilege level 0 and a password
+ACCOUNT_DIALOG = [
+    Step('set account name {account}', r'\s*Please enter the privilege level :\s*'),
+    Step('0', r'.*[Pp]assword\s*:\s*'),
+    Step('{password}', r'.*confirm\s*:\s*'),
+    Step('{password}', ADMIN_PROMPT),
+]
+
+# version 12.5 also asks whether the account may use SFTP and for a description
+ACCOUNT_DIALOG_12_5 = [
+    Step('set account name {account}', r'\s*Please enter the privilege level :\s*'),
+    Step('0', r'.*\(Yes\s*/\s*No\)\s*:\s*'),
+    Step('No', r'.*[Dd]escription.*:\s*'),
+    Step('ANMMS-Monitoring', r'.*[Pp]assword\s*:\s*'),
+    Step('{password}', r'.*confirm\s*:\s*'),
+    Step('{password}', ADMIN_PROMPT),
+]
+
+def cluster_topology(connection, ip, version=False):
+    # Return the topology of the cluster of the UC node ip as {'members', 'publisher', 'version'}.
+    # 'show network cluster' (and 'show status' when version is needed) only run when the cache has nothing.
+    topology = topology_cache.get(ip)
+    if topology is None:
+        connection.send('show network cluster')
+        connection.expect('admin:')
+        members = parse_network_cluster(connection.current_output_clean)
+        if ip not in members:
+            # the node lists itself under another address; nothing can be cached for it
+            topology = {'members': members, 'publisher': None, 'version': None}
+        else:
+            topology = topology_cache.record(members)
+    if version and topology['version'] is None:
+        connection.send('show status')
+        connection.expect('admin:')
+        topology['version'] = parse_product_version(connection.current_output_clean)
+        topology_cache.set_version(ip, topology['version'])
+    return topology
 
 def set_snmp(connection, snmpstring, loggingserver):
     # Generic SNMP configuration for Cisco UC applications
-    connection.send('utils snmp config 1/2c community-string add')
-    connection.expect('Enter the community string:: ')
-    time.sleep(1)
-    connection.send(f'{snmpstring}')
-    connection.expect('.*')
-    time.sleep(1)
-    connection.send('ReadOnly')
-    connection.expect('.*')
-    time.sleep(1)
-    connection.send(f'{loggingserver}')
-    connection.expect('.*')
-    time.sleep(1)
-    connection.send('yes')
-    connection.expect('admin:')
-
-def network_connect(ip, user, password, enablesecret):
+    run_dialog(connection, 'SNMP community string', SNMP_COMMUNITY_DIALOG,
+               snmpstring=snmpstring, loggingserver=loggingserver)
+
+def network_connect(ip, user, password, enablesecret, transcript=None, open_ports=None, timer=NULL_TIMER):
     # Function to connect to Cisco network devices such as ISR or Catalyst
-    # try ssh
-    try:
-        cisco = {
-            'device_type': 'cisco_ios',
-            'ip': ip,
-            'username': user,
-            'password': password,
-            'secret': enablesecret
-            }
-        return ConnectHandler(**cisco)
-    except paramiko.ssh_exception.SSHException:
-        # if SSH fails try telnet
-        cisco = {
-            'device_type': 'cisco_ios_telnet',
-            'ip': ip,
-            'username': user,
-            'password': password,
-            'secret': enablesecret
-        }
-        return ConnectHandler(**cisco)
-    except Exception as e:
-        print('Error: ' + str(e))
-
-def network_set_defaults(connection, loggingserver, snmpstring):
+    # Try the transport that worked last time first, then fall back to the others
+    # A timeout on a transport whose port is not among open_ports (from the reachability sweep) is not retried
+    # The session is logged to transcript, if given, with the password and secret masked
+    # Raises the LoginError that best explains the failure if no transport works
+    # The logins are timed as the 'connect' phase of timer and entering enable mode as 'enable'
+    errors = []
+    for device_type in transport_cache.order(ip, list(NETWORK_PORTS)):
+        try:
+            cisco = {
+                'device_type': device_type,
+                'ip': ip,
+                'port': NETWORK_PORTS[device_type],
+                'username': user,
+                'password': password,
+                'secret': enablesecret,
+                'conn_timeout': session_timeouts.connect_timeout(ip),
+                'banner_timeout': session_timeouts.command_timeout(ip, LOGIN),
+                'auth_timeout': session_timeouts.command_timeout(ip, LOGIN)
+                }
+            if transcript is not None:
+                no_log = {key: value for key, value in (('password', password), ('secret', enablesecret)) if value}
+                cisco['session_log'] = SessionLog(buffered_io=transcript, no_log=no_log)
+            retries = 0 if open_ports is not None and NETWORK_PORTS[device_type] not in open_ports else None
+            with timer.phase('connect'):
+                connection = login_scheduler.login(ip, lambda: timed_login(ip, cisco), transport=device_type,
+                                                   retries=retries)
+        except LoginError as e:
+            errors.append(e)
+            continue
+        #
+        # Enter enable mode if needed, skipping the check when the cache already knows
+        #
+        with timer.phase('enable'):
+            enable_required = transport_cache.enable_required(ip)
+            if enable_required is None:
+                enable_required = not connection.check_enable_mode()
+            if enable_required:
+                connection.enable()
+        transport_cache.record(ip, device_type, enable_required)
+        return connection
+    transport_cache.forget(ip)
+    raise most_telling(errors)
+
+def timed_login(ip, cisco):
+    # ConnectHandler(**cisco), learning how long the login took
+    started = time.monotonic()
+    connection = ConnectHandler(**cisco)
+    session_timeouts.observe_command(ip, LOGIN, time.monotonic() - started, 0)
+    return connection
+
+def network_set_defaults(connection, loggingserver, snmpstring, axlusername, timer=NULL_TIMER):
     # Configure default settings for traps and configure logging server with ACLs
-    running_config = connection.send_command('show run')
-    config_commands = ['snmp-server enable traps voice',            #enabling traps
-                      'snmp-server enable traps isdn',
-                      'snmp-server enable traps dial',
-                      'snmp-server enable traps dsp',
-                      'logging trap errors',                        #set trap level errors
-                      f'ip access-list standard {axlusername}',   #configure acl to only permit the logging server
-                      f'permit ip {loggingserver}',
-                      f'snmp-server community {snmpstring} RO {axlusername}',
-                      f'snmp-server host {loggingserver} version 2c {snmpstring}',
-                      f'logging host {loggingserver}']
-    connection.send_config_set(config_commands=config_commands)
-    running_config = connection.send_command('show run')
-    for i in config_commands:
-        if i != f'permit ip {loggingserver}':
-            if i in running_config:
-                print('Successfully set ' + i + ' on network device.')
-            else:
-                print('Failed to set ' + i + ' on network device.')
-    connection.save_config()
-    connection.disconnect()
+    # The ACL permitting the logging server is named after the AXL username
+    # Only the sections of the running config holding these settings are read (see compliance.py),
+    # only the missing lines are pushed and the config is only saved when something was pushed.
+    # Each section read, the push, the check after it, the save and the disconnect are phases of timer.
+    requirements = network_requirements(loggingserver, snmpstring, axlusername)
+    missing = missing_requirements(requirements, read_sections(connection, requirements, timer))
+    still_missing = []
+    if missing:
+        with timer.phase('push config'):
+            connection.send_config_set(config_commands=delta_commands(missing))
+        still_missing = missing_requirements(missing, read_sections(connection, missing, timer, 'verify'))
+    for requirement in requirements:
+        if requirement in still_missing:
+            print('Failed to set ' + requirement.line + ' on network device.')
+        elif requirement in missing:
+            print('Successfully set ' + requirement.line + ' on network device.')
+        else:
+            print('Successfully set ' + requirement.line + ' on network device (already present).')
+    if missing:
+        with timer.phase('save'):
+            connection.save_config()
+    with timer.phase('disconnect'):
+        connection.disconnect()
 
-def cucm_connect(ip, username, password):
-    #
-    # Create and return the connection to a CUCM node
-    #
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(ip, username=username, password=password)
-    #
-    # Set display=False for production
-    #
-    connection = SSHClientInteraction(ssh, timeout=60, display=True)
+def read_sections(connection, requirements, timer=NULL_TIMER, purpose='read'):
+    # Return the parts of the running config that requirements are checked against.
+    # Each command is timed as the phase '{purpose} {command}'.
+    sections = []
+    for command in filter_commands(requirements):
+        with timer.phase(f'{purpose} {command}'):
+            sections.append(timed_command(connection, command))
+    return '\n'.join(sections)
+
+def timed_command(connection, command):
+    # send_command() waiting as long as session_timeouts allows command on the device, learning its time and size,
+    # or that the timeout ran out
+    timeout = session_timeouts.command_timeout(connection.host, command)
+    started = time.monotonic()
+    try:
+        output = connection.send_command(command, read_timeout=timeout)
+    except ReadTimeout:
+        session_timeouts.observe_timeout(connection.host, command, timeout)
+        raise
+    session_timeouts.observe_command(connection.host, command, time.monotonic() - started, len(output))
+    return output
+
+def uc_connect(ip, username, password, transcript=None):
+    # Open an interactive session on a CUCM, CUC, IMP or CER node over its shared SSH transport
+    # (see ssh_transports.py), logging in only when the node has no live transport yet.
+    # The session output goes to transcript, or nowhere. Returns once the node shows its first prompt.
+    # Every prompt of the session is waited for as long as that one took, with margin (see Common/timeouts.py).
+    timeout = session_timeouts.command_timeout(ip, LOGIN)
+    started = time.monotonic()
+    connection = uc_transports.shell(ip, username, password, port=UC_SSH_PORT, timeout=timeout,
+                                     output_callback=None if transcript is None else transcript.write)
+    try:
+        index = connection.expect(ADMIN_PROMPT)
+    except socket.timeout:
+        index = -1
+    if index == -1:
+        connection.close()
+        session_timeouts.observe_timeout(ip, LOGIN, timeout)
+        raise TimeoutError(f'no {ADMIN_PROMPT} prompt from {ip} within {timeout:.0f}s of logging in')
+    session_timeouts.observe_command(ip, LOGIN, time.monotonic() - started, 0)
     return connection
 
-def cucm_set_defaults(connection, loggingserver, axlusername, acgname, snmpstring, ip):
+def uc_show(connection, command):
+    # Return the output of a show command run on an exec channel beside the uc_connect() session connection,
+    # over the node's shared transport, so the shell stays at its prompt. The output is added to the
+    # session's transcript, if it has one.
+    ip = connection.channel.get_transport().getpeername()[0]
+    timeout = session_timeouts.command_timeout(ip, command)
+    started = time.monotonic()
+    try:
+        _, output = exec_command(connection, command, timeout=timeout)
+    except socket.timeout:
+        session_timeouts.observe_timeout(ip, command, timeout)
+        raise
+    session_timeouts.observe_command(ip, command, time.monotonic() - started, len(output))
+    if connection.display:
+        connection.output_callback(f'\n[exec] {command}\n{output}\n')
+    return output
+
+def cucm_set_defaults(connection, loggingserver, axlusername, acgname, snmpstring, ip, timer=NULL_TIMER):
     # Configure default settings for CUCM.
     # Includes configuring a role and ACG for service account. 
     # **PASSWORD MUST BE SET MANUALLY FOR SERVICE ACCOUNT AFTER SCRIPT IS RAN**
-    connection.expect('admin:')
-    connection.send('show network cluster')
-    connection.expect('admin:')
-    for i in connection.current_output_clean.split('\n'):
-        if ip in i and 'Publisher' in i:
-            #
-            # Create the application user
-            #
-            connection.send(f'run sql insert into applicationuser (name) values (\'{axlusername}\')')
-            connection.expect('admin:')
-            #
-            # Verify the application user has been created
-            #
-            connection.send(f'run sql select pkid,name from applicationuser where name = \'{axlusername}\'')
-            connection.expect('admin:')
-            userpkid = (re.compile(f'(.*)\s{axlusername}').findall(connection.current_output_clean))[0]
-            #
-            # Create ACG
-            #
-            connection.send(f'run sql insert into dirgroup (name) values (\'{acgname}\')')
-            connection.expect('admin:')
-            #
-            # Verify ACG has been created
-            #
-            connection.send(f'run sql select pkid,name from dirgroup where name = (\'{acgname}\')')
-            connection.expect('admin:')
-            acgpkid = (re.compile(f'(.*)\s{acgname}').findall(connection.current_output_clean))[0]
-            #
-            # Retrieve PKIDs for roles
+    # On the publisher the account, ACG, roles and syslog server are set with six statements that each
+    # only add what is missing, so running it again is harmless.
+    # The topology lookup, the SQL, the SNMP dialog, its check and the exit are phases of timer.
+    with timer.phase('topology'):
+        publisher = cluster_topology(connection, ip)['publisher']
+    if publisher == ip:
+        user = sql_literal(axlusername)
+        acg = sql_literal(acgname)
+        with timer.phase('sql'):
             #
-            connection.send(
-                'run sql select pkid,name from functionrole where name = \'Standard SERVICEABILITY Read Only\'')
-            connection.expect('admin:')
-            servicabilitypkid = \
-            re.compile(f'(.*)\sStandard\sSERVICEABILITY\sRead\sOnly').findall(connection.current_output_clean)[0]
-            connection.send('run sql select pkid,name from functionrole where name = \'Standard AXL API Access\'')
-            connection.expect('admin:')
-            axlapipkid = re.compile(f'(.*)\sStandard\sAXL\sAPI\sAccess').findall(connection.current_output_clean)[0]
-            connection.send('run sql select pkid,name from functionrole where name = \'Standard CCM Admin Users\'')
-            connection.expect('admin:')
-            adminuserspkid = re.compile(f'(.*)\sStandard\sCCM\sAdmin\sUsers').findall(connection.current_output_clean)[0]
+            # Create the application user and the ACG
             #
-            # Use PKIDs to apply roles to new ACG
+            run_sql(connection, f'insert into applicationuser (name) select {user} from systables where tabid = 1 '
+                                f'and not exists (select 1 from applicationuser where name = {user})')
+            run_sql(connection, f'insert into dirgroup (name) select {acg} from systables where tabid = 1 '
+                                f'and not exists (select 1 from dirgroup where name = {acg})')
             #
-            connection.send(
-                f'run sql insert into functionroledirgroupmap (fkfunctionrole, fkdirgroup) values (\'{servicabilitypkid}\',\'{acgpkid}\')')
-            connection.expect('admin:')
-            connection.send(
-                f'run sql insert into functionroledirgroupmap (fkfunctionrole, fkdirgroup) values (\'{axlapipkid}\',\'{acgpkid}\')')
-            connection.expect('admin:')
-            connection.send(
-                f'run sql insert into functionroledirgroupmap (fkfunctionrole, fkdirgroup) values (\'{adminuserspkid}\',\'{acgpkid}\')')
-            connection.expect('admin:')
+            # Apply the roles to the ACG and add the user to it, one statement each
             #
-            # Verify Roles have been applied to ACG and notify if error.
-            #
-            connection.send(f'run sql select fkfunctionrole,fkdirgroup from functionroledirgroupmap where fkdirgroup = \'{acgpkid}\'')
-            connection.expect('admin:')
-            if servicabilitypkid in connection.current_output_clean:
-                print(f'Successfully set Standard SERVICEABILITY Read Only to {acgname}.')
-            else:
-                print(f'Failed to set Standard SERVICEABILITY Read Only to {acgname}.')
-            if axlapipkid in connection.current_output_clean:
-                print(f'Successfully set Standard AXL API Access to {acgname}.')
-            else:
-                print(f'Failed to set Standard AXL API Access to {acgname}.')
-            if adminuserspkid in connection.current_output_clean:
-                print(f'Successfully set Standard CCM Admin Users to {acgname}.')
-            else:
-                print(f'Failed to set Standard CCM Admin Users to {acgname}.')
-            #
-            # Add new user to ACG
-            #
-            connection.send(f'run sql insert into applicationuserdirgroupmap (fkapplicationuser,fkdirgroup) values (\'{userpkid}\',\'{acgpkid}\')')
-            connection.expect('admin:')
-            #
-            # Verify user is in ACG and print error
-            #
-            connection.send(f'run sql select fkapplicationuser,fkdirgroup from applicationuserdirgroupmap where fkapplicationuser = \'{userpkid}\'')
-            connection.expect('admin:')
-            if userpkid in connection.current_output_clean and acgpkid in connection.current_output_clean:
-                print('Successfully associated ' + axlusername + ' to ' + acgname + ' on CUCM.')
-            else:
-                print('Failed to associate ' + axlusername + ' to ' + acgname + ' on CUCM.')
+            run_sql(connection, f'insert into functionroledirgroupmap (fkfunctionrole, fkdirgroup) '
+                                f'select f.pkid, d.pkid from functionrole f, dirgroup d '
+                                f'where f.name in {sql_list(ACG_ROLES)} and d.name = {acg} '
+                                f'and not exists (select 1 from functionroledirgroupmap m '
+                                f'where m.fkfunctionrole = f.pkid and m.fkdirgroup = d.pkid)')
+            run_sql(connection, f'insert into applicationuserdirgroupmap (fkapplicationuser, fkdirgroup) '
+                                f'select a.pkid, d.pkid from applicationuser a, dirgroup d '
+                                f'where a.name = {user} and d.name = {acg} '
+                                f'and not exists (select 1 from applicationuserdirgroupmap m '
+                                f'where m.fkapplicationuser = a.pkid and m.fkdirgroup = d.pkid)')
             #
             # Configure RemoteSyslogServerName5 syslog server 
             #
-            connection.send(
-                f'run sql update processconfig set paramvalue = \'{loggingserver}\' where paramname = \'RemoteSyslogServerName5\'')
-            connection.expect('admin:')
+            run_sql(connection, f'update processconfig set paramvalue = {sql_literal(loggingserver)} '
+                                f'where paramname = \'RemoteSyslogServerName5\'')
             #
-            # Verify syslog server configured
+            # Verify roles, ACG membership and syslog server and notify if error
             #
-            connection.send(
-                'run sql select paramvalue from processconfig where paramname = \'RemoteSyslogServerName5\'')
-            connection.expect('admin:')
-            if loggingserver in connection.current_output_clean:
-                print('Successfully set RemoteSyslogServername5 on CUCM.')
+            rows = run_sql(connection,
+                           f'select \'role\' as kind, f.name as value from functionroledirgroupmap m, functionrole f, '
+                           f'dirgroup d where m.fkfunctionrole = f.pkid and m.fkdirgroup = d.pkid and d.name = {acg} '
+                           f'union all select \'user\' as kind, a.name as value from applicationuserdirgroupmap m, '
+                           f'applicationuser a, dirgroup d where m.fkapplicationuser = a.pkid '
+                           f'and m.fkdirgroup = d.pkid and a.name = {user} and d.name = {acg} '
+                           f'union all select \'syslog\' as kind, paramvalue as value from processconfig '
+                           f'where paramname = \'RemoteSyslogServerName5\'')
+        found = {(row['kind'], row['value']) for row in rows}
+        for role in ACG_ROLES:
+            if ('role', role) in found:
+                print(f'Successfully set {role} to {acgname}.')
             else:
-                print('Failed to set RemoteSyslogServername5 on CUCM.')
+                print(f'Failed to set {role} to {acgname}.')
+        if ('user', axlusername) in found:
+            print('Successfully associated ' + axlusername + ' to ' + acgname + ' on CUCM.')
+        else:
+            print('Failed to associate ' + axlusername + ' to ' + acgname + ' on CUCM.')
+        if ('syslog', loggingserver) in found:
+            print('Successfully set RemoteSyslogServername5 on CUCM.')
+        else:
+            print('Failed to set RemoteSyslogServername5 on CUCM.')
     #
     # Configure SNMP
     #
-    set_snmp(connection, snmpstring, loggingserver)
+    with timer.phase('snmp dialog'):
+        set_snmp(connection, snmpstring, loggingserver)
     #
     # Verify SNMP Configuration
     #
-    connection.send('utils snmp config 1/2c community-string list')
-    connection.expect('admin:')
-    if snmpstring in connection.current_output_clean:
+    with timer.phase('verify snmp'):
+        configured = snmpstring in uc_show(connection, 'utils snmp config 1/2c community-string list')
+    if configured:
         print('Successfully set community string on CUCM node.')
     else:
         print('Failed to set community string on CUCM node.')
-    connection.send('exit')
+    with timer.phase('disconnect'):
+        connection.send('exit')
     
-def cuc_connect(ip, username, password):
-    #
-    # Create and return SSH connection to CUC node.
-    #
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(ip, username=username, password=password)
-    #
-    # Set display=False for production
-    #
-    connection = SSHClientInteraction(ssh, timeout=60, display=True)
-    return connection
-
-def cuc_set_defaults(connection, loggingserver, snmpstring, pawsaccount, pawspassword, ip):
+def cuc_set_defaults(connection, loggingserver, snmpstring, pawsaccount, pawspassword, ip, timer=NULL_TIMER):
     # Configure default settings for CUC node.
     # This includes configuring SNMP, syslog, and PAWS account for API
-    connection.expect('admin:')
+    # The topology lookup, the SQL, the dialogs, their checks and the exit are phases of timer.
     #
-    # Show network cluster to determine if connected node is the cluster publisher.
+    # Look up whether the connected node is the cluster publisher and the cluster version.
     #
-    connection.send('show status')
-    connection.expect('admin:')
-    grab = connection.current_output_clean
-    connection.send('show network cluster')
-    connection.expect('admin:')
-    for i in connection.current_output_clean.split('\n'):
-        if ip in i and 'Publisher' in i:
+    with timer.phase('topology'):
+        topology = cluster_topology(connection, ip, version=True)
+    if topology['publisher'] == ip:
+        with timer.phase('sql'):
             #
             # Configure publisher node with syslog server entry on RemoteSyslogServerName5
             #
-            connection.send(
-                f'run sql update processconfig set paramvalue = \'{loggingserver}\' where paramname = \'RemoteSyslogServerName5\'')
-            connection.expect('admin:')
+            run_sql(connection, f'update processconfig set paramvalue = {sql_literal(loggingserver)} '
+                                f'where paramname = \'RemoteSyslogServerName5\'')
             #
             # Verify syslog config
             #
-            connection.send(
-                'run sql select paramvalue from processconfig where paramname = \'RemoteSyslogServerName5\'')
-            connection.expect('admin:')
-            if loggingserver in connection.current_output_clean:
-                print('Successfully set RemoteSyslogServername5 on CUC publisher.')
-            else:
-                print('Failed to set RemoteSyslogServername5 on CUC publisher.')
+            rows = run_sql(connection,
+                           'select paramvalue from processconfig where paramname = \'RemoteSyslogServerName5\'')
+        if any(row['paramvalue'] == loggingserver for row in rows):
+            print('Successfully set RemoteSyslogServername5 on CUC publisher.')
         else:
-            pass
+            print('Failed to set RemoteSyslogServername5 on CUC publisher.')
     #
     # Configure PAWS API user
     #
-    set_cuc_paws(connection, pawsaccount, pawspassword, grab)
+    set_cuc_paws(connection, pawsaccount, pawspassword, topology['version'] or '', timer)
     #
     # Configure SNMP
     #
-    set_snmp(connection, snmpstring, loggingserver)
+    with timer.phase('snmp dialog'):
+        set_snmp(connection, snmpstring, loggingserver)
     #
     # Verify SNMP
     #
-    connection.send('utils snmp config 1/2c community-string list')
-    connection.expect('admin:')
-    if snmpstring in connection.current_output_clean:
+    with timer.phase('verify snmp'):
+        configured = snmpstring in uc_show(connection, 'utils snmp config 1/2c community-string list')
+    if configured:
         print('Successfully set community string on CUC node.')
     else:
         print('Failed to set community string on CUC node.')
-    connection.send('exit')
+    with timer.phase('disconnect'):
+        connection.send('exit')
 
-def set_cuc_paws(connection, pawsaccount, pawspassword, grab):
+def set_cuc_paws(connection, pawsaccount, pawspassword, version, timer=NULL_TIMER):
     # Function to configure PAWS API user account on CUC node
-    # Configure account name and privilege level
-    connection.send(f'set account name {pawsaccount}')
-    connection.expect('Please enter the privilege level :')
-    connection.send('0')
-    connection.expect('.*')
-    time.sleep(1)
-    if '12.5' in grab:
+    # Configure account name, privilege level and password. Version 12.5 asks two more questions.
+    dialog = ACCOUNT_DIALOG_12_5 if version.startswith('12.5') else ACCOUNT_DIALOG
+    with timer.phase('paws dialog'):
+        run_dialog(connection, 'PAWS account', dialog, account=pawsaccount, password=pawspassword)
         #
-        # Version 12.5 compatibility
+        # Disable change at login to allow service account to function
         #
-        connection.send('No')
-        connection.expect('.*')
-        time.sleep(1)
-        connection.send('ANMMS-Monitoring')
-        connection.expect('.*')
-        time.sleep(1)
-    #
-    # Set PAWS Password
-    #
-    connection.send(f'{pawspassword}')
-    connection.expect('.*')
-    time.sleep(1)
-    connection.send(f'{pawspassword}')
-    connection.expect('admin:')
-    #
-    # Disable change at login to allow service account to function
-    #
-    connection.send(f'set password change-at-login disable {pawsaccount}')
-    connection.expect('admin:')
+        connection.send(f'set password change-at-login disable {pawsaccount}')
+        connection.expect('admin:')
     #
     # Verify account is configured
     #
-    connection.send('show account')
-    connection.expect('admin:')
-    if f'{pawsaccount}' in connection.current_output_clean:
+    with timer.phase('verify paws'):
+        created = pawsaccount in uc_show(connection, 'show account')
+    if created:
         print('Successfully created PAWS API user account on CUC node.')
     else:
         print('Failed to set PAWS API user account on CUC node.')
 
-def imp_connect(ip, username, password):
-    #
-    # Create and return a connection to an IMP node
-    #
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(ip, username=username, password=password)
-    #
-    # Set display=False for production
-    #
-    connection = SSHClientInteraction(ssh, timeout=60, display=True)
-    return connection
-
-def imp_set_defaults(connection, loggingserver, snmpstring, pawsaccount, pawspassword):
+def imp_set_defaults(connection, loggingserver, snmpstring, pawsaccount, pawspassword, timer=NULL_TIMER):
     # Function to configure PAWS API user account on IMP node
-    # Configure account name and privilege level
-    connection.expect('admin:')
-    connection.send(f'set account name {pawsaccount}')
-    connection.expect('Please enter the privilege level :')
-    connection.send('0')
-    connection.expect('.*')
-    time.sleep(1)
-    # Set PAWS password
-    connection.send(f'{pawspassword}')
-    connection.expect('.*')
-    time.sleep(1)
-    connection.send(f'{pawspassword}')
-    connection.expect('admin:')
-    #
-    # Disable change at login to allow service account to function
-    #
-    connection.send(f'set password change-at-login disable {pawsaccount}')
-    connection.expect('admin:')
+    # Configure account name, privilege level and password
+    # The dialogs, their checks and the exit are phases of timer.
+    with timer.phase('paws dialog'):
+        run_dialog(connection, 'PAWS account', ACCOUNT_DIALOG, account=pawsaccount, password=pawspassword)
+        #
+        # Disable change at login to allow service account to function
+        #
+        connection.send(f'set password change-at-login disable {pawsaccount}')
+        connection.expect('admin:')
     #
     # Verify account has been configured
     #
-    connection.send('show account')
-    connection.expect('admin:')
-    if f'{pawsaccount}' in connection.current_output_clean:
+    with timer.phase('verify paws'):
+        created = pawsaccount in uc_show(connection, 'show account')
+    if created:
         print('Successfully created PAWS API user account on IMP node.')
     else:
         print('Failed to set PAWS API user account on IMP node.')
     #
     # Configure SNMP
     #
-    set_snmp(connection, snmpstring, loggingserver)
+    with timer.phase('snmp dialog'):
+        set_snmp(connection, snmpstring, loggingserver)
     #
     # Verify SNMP
     #
-    connection.send('utils snmp config 1/2c community-string list')
-    connection.expect('admin:')
-    if snmpstring in connection.current_output_clean:
+    with timer.phase('verify snmp'):
+        configured = snmpstring in uc_show(connection, 'utils snmp config 1/2c community-string list')
+    if configured:
         print('Successfully set community string on IMP node.')
     else:
         print('Failed to set community string on IMP node.')
-    connection.send('exit')
-
-def cer_connect(ip, username, password):
-    #
-    # Create and return a connection to a CER node
-    #
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(ip, username=username, password=password)
-    #
-    # Set display=False for production
-    #
-    connection = SSHClientInteraction(ssh, timeout=60, display=True)
-    return connection
+    with timer.phase('disconnect'):
+        connection.send('exit')
 
-def cer_set_defaults(connection, loggingserver, snmpstring):
+def cer_set_defaults(connection, loggingserver, snmpstring, timer=NULL_TIMER):
     # Configure default settings for CER node
+    # The SNMP dialog, its check and the exit are phases of timer.
     # Configure SNMP
-    set_snmp(connection, snmpstring, loggingserver)
+    with timer.phase('snmp dialog'):
+        set_snmp(connection, snmpstring, loggingserver)
     #
     # Verify SNMP
     #
-    connection.send('utils snmp config 1/2c community-string list')
-    connection.expect('admin:')
-    if snmpstring in connection.current_output_clean:
+    with timer.phase('verify snmp'):
+        configured = snmpstring in uc_show(connection, 'utils snmp config 1/2c community-string list')
+    if configured:
         print('Successfully set community string on IMP node.')
     else:
         print('Failed to set community string on IMP node.')
-    connection.send('exit')
+    with timer.phase('disconnect'):
+        connection.send('exit')
 
 # Configure the values ahead of time if possible. You will be prompted to fill them in if you do not.
+# They can also be given on the command line or in the [onboarding] section of a --config file.
 loggingserver = ''
 snmpstring = ''
 pawsaccount = ''
@@ -405,77 +484,240 @@ pawspassword = ''
 axlusername = ''
 acgname = ''
 
-if loggingserver == '':
-    while True:
-        loggingserver = input('Enter logging server: ')
-        break
-
-if snmpstring == '':
-    while True:
-        snmpstring = input('Enter snmp community string: ')
-        break
-
-if pawsaccount == '' and pawspassword == ':':
-    while True:
-        pawsaccount = input('Enter PAWS API username: ')
-        pawspassword = input('Enter PAWS API password: ')
-        break
-
-if axlusername == '':
-    while True:
-        axlusername = input('Enter CUCM AXL username: ')
-        break
-
-# Set script start time for runtime measurement
-start = time.time()
-
-# Read CSV in the working directory of the script named DeviceList.csv
-# **HEADERS REQUIRED**
-# ip,username,password,enablesecret,devicetype
-# Ensure no whitespace at end of CSV
-with open('DeviceList.csv', 'r') as device_list_csv:
-    csv_dict_reader = csv.DictReader(device_list_csv, delimiter=',')
-    for row in csv_dict_reader:
+
+def configure_device(row, settings, timer=NULL_TIMER, transcript=None, open_ports=None):
+    # Connect to the device in a DeviceList.csv row and apply the defaults for its devicetype.
+    # settings holds the resolved logging_server, snmp_string, paws_*, axl_username and acg_name values.
+    # The session output goes to transcript, if given. open_ports are the ports that answered the reachability sweep.
+    # Each step of the connection and of the configuration is timed as a phase of timer.
+    if row['devicetype'] == 'NETWORK':
+        #
+        # Begin settings defaults for a NETWORK device
+        #
+        print('Connecting to network device: ' + row['ip'])
+        connection = network_connect(row['ip'], row['username'], row['password'], row['enablesecret'],
+                                     transcript, open_ports, timer)
+        network_set_defaults(connection, settings.logging_server, settings.snmp_string, settings.axl_username, timer)
+    if row['devicetype'] == 'CUCM':
+        #
+        # Begin settings defaults for a CUCM device
+        #
+        print('Connecting to CUCM device: ' + row['ip'])
+        with timer.phase('connect'):
+            connection = uc_connect(row['ip'], row['username'], row['password'], transcript)
+        cucm_set_defaults(connection, settings.logging_server, settings.axl_username, settings.acg_name,
+                          settings.snmp_string, row['ip'], timer)
+    if row['devicetype'] == 'CUC':
         #
-        # Check if device is reachable
+        # Begin settings defaults for a CUC device
         #
-        ping_response = os.popen(f"ping {row['ip']}").read()
-        if f"Received = 4" in ping_response:
-            if row['devicetype'] == 'NETWORK':
-                #
-                # Begin settings defaults for a NETWORK device
-                #
-                print('Connecting to network device: ' + row['ip'])
-                connection = network_connect(row['ip'], row['username'], row['password'], row['enablesecret'])
-                network_set_defaults(connection, loggingserver, snmpstring)
-            if row['devicetype'] == 'CUCM':
-                #
-                # Begin settings defaults for a CUCM device
-                #
-                print('Connecting to CUCM device: ' + row['ip'])
-                connection = cucm_connect(row['ip'], row['username'], row['password'])
-                cucm_set_defaults(connection, loggingserver, axlusername, acgname, snmpstring, row['ip'])
-            if row['devicetype'] == 'CUC':
-                #
-                # Begin settings defaults for a CUC device
-                #
-                print('Connecting to CUC device: ' + row['ip'])
-                connection = cuc_connect(row['ip'], row['username'], row['password'])
-                cuc_set_defaults(connection, loggingserver, snmpstring, pawsaccount, pawspassword, row['ip'])
-            if row['devicetype'] == 'IMP':
-                #
-                # Begin settings defaults for a IMP device
-                #
-                print('Connecting to IMP device: ' + row['ip'])
-                connection = imp_connect(row['ip'], row['username'], row['password'])
-                imp_set_defaults(connection, loggingserver, snmpstring, pawsaccount, pawspassword)
-            if row['devicetype'] == 'CER':
-                #
-                # Begin settings defaults for a CER device
-                #
-                print('Connecting to CER device: ' + row['ip'])
-                connection = cer_connect(row['ip'], row['username'], row['password'])
-                cer_set_defaults(connection, loggingserver, snmpstring)
-
-# Print runtime
-print('Runtime - ' + str(time.time() - start))
+        print('Connecting to CUC device: ' + row['ip'])
+        with timer.phase('connect'):
+            connection = uc_connect(row['ip'], row['username'], row['password'], transcript)
+        cuc_set_defaults(connection, settings.logging_server, settings.snmp_string, settings.paws_account,
+                         settings.paws_password, row['ip'], timer)
+    if row['devicetype'] == 'IMP':
+        #
+        # Begin settings defaults for a IMP device
+        #
+        print('Connecting to IMP device: ' + row['ip'])
+        with timer.phase('connect'):
+            connection = uc_connect(row['ip'], row['username'], row['password'], transcript)
+        imp_set_defaults(connection, settings.logging_server, settings.snmp_string, settings.paws_account,
+                         settings.paws_password, timer)
+    if row['devicetype'] == 'CER':
+        #
+        # Begin settings defaults for a CER device
+        #
+        print('Connecting to CER device: ' + row['ip'])
+        with timer.phase('connect'):
+            connection = uc_connect(row['ip'], row['username'], row['password'], transcript)
+        cer_set_defaults(connection, settings.logging_server, settings.snmp_string, timer)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Configure the devices in DeviceList.csv with the required settings.')
+    parser.add_argument('--config', metavar='FILE',
+                        help='INI file with an [onboarding] section holding any of these options')
+    parser.add_argument('--logging-server', default=loggingserver)
+    parser.add_argument('--snmp-string', default=snmpstring)
+    parser.add_argument('--paws-account', default=pawsaccount)
+    parser.add_argument('--paws-password', default=pawspassword)
+    parser.add_argument('--axl-username', default=axlusername)
+    parser.add_argument('--acg-name', default=acgname)
+    parser.add_argument('--non-interactive', action='store_true',
+                        help='never prompt; fail if a required setting is missing')
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help='only configure shard i of N of DeviceList.csv, split by UC cluster (devicetype for UC rows '
+                             'without one) or IP')
+    parser.add_argument('--refresh-topology', action='store_true',
+                        help='read every UC cluster\'s topology again instead of using topology_cache.json')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'number of devices to configure at the same time (default {DEFAULT_WORKERS})')
+    parser.add_argument('--resume', nargs='?', const='latest', metavar='JOURNAL',
+                        help='resume an interrupted run from its journal (default: the newest ApplyDefaults_Journal_*.jsonl)')
+    parser.add_argument('--transcripts', metavar='FOLDER',
+                        help='folder for the per-node session transcripts (default ApplyDefaults_Transcripts_<run>)')
+    parser.add_argument('--quiet', action='store_true',
+                        help='only print one status line per node and the totals')
+    parser.add_argument('--max-logins', type=int, default=DEFAULT_MAX_LOGINS,
+                        help=f'most logins at the same time; lowered automatically while AAA errors are high '
+                             f'(default {DEFAULT_MAX_LOGINS})')
+    parser.add_argument('--logins-per-site', type=int, default=DEFAULT_PER_SITE,
+                        help=f'most logins at the same time per /24 (default {DEFAULT_PER_SITE})')
+    args = parse_args_with_config(parser, 'onboarding', argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.max_logins < 1 or args.logins_per_site < 1:
+        parser.error('--max-logins and --logins-per-site must be at least 1')
+    global login_scheduler
+    login_scheduler = LoginScheduler(args.max_logins, args.logins_per_site)
+    uc_transports.scheduler = login_scheduler
+
+    def setting(value, option, prompt):
+        # Return value, prompting for it when it is empty unless running with --non-interactive
+        while value == '':
+            if args.non_interactive:
+                parser.error(f'{option} is required with --non-interactive')
+            value = input(prompt)
+        return value
+
+    args.logging_server = setting(args.logging_server, '--logging-server', 'Enter logging server: ')
+    args.snmp_string = setting(args.snmp_string, '--snmp-string', 'Enter snmp community string: ')
+    args.paws_account = setting(args.paws_account, '--paws-account', 'Enter PAWS API username: ')
+    args.paws_password = setting(args.paws_password, '--paws-password', 'Enter PAWS API password: ')
+    args.axl_username = setting(args.axl_username, '--axl-username', 'Enter CUCM AXL username: ')
+    args.acg_name = setting(args.acg_name, '--acg-name', 'Enter CUCM access control group name: ')
+
+    if args.refresh_topology:
+        topology_cache.clear()
+
+    # Set script start time for runtime measurement
+    start = time.time()
+    run_stamp = time.strftime("%m_%d_%Y_%H%M%S") + shard_suffix(args.shard)
+
+    #
+    # Journal every device's result so an interrupted run can be resumed. Devices already done are skipped.
+    #
+    finished = {}
+    if args.resume:
+        if args.resume == 'latest':
+            journal_path = latest_journal('ApplyDefaults_Journal', shard_suffix(args.shard))
+        else:
+            journal_path = args.resume
+        if journal_path is None or not os.path.isfile(journal_path):
+            parser.error('no journal found to resume')
+        header, journal_devices = load_journal(journal_path)
+        if header.get('shard') != (list(args.shard) if args.shard else None):
+            parser.error(f'{journal_path} is from a different --shard')
+        finished = completed(journal_devices)
+        print(f'Resuming {journal_path}: {len(finished)} devices already done.')
+    else:
+        journal_path = f'ApplyDefaults_Journal_{run_stamp}.jsonl'
+    journal = RunJournal(journal_path, header={'shard': args.shard})
+    timings = TimingRecorder(f'ApplyDefaults_Timings_{run_stamp}.jsonl')
+    output_path = f'ApplyDefaults_Output_{run_stamp}.txt'
+    transcripts = TranscriptWriter(args.transcripts or f'ApplyDefaults_Transcripts_{run_stamp}')
+
+    # Read CSV in the working directory of the script named DeviceList.csv
+    # **HEADERS REQUIRED**
+    # ip,username,password,enablesecret,devicetype[,cluster,role]
+    # cluster names the UC cluster of a node and role 'publisher' marks its publisher
+    # Rows with a missing or invalid IP, a missing devicetype or one not in DEVICE_TYPES and duplicate IPs
+    # are skipped with a warning
+    # Shards split by shard_key() so that every node of a cluster, and every UC node without one of the same
+    # devicetype, is configured by the same run
+    #
+    rows = [row for row in iter_devices('DeviceList.csv', required=('ip', 'username', 'password', 'devicetype'),
+                                       on_skip=lambda line, row, reason: print(f'Skipping DeviceList.csv line {line}: {reason}'),
+                                       devicetypes=DEVICE_TYPES)
+            if row['ip'] not in finished and in_shard(shard_key(row), args.shard)]
+    #
+    # Check which devices are reachable in a single sweep before logging in to any of them
+    #
+    reachability = sweep([row['ip'] for row in rows], ports=tuple(set(NETWORK_PORTS.values()) | {UC_SSH_PORT}))
+    reachable = []
+    for row in rows:
+        if reachability[row['ip']].reachable:
+            reachable.append(row)
+        else:
+            print('No reply from ' + row['ip'] + '.')
+            journal.record(row['ip'], 'failed', [row['ip'], row['devicetype'], 'No reply'])
+
+    #
+    # Configure the reachable devices in parallel. Each node's prints are collected with its result,
+    # written to the output file and counted in the summary. Its session goes to its transcript file;
+    # when it fails the end of the session is added to its output.
+    #
+    timers = {}
+    for row in reachable:
+        timers[row['ip']] = timings.device(row['ip'])
+        timers[row['ip']].add('probe', reachability[row['ip']].rtt)
+        session_timeouts.observe_rtt(row['ip'], reachability[row['ip']].rtt)
+    results = []
+
+    def work(row):
+        transcript = transcripts.open(row['ip'], hidden=(row['password'], row['enablesecret'], args.paws_password))
+        try:
+            configure_device(row, args, timers[row['ip']], transcript, reachability[row['ip']].open_ports)
+        except Exception:
+            tail = transcript.tail()
+            if tail:
+                print(f'Last session output (full session in {transcript.path}):')
+                print(tail)
+            raise
+        finally:
+            transcript.close()
+
+    def record(result):
+        row = result.row
+        output_file.write(f"===== {row['ip']} {row['devicetype']} {result.status} =====\n{result.output}\n")
+        output_file.flush()
+        if result.error is not None:
+            journal.record(row['ip'], 'failed', [row['ip'], row['devicetype'], str(result.error)])
+        else:
+            journal.record(row['ip'], 'done', [row['ip'], row['devicetype']])
+        timings.finish(timers[row['ip']], result.status)
+        results.append(result)
+        print(f"PROGRESS: {len(results)}/{len(reachable)} {row['ip']} {row['devicetype']} {result.status} "
+              f"in {result.seconds:.1f}s")
+        if result.error is not None and not args.quiet:
+            print(result.output, end='')
+
+    try:
+        with open(output_path, 'w') as output_file:
+            run_scheduled(reachable, work, args.workers, record)
+    except KeyboardInterrupt:
+        transport_cache.save()
+        topology_cache.save()
+        session_timeouts.save()
+        print(f'Interrupted. Run again with --resume {journal_path} to finish the remaining devices.')
+        sys.exit(130)
+    finally:
+        journal.close()
+        timings.close()
+        uc_transports.close_all()
+        transcripts.close()
+
+    transport_cache.save()
+    topology_cache.save()
+    session_timeouts.save()
+
+    if args.quiet:
+        failed = sum(result.status == 'failed' for result in results)
+        print(f'{len(results) - failed} done, {failed} failed in {time.time() - start:.1f}s. '
+              f'Per-node output is in {output_path}, sessions in {transcripts.folder}')
+        return
+    # Print the per-node summary, runtime, the per-phase timing summary and how the logins went
+    for line in summary(results):
+        print(line)
+    print(f'Per-node output is in {output_path}, sessions in {transcripts.folder}')
+    print('Runtime - ' + str(time.time() - start))
+    for line in timings.summary():
+        print(line)
+    for line in login_scheduler.summary():
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
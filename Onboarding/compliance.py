@@ -0,0 +1,109 @@
+"""
+Configuration compliance rules for network devices
+A Requirement is one config line a device must have, either at the top level or under a parent
+line such as 'ip access-list standard NAME'. missing_requirements() checks them against any
+running-config text: the whole config from a backup, or just the sections that
+filter_commands() fetches from a live device with '| include' and '| section', which is all
+network_set_defaults() needs to compute and push only the missing lines.
+"""
+
+import re
+from collections import namedtuple
+
+# line: the config line, parent: the line it sits under or None for a top-level line
+Requirement = namedtuple('Requirement', ['line', 'parent'])
+Requirement.__new__.__defaults__ = (None,)
+
+
+def network_requirements(loggingserver, snmpstring, aclname):
+    # Default settings of a network device: voice traps, error logging to the logging server and
+    # SNMP read access for the logging server only, through the ACL named aclname
+    acl = f'ip access-list standard {aclname}'
+    return [
+        Requirement('snmp-server enable traps voice'),
+        Requirement('snmp-server enable traps isdn'),
+        Requirement('snmp-server enable traps dial'),
+        Requirement('snmp-server enable traps dsp'),
+        Requirement('logging trap errors'),
+        Requirement(acl),
+        Requirement(f'permit {loggingserver}', acl),
+        Requirement(f'snmp-server community {snmpstring} RO {aclname}'),
+        Requirement(f'snmp-server host {loggingserver} version 2c {snmpstring}'),
+        Requirement(f'logging host {loggingserver}'),
+    ]
+
+
+def _normalize(line):
+    # Compare lines without indentation, repeated spaces or the sequence numbers of ACL entries
+    return re.sub(r'^\d+\s+', '', ' '.join(line.split()))
+
+
+def parse_config(text, parents=None):
+    # Return (top-level lines, {parent: child lines}) of running-config text, all normalized.
+    # With parents, only the children of those parents are kept, which is what makes checking a
+    # whole config cheap: the thousands of interface sub-lines are never normalized.
+    top_level = set()
+    children = {}
+    parent = None
+    for line in text.splitlines():
+        if not line or line[0] == '!':
+            continue
+        if line[0].isspace():
+            if parent is not None and line.strip():
+                children[parent].add(_normalize(line))
+            continue
+        line = line.rstrip()
+        if '  ' in line or '\t' in line:
+            line = _normalize(line)
+        top_level.add(line)
+        parent = line if parents is None or line in parents else None
+        if parent is not None:
+            children.setdefault(parent, set())
+    return top_level, children
+
+
+def missing_requirements(requirements, text):
+    # Return the requirements that running-config text does not satisfy, in order
+    top_level, children = parse_config(text, {_normalize(requirement.parent) for requirement in requirements
+                                              if requirement.parent is not None})
+    missing = []
+    for requirement in requirements:
+        if requirement.parent is None:
+            present = _normalize(requirement.line) in top_level
+        else:
+            present = _normalize(requirement.line) in children.get(_normalize(requirement.parent), ())
+        if not present:
+            missing.append(requirement)
+    return missing
+
+
+def filter_commands(requirements):
+    # Return the show commands that fetch just enough of the running-config to check requirements:
+    # one '| include' for every top-level line and one '| section' per parent
+    parents = list(dict.fromkeys(requirement.parent for requirement in requirements if requirement.parent))
+    keywords = list(dict.fromkeys(requirement.line.split()[0] for requirement in requirements
+                                  if requirement.parent is None and requirement.line not in parents))
+    commands = []
+    if keywords:
+        commands.append('show running-config | include ' + '|'.join(f'^{keyword}' for keyword in keywords))
+    commands += [f'show running-config | section {parent}' for parent in parents]
+    return commands
+
+
+def delta_commands(missing):
+    # Return the config commands that add the missing requirements in order. Missing children are
+    # sent in one block under their parent, where the parent first appears, and the block is closed
+    # with 'exit' so the lines after it are top-level again.
+    children = {}
+    for requirement in missing:
+        if requirement.parent is not None:
+            children.setdefault(requirement.parent, []).append(requirement.line)
+    commands = []
+    for requirement in missing:
+        block = requirement.line if requirement.parent is None else requirement.parent
+        if block in children:
+            if block not in commands:
+                commands += [block] + children[block] + ['exit']
+        else:
+            commands.append(block)
+    return commands
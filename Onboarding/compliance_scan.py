@@ -0,0 +1,176 @@
+"""
+Offline compliance scan of saved running-config backups
+Checks the latest config backup of every hostname, from the DeviceConfigs folder written by
+Discovery.py or from its --backup-store, against the same rules network_set_defaults()
+applies (see compliance.py), without logging in to any device. Backups are parsed on a pool
+of worker processes, so thousands of configs take seconds.
+
+Writes Compliance_Report_{stamp}.csv with one row per hostname:
+    hostname,backup date,compliant|non-compliant,missing lines separated by ' | '
+With --device-list and --report, also writes DeviceList_NonCompliant_{stamp}.csv: the rows of
+the device list that still need ApplyDefaults. A NETWORK row is left out when the
+Discovery_Report maps its IP to a hostname whose latest backup is compliant. Every other row
+is kept.
+
+Usage: python compliance_scan.py --logging-server IP --snmp-string STRING --axl-username NAME
+                                 [--configs DeviceConfigs | --backup-store DeviceBackups] [--processes N]
+                                 [--device-list DeviceList.csv --report Discovery_Report.csv]
+"""
+
+import os, sys, csv, gzip, time, argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Common.backup_store import BackupStore, BACKUP_FILE_NAME
+from Common.settings import parse_args_with_config
+from compliance import network_requirements, missing_requirements
+
+# backups handed to a worker process at a time
+CHUNK_SIZE = 64
+
+# rules of the current worker process, set once by _init_worker
+_requirements = None
+
+
+def latest_folder_backups(folder):
+    # Return {hostname: (YYYY-MM-DD, path)} of the newest config backup per hostname in folder
+    latest = {}
+    for file_name in os.listdir(folder):
+        match = BACKUP_FILE_NAME.match(file_name)
+        if match is None or match['kind'] != 'config':
+            continue
+        date = datetime.strptime(match['date'], '%m_%d_%Y').strftime('%Y-%m-%d')
+        path = os.path.join(folder, file_name)
+        # two backups on one day: the file written last wins
+        key = (date, os.path.getmtime(path))
+        if match['hostname'] not in latest or key > latest[match['hostname']][0]:
+            latest[match['hostname']] = (key, path)
+    return {hostname: (key[0], path) for hostname, (key, path) in latest.items()}
+
+
+def latest_store_backups(root):
+    # Return {hostname: (YYYY-MM-DD, blob path)} of the newest config backup per hostname in the backup store
+    store = BackupStore(root)
+    try:
+        # list() is oldest first, so the last backup of a hostname wins
+        return {hostname: (date, store.blob_path(digest))
+                for _, hostname, date, _, digest, _ in store.list(kind='config')}
+    finally:
+        store.close()
+
+
+def _init_worker(requirements):
+    global _requirements
+    _requirements = requirements
+
+
+def scan_backup(task):
+    # Return (hostname, date, missing lines) for a (hostname, date, path) task. Runs in a worker process.
+    hostname, date, path = task
+    opener = gzip.open if path.endswith('.gz') else open
+    try:
+        with opener(path, 'rt', errors='replace') as backup:
+            text = backup.read()
+    except OSError as e:
+        return hostname, date, [f'unreadable backup: {e}']
+    return hostname, date, [requirement.line for requirement in missing_requirements(_requirements, text)]
+
+
+def scan(backups, requirements, processes=None):
+    # Yield (hostname, date, missing lines) for {hostname: (date, path)} backups, in hostname order
+    tasks = [(hostname, date, path) for hostname, (date, path) in sorted(backups.items())]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(requirements,)) as executor:
+        yield from executor.map(scan_backup, tasks, chunksize=CHUNK_SIZE)
+
+
+def report_hostnames(report_path):
+    # Return {ip: hostname} from a Discovery_Report CSV (hostname,ip,...), skipping rows without a hostname
+    hostnames = {}
+    with open(report_path, newline='') as report:
+        for row in csv.reader(report):
+            if len(row) >= 2 and row[0] not in ('', '-'):
+                hostnames[row[1].strip()] = row[0]
+    return hostnames
+
+
+def write_non_compliant(device_list, output_path, hostnames, compliant):
+    # Copy the rows of device_list that still need ApplyDefaults to output_path. Returns (kept, dropped).
+    kept = dropped = 0
+    with open(device_list, newline='') as source, open(output_path, mode='w', newline='') as target:
+        reader = csv.reader(source)
+        writer = csv.writer(target, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        header = next(reader, None)
+        if header is None:
+            return kept, dropped
+        writer.writerow(header)
+        names = [name.strip().lower() for name in header]
+        ip_column = names.index('ip') if 'ip' in names else 0
+        type_column = names.index('devicetype') if 'devicetype' in names else 4
+        for row in reader:
+            if len(row) > max(ip_column, type_column) and row[type_column].strip() == 'NETWORK' \
+                    and hostnames.get(row[ip_column].strip()) in compliant:
+                dropped += 1
+                continue
+            writer.writerow(row)
+            kept += 1
+    return kept, dropped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check saved config backups against the ApplyDefaults settings.')
+    parser.add_argument('--config', metavar='FILE',
+                        help='INI file with an [onboarding] section (the same file ApplyDefaults.py takes)')
+    parser.add_argument('--logging-server', default='')
+    parser.add_argument('--snmp-string', default='')
+    parser.add_argument('--axl-username', default='')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--configs', default='DeviceConfigs',
+                        help='folder of {hostname}_config_{date}_{initials}.txt backups (default DeviceConfigs)')
+    source.add_argument('--backup-store', nargs='?', const='DeviceBackups', metavar='ROOT',
+                        help='read backups from the backup store instead (default root DeviceBackups)')
+    # not --workers, which is the thread count of ApplyDefaults in the same [onboarding] section
+    parser.add_argument('--processes', type=int, help='worker processes (default one per CPU)')
+    parser.add_argument('--device-list', metavar='CSV', help='DeviceList.csv to reduce to the devices that need onboarding')
+    parser.add_argument('--report', metavar='CSV', help='Discovery_Report CSV mapping the IPs of --device-list to hostnames')
+    # ApplyDefaults settings this scan has no use for may sit in the same [onboarding] section
+    args = parse_args_with_config(parser, 'onboarding', argv, ignore_unknown=True)
+    for option in ('logging_server', 'snmp_string', 'axl_username'):
+        if not getattr(args, option):
+            parser.error(f"--{option.replace('_', '-')} is required")
+    if bool(args.device_list) != bool(args.report):
+        parser.error('--device-list and --report go together')
+    if args.processes is not None and args.processes < 1:
+        parser.error('--processes must be at least 1')
+
+    start = time.time()
+    run_stamp = time.strftime("%m_%d_%Y_%H%M%S")
+    if args.backup_store:
+        backups = latest_store_backups(args.backup_store)
+    else:
+        if not os.path.isdir(args.configs):
+            parser.error(f'no folder {args.configs}')
+        backups = latest_folder_backups(args.configs)
+    requirements = network_requirements(args.logging_server, args.snmp_string, args.axl_username)
+
+    compliant = set()
+    report_path = f'Compliance_Report_{run_stamp}.csv'
+    with open(report_path, mode='w', newline='') as report:
+        writer = csv.writer(report, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        for hostname, date, missing in scan(backups, requirements, args.processes):
+            if missing:
+                writer.writerow([hostname, date, 'non-compliant', ' | '.join(missing)])
+            else:
+                compliant.add(hostname)
+                writer.writerow([hostname, date, 'compliant', ''])
+    print(f'Scanned {len(backups)} backups in {time.time() - start:.1f}s: {len(compliant)} compliant, '
+          f'{len(backups) - len(compliant)} non-compliant. Report is in {report_path}')
+
+    if args.device_list:
+        output_path = f'DeviceList_NonCompliant_{run_stamp}.csv'
+        kept, dropped = write_non_compliant(args.device_list, output_path, report_hostnames(args.report), compliant)
+        print(f'{kept} devices still need onboarding ({dropped} compliant devices left out): {output_path}')
+
+
+if __name__ == '__main__':
+    main()
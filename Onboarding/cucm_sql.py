@@ -0,0 +1,76 @@
+"""
+'run sql' over the UC 'admin:' CLI
+run_sql() sends one statement, waits for the prompt and parses only that statement's output:
+selects come back as a list of dicts keyed by the lower-case column names, inserts, updates
+and deletes as the number of rows changed. A select's output is a header line, a ruler of '='
+runs marking each column's width, and one line per row:
+
+    pkid                                 name
+    ==================================== =======================
+    4b1e8c2a-...                         Standard AXL API Access
+"""
+
+import re, socket
+
+# seconds to wait for a statement unless told otherwise
+DEFAULT_SQL_TIMEOUT = 60
+
+_RULER = re.compile(r'^=+(?: +=+)*\s*$')
+_ROWS = re.compile(r'^Rows:\s*(\d+)\s*$', re.MULTILINE)
+_FAILED = re.compile(r'Executed command unsuccessfully|^\s*SQL (?:command|error)|^\s*Invalid', re.MULTILINE)
+
+
+class SqlError(Exception):
+    pass
+
+
+def sql_literal(value):
+    # Quote value as an SQL string literal
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def sql_list(values):
+    # Quote values as the parenthesised list of an IN (...) condition
+    return '(' + ', '.join(sql_literal(value) for value in values) + ')'
+
+
+def parse_sql_output(text):
+    # Return the rows of a select's output as dicts, or [] when there is no result table
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    for index in range(1, len(lines)):
+        if _RULER.match(lines[index]):
+            break
+    else:
+        return []
+    header, ruler = lines[index - 1], lines[index].rstrip()
+    spans = [match.span() for match in re.finditer(r'=+', ruler)]
+    # the last column runs to the end of the line
+    spans[-1] = (spans[-1][0], None)
+    names = [header[start:end].strip().lower() for start, end in spans]
+    rows = []
+    for line in lines[index + 1:]:
+        if not line.strip() or line.rstrip().endswith('admin:'):
+            break
+        rows.append({name: line[start:end].strip() for name, (start, end) in zip(names, spans)})
+    return rows
+
+
+def run_sql(connection, statement, prompt='admin:', timeout=DEFAULT_SQL_TIMEOUT):
+    # Run statement over a paramiko_expect SSHClientInteraction sitting at the prompt.
+    # Returns the rows of a select as a list of dicts, or the number of rows changed by any other statement.
+    # Raises SqlError when the node rejects the statement or the prompt does not come back in time.
+    connection.send(f'run sql {statement}')
+    try:
+        index = connection.expect(prompt, timeout=timeout)
+    except socket.timeout:
+        index = -1
+    if index == -1:
+        raise SqlError(f'no prompt within {timeout}s after: run sql {statement}')
+    # current_output holds only what was read since this statement was sent
+    output = connection.current_output_clean
+    if _FAILED.search(output):
+        raise SqlError(f'{statement}: {output.strip()}')
+    if re.match(r'\s*select\b', statement, re.IGNORECASE):
+        return parse_sql_output(output)
+    match = _ROWS.search(output)
+    return int(match.group(1)) if match else 0
@@ -0,0 +1,39 @@
+"""
+Prompt-driven dialogs for the UC 'admin:' CLI
+A dialog is a list of Steps. Each step sends one line and waits for the prompt that the node
+shows when it is ready for the next one, so a dialog moves on as soon as the node answers
+instead of sleeping a fixed time between lines. Step text may hold {name} fields that are
+filled in from the values passed to run_dialog().
+
+Prompt patterns follow paramiko_expect: they must match the end of the output, after the last
+newline (e.g. r'\s*Please enter the privilege level :\s*').
+"""
+
+import socket
+from collections import namedtuple
+
+# seconds to wait for the prompt of a step unless the step says otherwise
+DEFAULT_STEP_TIMEOUT = 30
+
+# send: line to send (a str.format template), expect: prompt pattern that ends the step,
+# timeout: seconds to wait for it
+Step = namedtuple('Step', ['send', 'expect', 'timeout'])
+Step.__new__.__defaults__ = (DEFAULT_STEP_TIMEOUT,)
+
+
+class DialogError(Exception):
+    pass
+
+
+def run_dialog(connection, name, steps, **values):
+    # Run steps over a paramiko_expect SSHClientInteraction. Raises DialogError naming the step whose
+    # prompt did not show up in time. Sent values are never included in the error.
+    for number, step in enumerate(steps, 1):
+        connection.send(step.send.format(**values))
+        try:
+            index = connection.expect(step.expect, timeout=step.timeout)
+        except socket.timeout:
+            index = -1
+        if index == -1:
+            raise DialogError(f'{name}: no prompt matching {step.expect!r} within {step.timeout}s '
+                              f'after step {number} of {len(steps)}')
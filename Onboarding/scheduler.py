@@ -0,0 +1,146 @@
+"""
+Cluster-aware scheduler for ApplyDefaults
+Rows are grouped into lanes. The nodes of one UC cluster share a lane and are configured one at
+a time, publisher first, so there is never more than one session on a cluster's database and
+subscribers wait for their publisher. Every other row is a lane of its own. Lanes run in
+parallel on a pool of worker threads, which is the global cap on concurrent sessions.
+
+The cluster of a UC row comes from the optional 'cluster' column of DeviceList.csv and the
+optional 'role' column marks the publisher. UC rows without a cluster share one lane per
+devicetype, which keeps the one-session-per-cluster rule for lists that predate the columns.
+shard_key() keeps every lane within one --shard, so the rule also holds across hosts.
+
+Whatever a worker prints is captured per node and handed back with its result instead of
+being interleaved on the console.
+"""
+
+import io, sys, time, heapq, threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+UC_DEVICE_TYPES = ('CUCM', 'CUC', 'IMP', 'CER')
+
+# status is 'done' or 'failed', output everything the node printed, error the exception if it failed
+NodeResult = namedtuple('NodeResult', ['row', 'status', 'seconds', 'output', 'error'])
+
+
+def lane_key(row):
+    # Rows with the same key run one after another
+    if row['devicetype'] not in UC_DEVICE_TYPES:
+        return ('device', row['ip'])
+    return ('cluster', row['devicetype'], row.get('cluster', '').strip().lower())
+
+
+def shard_key(row):
+    # The key --shard splits rows by. The rows of a lane share it, so a cluster (or every UC row of a
+    # devicetype without a cluster) is configured by a single shard.
+    if row['devicetype'] not in UC_DEVICE_TYPES:
+        return row['ip']
+    return row.get('cluster', '').strip().lower() or row['devicetype']
+
+
+def build_lanes(rows):
+    # Return the lanes of rows, each ordered publisher first and then in list order
+    lanes = {}
+    for row in rows:
+        lanes.setdefault(lane_key(row), []).append(row)
+    ordered = []
+    for lane in lanes.values():
+        lane.sort(key=lambda row: row.get('role', '').strip().lower() != 'publisher')
+        ordered.append(deque(lane))
+    return ordered
+
+
+class _ThreadOutput:
+    # sys.stdout stand-in that sends the writes of capturing threads to their own buffer
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def capture(self, buffer):
+        self._local.buffer = buffer
+
+    def release(self):
+        self._local.buffer = None
+
+    def write(self, text):
+        buffer = getattr(self._local, 'buffer', None)
+        return (self._stream if buffer is None else buffer).write(text)
+
+    def flush(self):
+        if getattr(self._local, 'buffer', None) is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def run_scheduled(rows, work, workers, on_result):
+    # Call work(row) for every row on up to workers threads, one lane at a time per lane.
+    # on_result(NodeResult) is called on the calling thread as each row finishes.
+    # A failed row does not stop the rest of its lane.
+    # Only workers rows are handed to the pool at a time and a free worker always takes the lane with
+    # the most rows left, so a big cluster does not end up finishing last on its own.
+    idle = [(-len(lane), order, lane) for order, lane in enumerate(build_lanes(rows))]
+    heapq.heapify(idle)
+    console = sys.stdout
+    output = _ThreadOutput(console)
+
+    def run(row):
+        buffer = io.StringIO()
+        output.capture(buffer)
+        start = time.perf_counter()
+        try:
+            work(row)
+        except Exception as e:
+            return NodeResult(row, 'failed', time.perf_counter() - start, buffer.getvalue(), e)
+        finally:
+            output.release()
+        return NodeResult(row, 'done', time.perf_counter() - start, buffer.getvalue(), None)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='onboard')
+    futures = {}
+    sys.stdout = output
+    try:
+        while idle or futures:
+            while idle and len(futures) < workers:
+                _, order, lane = heapq.heappop(idle)
+                futures[executor.submit(run, lane.popleft())] = (order, lane)
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                order, lane = futures.pop(future)
+                if lane:
+                    heapq.heappush(idle, (-len(lane), order, lane))
+                # the calling thread never captures, so what on_result prints reaches the console
+                on_result(future.result())
+    except KeyboardInterrupt:
+        # drop queued rows; nodes already being configured are left to finish
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        sys.stdout = console
+    executor.shutdown()
+
+
+def summary(results):
+    # Return the run summary of NodeResults as a list of text lines. The 'Successfully ...' and
+    # 'Failed ...' lines each node printed are counted as its checks; failed checks are listed.
+    lines = [f'{"ip":<16}{"devicetype":<11}{"cluster":<16}{"status":<8}{"seconds":>8}{"checks ok":>11}{"failed":>8}']
+    problems = []
+    for result in results:
+        row = result.row
+        passed = failed = 0
+        for line in result.output.splitlines():
+            if line.startswith('Successfully'):
+                passed += 1
+            elif line.startswith('Failed'):
+                failed += 1
+                problems.append(f'  {row["ip"]}: {line.strip()}')
+        if result.error is not None:
+            problems.append(f'  {row["ip"]}: {type(result.error).__name__}: {result.error}')
+        lines.append(f'{row["ip"]:<16}{row["devicetype"]:<11}{row.get("cluster", "")[:15]:<16}{result.status:<8}'
+                     f'{result.seconds:>8.1f}{passed:>11}{failed:>8}')
+    if problems:
+        lines.append('Problems:')
+        lines += problems
+    return lines
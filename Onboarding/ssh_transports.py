@@ -0,0 +1,111 @@
+"""
+Shared SSH transports for UC nodes
+The first session on a node opens an SSH transport for (host, user), authenticates it once and
+keeps it alive with keepalives. Every later session on that node opens a channel on the same
+transport instead of doing the handshake and authentication again: interactive shells
+(SSHClientInteraction), and exec channels beside an open shell for single show commands whose
+output should not land in the shell's buffer. close_all() ends every transport at the end of a run.
+Logins go through the pool's LoginScheduler, if it has one (see Common/login_scheduler.py), and
+wait as long as its TimeoutCache allows for the node, if it has one (see Common/timeouts.py).
+"""
+
+import threading
+import paramiko
+from paramiko_expect import SSHClientInteraction
+from Common.timeouts import LOGIN
+
+# seconds between keepalives on an idle transport
+DEFAULT_KEEPALIVE = 30
+
+# seconds a session waits for output unless told otherwise
+DEFAULT_TIMEOUT = 60
+
+
+class TransportPool:
+    # Thread-safe pool of connected paramiko SSHClients keyed by (host, username)
+    def __init__(self, keepalive=DEFAULT_KEEPALIVE, scheduler=None, timeouts=None):
+        self.keepalive = keepalive
+        self.scheduler = scheduler
+        self.timeouts = timeouts
+        self._clients = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        # One lock per node, so two sessions on a new node do not both log in to it
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def client(self, host, username, password, port=22, fresh=False):
+        # Return the SSHClient of (host, username), logging in only when it has no live transport
+        key = (host, username)
+        with self._key_lock(key):
+            client = self._clients.get(key)
+            if client is not None and not fresh:
+                transport = client.get_transport()
+                if transport is not None and transport.is_active():
+                    return client
+            if client is not None:
+                client.close()
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            options = {'port': port, 'username': username, 'password': password}
+            if self.timeouts is not None:
+                options['timeout'] = self.timeouts.connect_timeout(host)
+                options['banner_timeout'] = options['auth_timeout'] = self.timeouts.command_timeout(host, LOGIN)
+            if self.scheduler is None:
+                client.connect(host, **options)
+            else:
+                self.scheduler.login(host, lambda: client.connect(host, **options))
+            client.get_transport().set_keepalive(self.keepalive)
+            self._clients[key] = client
+            return client
+
+    def _open(self, open_channel, host, username, password, port):
+        # Call open_channel(client) on the node's transport. A transport that died since it was last
+        # used (a reboot, a firewall dropping idle sessions) is replaced and tried once more.
+        try:
+            return open_channel(self.client(host, username, password, port))
+        except (paramiko.SSHException, EOFError, OSError):
+            return open_channel(self.client(host, username, password, port, fresh=True))
+
+    def shell(self, host, username, password, port=22, output_callback=None, timeout=DEFAULT_TIMEOUT):
+        # Return an SSHClientInteraction on a new shell channel. Its output goes to output_callback, or nowhere.
+        # Closing it closes only its channel.
+        def open_shell(client):
+            if output_callback is None:
+                return SSHClientInteraction(client, timeout=timeout, display=False)
+            return SSHClientInteraction(client, timeout=timeout, display=True, output_callback=output_callback)
+        return self._open(open_shell, host, username, password, port)
+
+    def close(self, host, username):
+        # End the transport of (host, username) and every channel on it
+        with self._key_lock((host, username)):
+            client = self._clients.pop((host, username), None)
+            if client is not None:
+                client.close()
+
+    def close_all(self):
+        # End every transport
+        with self._lock:
+            keys = list(self._clients)
+        for host, username in keys:
+            self.close(host, username)
+
+
+def exec_command(shell, command, timeout=DEFAULT_TIMEOUT):
+    # Run command on a new exec channel on the transport of shell, a session from TransportPool.shell(), and return
+    # (exit status, output). Raises socket.timeout when the node stays silent for timeout seconds.
+    channel = shell.channel.get_transport().open_session(timeout=timeout)
+    try:
+        channel.settimeout(timeout)
+        channel.exec_command(command)
+        chunks = []
+        while True:
+            data = channel.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+        return channel.recv_exit_status(), b''.join(chunks).decode(errors='replace')
+    finally:
+        channel.close()
@@ -0,0 +1,85 @@
+"""
+UC cluster topology cache for ApplyDefaults
+The first node contacted in a cluster runs 'show network cluster' (and 'show status' where the
+version matters). The members, their roles, the publisher and the product version are kept
+here, so the other nodes of the cluster skip those round trips. Entries are keyed by the
+publisher's IP, looked up by any member's IP and kept in topology_cache.json (see
+Common/json_cache.py).
+"""
+
+import re, copy, time, ipaddress
+from Common.json_cache import JsonCache
+
+DEFAULT_PATH = 'topology_cache.json'
+DEFAULT_TTL = 24 * 60 * 60
+
+_PRODUCT_VERSION = re.compile(r'^\s*Product Ver\s*:\s*(\S+)', re.MULTILINE)
+
+
+def parse_network_cluster(output):
+    # Return {ip: {'hostname', 'role'}} for the member lines of 'show network cluster' output, e.g.
+    # 10.1.1.10 cucm-pub.example.com cucm-pub Publisher callmanager DBPub authenticated
+    members = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) < 4 or not ({'Publisher', 'Subscriber'} & set(fields)):
+            continue
+        try:
+            ip = str(ipaddress.ip_address(fields[0]))
+        except ValueError:
+            continue
+        members[ip] = {'hostname': fields[2], 'role': 'Publisher' if 'Publisher' in fields else 'Subscriber'}
+    return members
+
+
+def parse_product_version(output):
+    # Return the version on the 'Product Ver' line of 'show status' output, or None
+    match = _PRODUCT_VERSION.search(output)
+    return match.group(1) if match else None
+
+
+class TopologyCache(JsonCache):
+    # Thread-safe cache of publisher ip -> {'members', 'publisher', 'version', 'updated'}
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL):
+        super().__init__(path, ttl)
+
+    def _find(self, ip):
+        for key, entry in self._load().items():
+            if ip in entry['members']:
+                return key, entry
+        return None, None
+
+    def get(self, ip):
+        # Return the cluster entry that ip is a member of, or None if there is none or it has expired
+        with self._lock:
+            _, entry = self._find(ip)
+            if entry is None or self._expired(entry):
+                return None
+            return copy.deepcopy(entry)
+
+    def record(self, members, version=None):
+        # Remember a cluster from parse_network_cluster() output and optionally its version. Returns the entry.
+        publisher = next((ip for ip, member in members.items() if member['role'] == 'Publisher'), min(members))
+        with self._lock:
+            entries = self._load()
+            # a member may have moved; drop any other cluster it was cached under
+            for key in [key for key, entry in entries.items() if set(entry['members']) & set(members)]:
+                del entries[key]
+            entry = {'members': members, 'publisher': publisher, 'version': version, 'updated': time.time()}
+            entries[publisher] = entry
+            self._dirty = True
+            return copy.deepcopy(entry)
+
+    def set_version(self, ip, version):
+        # Record the product version of the cluster that ip is a member of
+        with self._lock:
+            _, entry = self._find(ip)
+            if entry is not None and version:
+                entry['version'] = version
+                self._dirty = True
+
+    def clear(self):
+        # Drop every cluster so all topologies are read again
+        with self._lock:
+            self._entries = {}
+            self._dirty = True
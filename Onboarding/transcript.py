@@ -0,0 +1,114 @@
+"""
+File-backed session transcripts for ApplyDefaults
+Each node's session output goes to its own {folder}/{ip}.log. paramiko_expect sessions send it
+through output_callback and netmiko through its session log. Sessions only queue their output;
+one background thread does all the file writes, so a session never waits on the disk or the
+console. A transcript keeps just its last tail_chars characters in memory, which is the
+context reported when a node fails.
+"""
+
+import io, os, queue, threading
+from collections import deque
+
+# characters of recent session output kept in memory per node
+DEFAULT_TAIL_CHARS = 4000
+
+# chunks waiting for the writer before sessions have to wait for it
+QUEUE_SIZE = 10000
+
+_CLOSE = object()
+
+
+class TranscriptWriter:
+    # Owns the background thread writing every transcript of a run to files in folder
+    def __init__(self, folder, tail_chars=DEFAULT_TAIL_CHARS):
+        self.folder = folder
+        self.tail_chars = tail_chars
+        os.makedirs(folder, exist_ok=True)
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='transcripts', daemon=True)
+        self._thread.start()
+
+    def open(self, name, hidden=()):
+        # Return the Transcript of node name (e.g. its IP). Non-empty hidden values are masked.
+        return Transcript(self, os.path.join(self.folder, f'{name}.log'), self.tail_chars, hidden)
+
+    def _put(self, path, text):
+        # after close (e.g. nodes still finishing after Ctrl-C) there is nobody left to write
+        if not self._closed:
+            self._queue.put((path, text))
+
+    def _run(self):
+        files = {}
+        while True:
+            items = [self._queue.get()]
+            # write everything already queued before flushing
+            while len(items) < 1000:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            touched = set()
+            for item in items:
+                if item is _CLOSE:
+                    for transcript_file in files.values():
+                        transcript_file.close()
+                    return
+                path, text = item
+                if path not in files:
+                    files[path] = open(path, 'a', encoding='utf-8', errors='replace')
+                if text is None:
+                    files.pop(path).close()
+                    touched.discard(path)
+                else:
+                    files[path].write(text)
+                    touched.add(path)
+            for path in touched:
+                files[path].flush()
+
+    def close(self):
+        # Write out everything queued and stop the writer thread
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+
+class Transcript(io.TextIOBase):
+    # One node's session output: written to its file by the TranscriptWriter, last tail_chars kept in memory.
+    # A text stream, so netmiko's SessionLog can write to it as well as paramiko_expect's output_callback.
+    def __init__(self, writer, path, tail_chars, hidden=()):
+        self.path = path
+        self._writer = writer
+        self._tail_chars = tail_chars
+        self._tail = deque()
+        self._tail_length = 0
+        self._hidden = [value for value in hidden if value]
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        for value in self._hidden:
+            text = text.replace(value, '********')
+        with self._lock:
+            if self.closed:
+                return len(text)
+            self._tail.append(text)
+            self._tail_length += len(text)
+            while self._tail_length - len(self._tail[0]) >= self._tail_chars:
+                self._tail_length -= len(self._tail.popleft())
+            self._writer._put(self.path, text)
+        return len(text)
+
+    def writable(self):
+        return True
+
+    def tail(self):
+        # Return the last tail_chars characters of the session
+        with self._lock:
+            return ''.join(self._tail)[-self._tail_chars:]
+
+    def close(self):
+        with self._lock:
+            if not self.closed:
+                self._writer._put(self.path, None)
+        super().close()
@@ -0,0 +1,128 @@
+"""
+Tests for Common/login_scheduler.py and the transport fallback of Discovery.connect(). Run from the
+repository root with python -m unittest discover -s tests.
+The exception classes stand in for netmiko's, which classify() matches by name.
+"""
+
+import os, sys, socket, tempfile, unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Discovery'))
+from Common.login_scheduler import LoginScheduler, LoginError, classify, AUTH, TIMEOUT, REFUSED, PROTOCOL
+from Common.transport_cache import TransportCache
+from Common.targets import Credential
+import Discovery
+
+
+class NetmikoTimeoutException(Exception):
+    pass
+
+
+class NetmikoAuthenticationException(Exception):
+    pass
+
+
+def raised_from(outer, inner):
+    # Return outer as raised while handling inner
+    try:
+        try:
+            raise inner
+        except Exception:
+            raise outer
+    except Exception as e:
+        return e
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_timeout_wrapping_refused_port_is_refused(self):
+        error = raised_from(NetmikoTimeoutException('TCP connection to device failed.'), ConnectionRefusedError())
+        self.assertEqual(classify(error), REFUSED)
+
+    def test_timeout_wrapping_nothing_telling_is_timeout(self):
+        self.assertEqual(classify(raised_from(NetmikoTimeoutException(), ValueError())), TIMEOUT)
+        self.assertEqual(classify(NetmikoTimeoutException()), TIMEOUT)
+
+    def test_auth_raised_while_handling_eof_is_auth(self):
+        error = raised_from(NetmikoAuthenticationException('Authentication failed.'), EOFError())
+        self.assertEqual(classify(error), AUTH)
+
+    def test_unwrapped_eof_is_protocol(self):
+        self.assertEqual(classify(EOFError()), PROTOCOL)
+
+
+class LoginRetryTest(unittest.TestCase):
+    def scheduler(self):
+        return LoginScheduler(retries=2, backoff=0, breaker_failures=10)
+
+    def test_auth_failure_is_not_retried(self):
+        calls = []
+
+        def connect():
+            calls.append(1)
+            raise NetmikoAuthenticationException('Authentication failed.')
+        scheduler = self.scheduler()
+        with self.assertRaises(LoginError) as raised:
+            scheduler.login('192.0.2.1', connect)
+        self.assertEqual(raised.exception.cause, AUTH)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(list(scheduler._recent), [True])
+
+    def test_timeout_is_retried(self):
+        calls = []
+
+        def connect():
+            calls.append(1)
+            raise NetmikoTimeoutException()
+        with self.assertRaises(LoginError) as raised:
+            self.scheduler().login('192.0.2.1', connect)
+        self.assertEqual(raised.exception.cause, TIMEOUT)
+        self.assertEqual(len(calls), 3)
+
+    def test_open_circuit_of_one_transport_leaves_the_other(self):
+        def connect():
+            raise NetmikoTimeoutException()
+        scheduler = LoginScheduler(retries=2, backoff=0, breaker_failures=3)
+        with self.assertRaises(LoginError):
+            scheduler.login('192.0.2.1', connect, transport='cisco_ios')
+        self.assertTrue(scheduler.circuit_open('192.0.2.1', 'cisco_ios'))
+        self.assertFalse(scheduler.circuit_open('192.0.2.1', 'cisco_ios_telnet'))
+        self.assertEqual(scheduler.login('192.0.2.1', lambda: 'session', transport='cisco_ios_telnet'), 'session')
+
+
+class TransportFallbackTest(unittest.TestCase):
+    # A telnet-only switch whose SSH port is filtered: SSH connects time out, telnet logs in
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.saved = Discovery.ConnectHandler, Discovery.login_scheduler, Discovery.transport_cache
+        Discovery.login_scheduler = LoginScheduler(retries=2, backoff=0, breaker_failures=3)
+        Discovery.transport_cache = TransportCache(os.path.join(self.folder.name, 'transport_cache.json'))
+        self.calls = []
+
+        def connect_handler(**cisco):
+            self.calls.append(cisco['device_type'])
+            if cisco['device_type'] == 'cisco_ios':
+                try:
+                    raise socket.timeout('timed out')
+                except socket.timeout as e:
+                    raise NetmikoTimeoutException('TCP connection to device failed.') from e
+            return 'telnet session'
+        Discovery.ConnectHandler = connect_handler
+
+    def tearDown(self):
+        Discovery.ConnectHandler, Discovery.login_scheduler, Discovery.transport_cache = self.saved
+        self.folder.cleanup()
+
+    def test_filtered_ssh_falls_back_to_telnet(self):
+        credentials = [Credential('DeviceList.csv', 'admin', 'secret')]
+        self.assertEqual(Discovery.connect('192.0.2.1', credentials), 'telnet session')
+        self.assertEqual(self.calls, ['cisco_ios'] * 3 + ['cisco_ios_telnet'])
+
+    def test_ssh_port_silent_in_sweep_is_not_retried(self):
+        credentials = [Credential('DeviceList.csv', 'admin', 'secret')]
+        self.assertEqual(Discovery.connect('192.0.2.1', credentials, open_ports=(23,)), 'telnet session')
+        self.assertEqual(self.calls, ['cisco_ios', 'cisco_ios_telnet'])
+
+
+if __name__ == '__main__':
+    unittest.main()